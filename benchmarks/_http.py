@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Tuple, Union
+
+# Minimal HTTP/1.1 server with keep-alive, enough for the benchmark stand-ins. The pooled
+# httpx clients reuse connections, so closing after every response would skew the numbers.
+
+# A bytes body is sent with Content-Length; an async iterator is sent chunked, as it is produced
+Response = Tuple[int, Dict[str, str], Union[bytes, AsyncIterator[bytes]]]
+Handler = Callable[[str, str, Dict[str, str], bytes], Awaitable[Response]]
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    request_line = await reader.readline()
+    if not request_line:
+        raise ConnectionResetError
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0") or 0)
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+def _connection_handler(handler: Handler) -> Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]:
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                method, path, headers, body = await _read_request(reader)
+                status, response_headers, payload = await handler(method, path, headers, body)
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, 'Status')}"]
+                head.append(f"Content-Length: {len(payload)}" if isinstance(payload, bytes) else "Transfer-Encoding: chunked")
+                head += [f"{k}: {v}" for k, v in response_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if isinstance(payload, bytes):
+                    writer.write(payload)
+                else:
+                    async for piece in payload:
+                        writer.write(f"{len(piece):x}\r\n".encode("latin-1") + piece + b"\r\n")
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return serve
+
+
+def run_server(handler: Handler, host: str, port: int) -> None:
+    # Blocking entry point, meant to run in its own process so its CPU and memory stay out of
+    # the measurements taken in the benchmark process
+    async def main() -> None:
+        server = await asyncio.start_server(_connection_handler(handler), host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
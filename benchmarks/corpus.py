@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# Deterministic synthetic corpus: photo-like, screenshot-like and flat images across a range of
+# sizes and formats, so decode/re-encode cost and the local gate all get exercised.
+
+SIZES: List[Tuple[int, int]] = [(64, 64), (320, 240), (800, 600), (1280, 720), (1920, 1080), (3000, 2000), (4032, 3024)]
+FORMATS = [("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp"), ("GIF", "gif")]
+KINDS = ("photo", "screenshot", "flat")
+
+
+def _photo(size: Tuple[int, int], rng: random.Random) -> Image.Image:
+    # Smooth colour fields plus sensor-like noise; compresses (and decodes) like a photograph
+    small = Image.new("RGB", (8, 6))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+    base = small.resize(size, Image.Resampling.BICUBIC)
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    return Image.blend(base, noise, 0.15).filter(ImageFilter.SMOOTH)
+
+
+def _screenshot(size: Tuple[int, int], rng: random.Random) -> Image.Image:
+    image = Image.new("RGB", size, (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.rectangle((0, 0, width, max(8, height // 20)), fill=(rng.randrange(80), rng.randrange(80), 120))
+    line = max(10, height // 60)
+    for y in range(height // 10, height - line, line + 4):
+        draw.text((width // 30, y), "The quick brown fox jumps over the lazy dog " * (1 + width // 400), fill=(20, 20, 20))
+    return image
+
+
+def _flat(size: Tuple[int, int], rng: random.Random) -> Image.Image:
+    return Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+
+
+def generate(directory: str, count: int, seed: int = 0, max_side: int = 4032) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    sizes = [s for s in SIZES if max(s) <= max_side] or [SIZES[0]]
+    paths: List[str] = []
+    for index in range(count):
+        kind = KINDS[index % len(KINDS)] if index % 10 else "flat"
+        size = rng.choice(sizes)
+        fmt, ext = rng.choice(FORMATS)
+        builder = {"photo": _photo, "screenshot": _screenshot, "flat": _flat}[kind]
+        image = builder(size, rng)
+        path = os.path.join(directory, f"{index:04d}_{kind}_{size[0]}x{size[1]}.{ext}")
+        if fmt == "GIF":
+            image = image.convert("P", palette=Image.Palette.ADAPTIVE)
+        image.save(path, format=fmt, quality=85)
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark image corpus")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-side", type=int, default=4032)
+    args = parser.parse_args()
+    paths = generate(args.directory, args.count, args.seed, args.max_side)
+    total = sum(os.path.getsize(p) for p in paths)
+    print(f"wrote {len(paths)} images ({total / 1e6:.1f} MB) to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import mimetypes
+import os
+from typing import Dict
+from urllib.parse import unquote
+
+from _http import Response, run_server
+
+# Serves a corpus directory over HTTP, optionally with per-response latency, so the URL fetch
+# path (DNS check, pinned connect, streaming download) is part of the measurement.
+
+
+def make_handler(root: str, latency_ms: float):
+    root = os.path.abspath(root)
+    cache: Dict[str, bytes] = {}
+
+    async def handle(method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+        if method != "GET":
+            return 404, {}, b"not found"
+        name = os.path.basename(unquote(path.split("?", 1)[0]))
+        full = os.path.join(root, name)
+        if name not in cache:
+            if not os.path.isfile(full):
+                return 404, {}, b"not found"
+            with open(full, "rb") as f:
+                cache[name] = f.read()
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000.0)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return 200, {"Content-Type": content_type}, cache[name]
+
+    return handle
+
+
+def serve(root: str, host: str, port: int, latency_ms: float = 0.0) -> None:
+    run_server(make_handler(root, latency_ms), host, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a benchmark image corpus over HTTP")
+    parser.add_argument("root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"serving {args.root} on http://{args.host}:{args.port}/", flush=True)
+    serve(args.root, args.host, args.port, args.latency_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict
+
+from _http import Response, run_server
+
+# Stand-in for OpenRouter's /chat/completions: answers with a canned analysis after a
+# configurable delay, and can inject 5xx errors and 429s with Retry-After.
+
+
+@dataclass
+class MockSettings:
+    latency_ms: float = 800.0
+    jitter_ms: float = 200.0
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    retry_after_s: int = 1
+    # Streamed responses: characters per SSE event and the delay between events
+    stream_chunk_chars: int = 16
+    stream_chunk_ms: float = 5.0
+    seed: int = 0
+
+
+ANALYSIS = {
+    "contains_person": False,
+    "objects_detected": ["benchmark"],
+    "scene_type": "synthetic",
+    "description": "Synthetic benchmark image",
+    "ocr_text": "",
+    "confidence": 0.9,
+}
+
+# Matches the `"image_url": {...}` key of each image part, not the `"type": "image_url"` value
+IMAGE_PART = re.compile(rb'"image_url"\s*:')
+STREAM_FLAG = re.compile(rb'"stream"\s*:\s*true')
+
+
+def _completion(content: Dict[str, object]) -> bytes:
+    return json.dumps(
+        {
+            "id": "bench",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(content)}, "finish_reason": "stop"}],
+        }
+    ).encode("utf-8")
+
+
+async def _stream(content: Dict[str, object], settings: MockSettings) -> AsyncIterator[bytes]:
+    text = json.dumps(content)
+    size = max(1, settings.stream_chunk_chars)
+    yield b": OPENROUTER PROCESSING\n\n"
+    for start in range(0, len(text), size):
+        event = {"id": "bench", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": text[start : start + size]}}]}
+        yield f"data: {json.dumps(event)}\n\n".encode("utf-8")
+        await asyncio.sleep(settings.stream_chunk_ms / 1000.0)
+    yield b"data: [DONE]\n\n"
+
+
+def make_handler(settings: MockSettings):
+    rng = random.Random(settings.seed)
+
+    async def handle(method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            return 404, {}, b"not found"
+        roll = rng.random()
+        if roll < settings.rate_429:
+            return 429, {"Retry-After": str(settings.retry_after_s), "Content-Type": "application/json"}, b'{"error":"rate limited"}'
+        delay = max(0.0, rng.gauss(settings.latency_ms, settings.jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+        if roll < settings.rate_429 + settings.error_rate:
+            return 500, {"Content-Type": "application/json"}, b'{"error":"upstream failure"}'
+        # Packed requests (several images in one completion) get one entry per image
+        images = len(IMAGE_PART.findall(body))
+        content: Dict[str, object] = {"results": [ANALYSIS] * images} if images > 1 else ANALYSIS
+        if STREAM_FLAG.search(body):
+            return 200, {"Content-Type": "text/event-stream"}, _stream(content, settings)
+        return 200, {"Content-Type": "application/json"}, _completion(content)
+
+    return handle
+
+
+def serve(host: str, port: int, settings: MockSettings) -> None:
+    run_server(make_handler(settings), host, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenRouter /chat/completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-chunk-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    settings = MockSettings(
+        args.latency_ms, args.jitter_ms, args.error_rate, args.rate_429, args.retry_after, args.stream_chunk_chars, args.stream_chunk_ms
+    )
+    print(f"mock OpenRouter on http://{args.host}:{args.port}/api/v1", flush=True)
+    serve(args.host, args.port, settings)
+
+
+if __name__ == "__main__":
+    main()
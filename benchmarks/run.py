@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import corpus  # noqa: E402
+import image_server  # noqa: E402
+import mock_openrouter  # noqa: E402
+
+# End-to-end load test of _handle_image_sage against local stand-ins for OpenRouter and an
+# image host. The stand-ins run in child processes; the server under test runs in this one, so
+# peak RSS and req/s describe the server only.
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise SystemExit(f"stand-in server on port {port} did not start")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {f"p{p}": round(_percentile(values, p), 2) for p in (50, 95, 99)}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+async def _run_level(context: Any, targets: List[str], concurrency: int, requests: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from image_sage_mcp.server import _handle_image_sage
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = defaultdict(list)
+    outcomes: Counter = Counter()
+    backends: Counter = Counter()
+    cursor = 0
+
+    async def worker() -> None:
+        nonlocal cursor
+        while cursor < requests:
+            target = targets[cursor % len(targets)]
+            cursor += 1
+            started = time.perf_counter()
+            response = await _handle_image_sage(target, dict(options), context)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            error = response.get("error")
+            outcomes[error.get("code", "ERROR") if isinstance(error, dict) else "ok"] += 1
+            if "backend_used" in response:
+                # Fallbacks (stub/local) still answer "ok", so count who actually served the request
+                backends[response["backend_used"]] += 1
+            for name, value in (response.get("timings_ms") or {}).items():
+                stages[name].append(float(value))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "outcomes": dict(outcomes),
+        "backends": dict(backends),
+        "latency_ms": _summary(latencies),
+        # The trace's own "total" is only present on successes; latency_ms covers every request
+        "stages_ms": {name: _summary(values) for name, values in sorted(stages.items()) if name != "total"},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _print_level(result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"]
+    outcomes = ", ".join(f"{k}={v}" for k, v in sorted(result["outcomes"].items()))
+    backends = ", ".join(f"{k}={v}" for k, v in sorted(result["backends"].items()))
+    print(
+        f"\nconcurrency={result['concurrency']:<4} requests={result['requests']:<5} "
+        f"req/s={result['req_per_s']:<8} peak_rss={result['peak_rss_mb']}MB  [{outcomes}]  served by [{backends}]"
+    )
+    print(f"  {'stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}")
+    print(f"  {'total':<12}{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}")
+    for name, values in result["stages_ms"].items():
+        print(f"  {name:<12}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}")
+
+
+async def _run(args: argparse.Namespace, targets: List[str]) -> List[Dict[str, Any]]:
+    from image_sage_mcp.context import AppContext
+    from image_sage_mcp.config import load_config
+
+    options = {"detail_level": args.detail, "include_ocr": not args.no_ocr}
+    results: List[Dict[str, Any]] = []
+    for concurrency in args.concurrency:
+        # A fresh context per level so caches, coalescing and circuit state don't leak between levels
+        context = AppContext(load_config())
+        try:
+            if args.warmup:
+                await _run_level(context, targets, min(concurrency, args.warmup), args.warmup, options)
+            result = await _run_level(context, targets, concurrency, args.requests, options)
+        finally:
+            await context.aclose()
+        results.append(result)
+        if not args.json:
+            _print_level(result)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for image-sage-mcp")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=0, help="unmeasured requests before each level")
+    parser.add_argument("--source", choices=("url", "file"), default="url")
+    parser.add_argument("--corpus", help="existing corpus directory (generated into a temp dir if omitted)")
+    parser.add_argument("--images", type=int, default=60)
+    parser.add_argument("--max-side", type=int, default=4032)
+    parser.add_argument("--detail", choices=("low", "medium", "high"), default="medium")
+    parser.add_argument("--no-ocr", action="store_true")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="mock OpenRouter mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--stream-chunk-ms", type=float, default=5.0, help="delay between streamed events (IMAGE_SAGE_STREAM=1)")
+    parser.add_argument("--image-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="image-sage-bench-")
+    paths = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir)) if os.path.isdir(corpus_dir) else []
+    if not paths:
+        paths = corpus.generate(corpus_dir, args.images, max_side=args.max_side)
+
+    ctx = multiprocessing.get_context("spawn")
+    mock_port, image_port = _free_port(), _free_port()
+    settings = mock_openrouter.MockSettings(
+        args.latency_ms, args.jitter_ms, args.error_rate, args.rate_429, args.retry_after, stream_chunk_ms=args.stream_chunk_ms
+    )
+    children = [
+        ctx.Process(target=mock_openrouter.serve, args=("127.0.0.1", mock_port, settings), daemon=True),
+        ctx.Process(target=image_server.serve, args=(corpus_dir, "127.0.0.1", image_port, args.image_latency_ms), daemon=True),
+    ]
+    for child in children:
+        child.start()
+    try:
+        _wait_for_port(mock_port)
+        _wait_for_port(image_port)
+        # Explicit settings in the environment win, so e.g. IMAGE_SAGE_CACHE=1 measures the warm path
+        defaults = {
+            "OPENROUTER_API_KEY": "bench",
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/api/v1",
+            "IMAGE_SAGE_ALLOW_PRIVATE_URLS": "1",
+            "IMAGE_SAGE_ALLOWED_FS_ROOTS": corpus_dir,
+            "IMAGE_SAGE_CACHE": "0",
+            "IMAGE_SAGE_PHASH": "0",
+            "IMAGE_SAGE_TIMINGS": "1",
+            "IMAGE_SAGE_METRICS_PORT": "0",
+        }
+        for key, value in defaults.items():
+            os.environ.setdefault(key, value)
+        if args.source == "url":
+            targets = [f"http://127.0.0.1:{image_port}/{os.path.basename(p)}" for p in paths]
+        else:
+            targets = list(paths)
+        if not args.json:
+            print(f"corpus: {len(paths)} images in {corpus_dir}; source={args.source}; upstream latency={args.latency_ms}ms")
+        results = asyncio.run(_run(args, targets))
+        if args.json:
+            print(json.dumps({"config": vars(args), "results": results}, indent=2))
+    finally:
+        for child in children:
+            child.terminate()
+            child.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
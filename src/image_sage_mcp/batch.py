@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .cache import image_digest
+from .context import AppContext
+from .models import AnalysisResult, ImageData
+from .metrics import request_trace, stage
+from .pipeline import PipelineError, analyze_image, is_remote, load_image, local_path, record_outcome, store_analysis
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+BATCH_TOOL_SCHEMA: Dict[str, Any] = {
+    "name": "Image Sage Batch",
+    "description": (
+        "Analyze many images (URLs, local file paths or local directories) in one call and return "
+        "a result or error for each item"
+    ),
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "urls": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "URLs, local file paths or local directories of images to analyze",
+            },
+            "options": {
+                "type": "object",
+                "properties": {
+                    "include_ocr": {"type": "boolean", "description": "Whether to extract text from the images", "default": True},
+                    "detail_level": {
+                        "type": "string",
+                        "enum": ["low", "medium", "high"],
+                        "description": "Level of detail for analysis",
+                        "default": "medium",
+                    },
+                },
+            },
+            "concurrency": {"type": "integer", "minimum": 1, "description": "Maximum images processed at once"},
+        },
+        "required": ["urls"],
+    },
+}
+
+ProgressCallback = Callable[[int, int, Dict[str, Any]], Awaitable[None]]
+
+
+def _list_images(path: str) -> List[str]:
+    return [
+        os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS and os.path.isfile(os.path.join(path, name))
+    ]
+
+
+async def expand_sources(context: AppContext, urls: List[str]) -> List[str]:
+    # Local directories expand to the supported image files directly inside them; listing runs off the loop
+    sources: List[str] = []
+    for url in urls:
+        url = str(url).strip()
+        if not url:
+            continue
+        path = local_path(url)
+        if not is_remote(url) and await context.workers.run_io(context.validator.check_dir_permissions, path):
+            try:
+                sources.extend(await context.workers.run_io(_list_images, path))
+            except OSError:
+                # Unreadable directories surface as a per-item fetch error
+                sources.append(url)
+        else:
+            sources.append(url)
+    return sources
+
+
+async def run_batch(
+    context: AppContext,
+    urls: List[str],
+    options: Optional[Dict[str, Any]] = None,
+    concurrency: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    config = context.config
+    formatter = context.formatter
+    sources = await expand_sources(context, urls or [])
+    if not sources:
+        return formatter.format_error_response("INVALID_REQUEST", "No images to analyze", {"urls": urls})
+    if len(sources) > config.batch_max_items:
+        return formatter.format_error_response(
+            "BATCH_TOO_LARGE",
+            f"Batch expands to {len(sources)} images; the limit is {config.batch_max_items}",
+            {"count": len(sources), "limit": config.batch_max_items},
+        )
+
+    workers = max(1, min(concurrency or config.batch_concurrency, config.batch_concurrency))
+    # Separate bounds for the I/O and the analysis stage so slow downloads don't starve backends
+    fetch_slots = asyncio.Semaphore(workers)
+    analysis_slots = asyncio.Semaphore(workers)
+    # Bounds fetched images waiting for or under analysis; a slot is held from fetch until release
+    held_slots = asyncio.Semaphore(2 * workers)
+    analyses: Dict[str, "asyncio.Future[AnalysisResult]"] = {}
+    items: List[Optional[Dict[str, Any]]] = [None] * len(sources)
+    completed = 0
+
+    async def analyze_limited(image: ImageData) -> AnalysisResult:
+        async with analysis_slots:
+            return await analyze_image(context, image, options)
+
+    async def process_held(url: str) -> Dict[str, Any]:
+        digest: Optional[str] = None
+        image: Optional[ImageData] = None
+        with request_trace("batch") as trace:
+            try:
+                async with fetch_slots:
+                    image = await load_image(context, url)
+                digest = await context.workers.run_io(image_digest, image)
+                # Identical bytes share one analysis, whichever item fetched them first
+                task = analyses.get(digest)
+                if task is None:
+                    task = asyncio.ensure_future(analyze_limited(image))
+                    analyses[digest] = task
+                analysis = await asyncio.shield(task)
+                store_analysis(context, url, image, analysis, options)
+                with stage("format"):
+                    item = {"url": url, "content_hash": digest, **formatter.format_success_response(analysis)}
+                if config.response_timings:
+                    item["timings_ms"] = trace.stage_totals_ms()
+            except PipelineError as err:
+                item = {"url": url, **err.to_response(context)}
+                if digest:
+                    item["content_hash"] = digest
+            except Exception as exc:  # noqa: BLE001
+                # One bad item must not abort the gather and drop every other result
+                item = {"url": url, **formatter.format_error_response("PROCESSING_ERROR", "Unexpected error", {"reason": str(exc)})}
+                if digest:
+                    item["content_hash"] = digest
+            finally:
+                if image is not None:
+                    image.release()
+        return item
+
+    async def process(index: int, url: str) -> None:
+        nonlocal completed
+        async with held_slots:
+            item = await process_held(url)
+        record_outcome("batch", item)
+        items[index] = item
+        completed += 1
+        if progress is not None:
+            try:
+                await progress(completed, len(sources), {"index": index, **item})
+            except Exception:  # noqa: BLE001
+                pass
+
+    await asyncio.gather(*(process(i, url) for i, url in enumerate(sources)))
+
+    results = [item or {} for item in items]
+    failed = sum(1 for item in results if "error" in item)
+    succeeded = len(results) - failed
+    summary = {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": failed,
+        "unique_images": len(analyses),
+        "duplicates": sum(1 for item in results if "content_hash" in item) - len(analyses),
+    }
+    return formatter.format_batch_response(results, summary)
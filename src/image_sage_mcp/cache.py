@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import AnalysisResult, ImageData, ImageMetadata
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+
+def image_digest(image: ImageData) -> str:
+    # Memoized on the ImageData so repeated lookups don't rehash multi-MB buffers
+    if not image.content_hash:
+        image.content_hash = hashlib.sha256(image.buffer).hexdigest()
+    return image.content_hash
+
+
+def make_cache_key(digest: str, backend: str, model: str, options: Dict[str, Any]) -> str:
+    material = json.dumps(
+        {"image": digest, "backend": backend, "model": model, "options": options},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def analysis_to_dict(result: AnalysisResult) -> Dict[str, Any]:
+    # asdict copies nested containers, so later edits to the result don't reach the cache
+    return asdict(result)
+
+
+def analysis_from_dict(data: Dict[str, Any]) -> AnalysisResult:
+    # Callers add keys to metadata.extra; they must get their own copy, not the cached one
+    fields = copy.deepcopy(data)
+    fields["metadata"] = ImageMetadata(**fields["metadata"])
+    fields["objects_detected"] = list(fields.get("objects_detected", []))
+    return AnalysisResult(**fields)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["hit_ratio"] = round(self.hit_ratio, 4)
+        return data
+
+
+class DiskCache:
+    # One JSON file per key. A hit touches the file, so mtime orders entries by last use; once
+    # the byte budget is exceeded the least recently used files are removed down to 90% of it
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        # (mtime, size, path) of every entry; temp files of interrupted writes are left alone
+        files: List[Tuple[float, int, str]] = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._files())
+            return self._bytes
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            expires_at = float(entry["expires_at"])
+            result = entry["result"]
+        except FileNotFoundError:
+            return None
+        except Exception:  # noqa: BLE001
+            # Corrupt or partially written entry; drop it
+            self.delete(key)
+            return None
+        if expires_at <= time.time():
+            self.delete(key)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return expires_at, result
+
+    def put(self, key: str, expires_at: float, result: Dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = json.dumps({"expires_at": expires_at, "result": result})
+        if len(data) > self.max_bytes:
+            return
+        total = self.size_bytes
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._bytes = (self._bytes if self._bytes is not None else total) + len(data) - replaced
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            self._bytes = total
+
+    def delete(self, key: str) -> None:
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes -= size
+
+
+class AnalysisCache:
+    def __init__(self, ttl_seconds: int, max_bytes: int, directory: Optional[str] = None, disk_max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.disk = DiskCache(directory, disk_max_bytes) if directory else None
+        self.stats = CacheStats()
+        # key -> (expires_at, size_bytes, serialized result)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _memory_get(self, key: str) -> Optional[AnalysisResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] > time.time():
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            self.stats.memory_hits += 1
+            return analysis_from_dict(entry[2])
+        self._remove(key)
+        self.stats.expirations += 1
+        return None
+
+    def _disk_hit(self, key: str, found: Optional[Tuple[float, Dict[str, Any]]]) -> Optional[AnalysisResult]:
+        if found is None:
+            self.stats.misses += 1
+            return None
+        expires_at, data = found
+        self._insert(key, expires_at, data)
+        self.stats.hits += 1
+        self.stats.disk_hits += 1
+        return analysis_from_dict(data)
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        result = self._memory_get(key)
+        if result is not None:
+            return result
+        return self._disk_hit(key, self.disk.get(key) if self.disk is not None else None)
+
+    async def get_async(self, key: str, workers: Optional[ImageWorkerPool] = None) -> Optional[AnalysisResult]:
+        # Same as get, but the disk tier is read off the event loop
+        result = self._memory_get(key)
+        if result is not None:
+            return result
+        found = await (workers or INLINE_WORKERS).run_io(self.disk.get, key) if self.disk is not None else None
+        return self._disk_hit(key, found)
+
+    def _prepare_put(self, key: str, result: AnalysisResult) -> Tuple[float, Dict[str, Any]]:
+        expires_at = time.time() + self.ttl_seconds
+        data = analysis_to_dict(result)
+        self._insert(key, expires_at, data)
+        self.stats.stores += 1
+        return expires_at, data
+
+    def put(self, key: str, result: AnalysisResult) -> None:
+        expires_at, data = self._prepare_put(key, result)
+        if self.disk is not None:
+            self.disk.put(key, expires_at, data)
+
+    async def put_async(self, key: str, result: AnalysisResult, workers: Optional[ImageWorkerPool] = None) -> None:
+        expires_at, data = self._prepare_put(key, result)
+        if self.disk is not None:
+            await (workers or INLINE_WORKERS).run_io(self.disk.put, key, expires_at, data)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _insert(self, key: str, expires_at: float, data: Dict[str, Any]) -> None:
+        size = len(json.dumps(data, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, size, data)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
@@ -1,28 +1,145 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List
+from typing import Dict, List, Mapping, Optional
 
 from .models import ServerConfig
+from .huggingface import MODEL_ROUTES, MODEL_TASKS
+from .processor import OPENROUTER_BASE_URL
+from .workers import WORKER_MODES, default_worker_count
 
 
-def load_config() -> ServerConfig:
-    vision_backends: List[str] = os.getenv("IMAGE_SAGE_BACKENDS", "openrouter,openai,anthropic").split(",")
+CONFIG_FILE_ENV = "IMAGE_SAGE_CONFIG_FILE"
+
+
+def config_file_path() -> Optional[str]:
+    path = os.getenv(CONFIG_FILE_ENV, "").strip()
+    return path or None
+
+
+def read_config_file(path: str) -> Dict[str, str]:
+    # Simple KEY=VALUE file (dotenv style); values here override the process environment
+    values: Dict[str, str] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            if line.startswith("export "):
+                line = line[len("export ") :]
+            key, _, value = line.partition("=")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in {"'", '"'}:
+                value = value[1:-1]
+            values[key.strip()] = value
+    return values
+
+
+def _parse_dimensions(value: str) -> Dict[str, int]:
+    # e.g. "low=512,medium=1024,high=2048"; unspecified levels keep their defaults
+    dims = {"low": 512, "medium": 1024, "high": 2048}
+    for part in value.split(","):
+        level, _, px = part.partition("=")
+        if level.strip() and px.strip().isdigit():
+            dims[level.strip().lower()] = int(px.strip())
+    return dims
+
+
+def load_config(path: Optional[str] = None) -> ServerConfig:
+    env: Dict[str, str] = dict(os.environ)
+    path = path or config_file_path()
+    if path and os.path.isfile(path):
+        env.update(read_config_file(path))
+    return _build_config(env)
+
+
+def _build_config(env: Mapping[str, str]) -> ServerConfig:
+    vision_backends: List[str] = env.get("IMAGE_SAGE_BACKENDS", "openrouter,openai,anthropic").split(",")
     api_keys: Dict[str, str] = {}
-    if os.getenv("OPENAI_API_KEY"):
-        api_keys["openai"] = os.environ["OPENAI_API_KEY"]
-    if os.getenv("ANTHROPIC_API_KEY"):
-        api_keys["anthropic"] = os.environ["ANTHROPIC_API_KEY"]
-    if os.getenv("OPENROUTER_API_KEY"):
-        api_keys["openrouter"] = os.environ["OPENROUTER_API_KEY"]
-
-    max_image_size_mb = int(os.getenv("IMAGE_SAGE_MAX_MB", "10"))
-    request_timeout_seconds = int(os.getenv("IMAGE_SAGE_TIMEOUT", "10"))
-    cache_enabled = os.getenv("IMAGE_SAGE_CACHE", "1") not in {"0", "false", "False"}
-    cache_ttl_seconds = int(os.getenv("IMAGE_SAGE_CACHE_TTL", "3600"))
-    log_level = os.getenv("IMAGE_SAGE_LOG", "INFO")
-
-    roots_env = os.getenv("IMAGE_SAGE_ALLOWED_FS_ROOTS", "").strip()
+    if env.get("OPENAI_API_KEY"):
+        api_keys["openai"] = env["OPENAI_API_KEY"]
+    if env.get("ANTHROPIC_API_KEY"):
+        api_keys["anthropic"] = env["ANTHROPIC_API_KEY"]
+    if env.get("OPENROUTER_API_KEY"):
+        api_keys["openrouter"] = env["OPENROUTER_API_KEY"]
+
+    max_image_size_mb = int(env.get("IMAGE_SAGE_MAX_MB", "10"))
+    request_timeout_seconds = int(env.get("IMAGE_SAGE_TIMEOUT", "10"))
+    cache_enabled = env.get("IMAGE_SAGE_CACHE", "1") not in {"0", "false", "False"}
+    cache_ttl_seconds = int(env.get("IMAGE_SAGE_CACHE_TTL", "3600"))
+    cache_max_mb = int(env.get("IMAGE_SAGE_CACHE_MAX_MB", "64"))
+    cache_dir = env.get("IMAGE_SAGE_CACHE_DIR", "").strip() or None
+    cache_disk_max_mb = int(env.get("IMAGE_SAGE_CACHE_DISK_MAX_MB", "512"))
+    store_path = env.get("IMAGE_SAGE_STORE", "").strip() or None
+    store_batch_size = max(1, int(env.get("IMAGE_SAGE_STORE_BATCH", "64")))
+    store_flush_ms = max(10, int(env.get("IMAGE_SAGE_STORE_FLUSH_MS", "500")))
+    phash_enabled = env.get("IMAGE_SAGE_PHASH", "1") not in {"0", "false", "False"}
+    phash_max_distance = int(env.get("IMAGE_SAGE_PHASH_DISTANCE", "4"))
+    metrics_host = env.get("IMAGE_SAGE_METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+    metrics_port = int(env.get("IMAGE_SAGE_METRICS_PORT", "0"))
+    otel_enabled = env.get("IMAGE_SAGE_OTEL", "0") in {"1", "true", "True"}
+    response_timings = env.get("IMAGE_SAGE_TIMINGS", "1") not in {"0", "false", "False"}
+    worker_mode = env.get("IMAGE_SAGE_WORKERS_MODE", "thread").strip().lower()
+    if worker_mode not in WORKER_MODES:
+        worker_mode = "thread"
+    worker_count = max(1, int(env.get("IMAGE_SAGE_WORKERS", str(default_worker_count()))))
+    worker_queue = max(0, int(env.get("IMAGE_SAGE_WORKER_QUEUE", "16")))
+    hf_model = env.get("IMAGE_SAGE_HF_MODEL", "").strip()
+    hf_task = env.get("IMAGE_SAGE_HF_TASK", "image-to-text").strip().lower()
+    if hf_task not in MODEL_TASKS:
+        hf_task = "image-to-text"
+    hf_route = env.get("IMAGE_SAGE_HF_ROUTE", "fallback").strip().lower()
+    if hf_route not in MODEL_ROUTES:
+        hf_route = "fallback"
+    hf_threads = max(1, int(env.get("IMAGE_SAGE_HF_THREADS", str(default_worker_count()))))
+    hf_batch_size = max(1, int(env.get("IMAGE_SAGE_HF_BATCH", "8")))
+    hf_batch_window_ms = max(0, int(env.get("IMAGE_SAGE_HF_BATCH_WINDOW_MS", "10")))
+    local_analysis = env.get("IMAGE_SAGE_LOCAL", "1") not in {"0", "false", "False"}
+    local_min_px = int(env.get("IMAGE_SAGE_LOCAL_MIN_PX", "16"))
+    phash_max_entries = int(env.get("IMAGE_SAGE_PHASH_MAX_ENTRIES", "10000"))
+    tiling_enabled = env.get("IMAGE_SAGE_TILING", "0") in {"1", "true", "True"}
+    tile_px = max(256, int(env.get("IMAGE_SAGE_TILE_PX", "1024")))
+    tile_overlap = min(0.5, max(0.0, float(env.get("IMAGE_SAGE_TILE_OVERLAP", "0.1"))))
+    tile_max = max(1, int(env.get("IMAGE_SAGE_TILE_MAX", "16")))
+    tile_min_px = int(env.get("IMAGE_SAGE_TILE_MIN_PX", "2048"))
+    tile_concurrency = max(1, int(env.get("IMAGE_SAGE_TILE_CONCURRENCY", "4")))
+    tile_timeout_seconds = max(1, int(env.get("IMAGE_SAGE_TILE_TIMEOUT", str(request_timeout_seconds))))
+    http_max_connections = int(env.get("IMAGE_SAGE_HTTP_MAX_CONNECTIONS", "100"))
+    http_max_keepalive = int(env.get("IMAGE_SAGE_HTTP_MAX_KEEPALIVE", "20"))
+    http_keepalive_expiry = float(env.get("IMAGE_SAGE_HTTP_KEEPALIVE_EXPIRY", "30"))
+    http2 = env.get("IMAGE_SAGE_HTTP2", "0") not in {"0", "false", "False", ""}
+    dns_cache_ttl_seconds = float(env.get("IMAGE_SAGE_DNS_TTL", "60"))
+    dns_cache_size = int(env.get("IMAGE_SAGE_DNS_CACHE_SIZE", "1024"))
+    execution_strategy = env.get("IMAGE_SAGE_STRATEGY", "sequential").strip().lower()
+    hedge_percentile = float(env.get("IMAGE_SAGE_HEDGE_PERCENTILE", "95")) / 100.0
+    hedge_min_ms = int(env.get("IMAGE_SAGE_HEDGE_MIN_MS", "100"))
+    hedge_max_ms = int(env.get("IMAGE_SAGE_HEDGE_MAX_MS", "5000"))
+    hedge_default_ms = int(env.get("IMAGE_SAGE_HEDGE_DEFAULT_MS", "2000"))
+    circuit_enabled = env.get("IMAGE_SAGE_CIRCUIT", "1") not in {"0", "false", "False"}
+    circuit_window_seconds = int(env.get("IMAGE_SAGE_CIRCUIT_WINDOW_S", "60"))
+    circuit_min_requests = int(env.get("IMAGE_SAGE_CIRCUIT_MIN_REQUESTS", "5"))
+    circuit_error_rate = float(env.get("IMAGE_SAGE_CIRCUIT_ERROR_RATE", "0.5"))
+    circuit_open_seconds = int(env.get("IMAGE_SAGE_CIRCUIT_OPEN_S", "30"))
+    circuit_max_open_seconds = int(env.get("IMAGE_SAGE_CIRCUIT_MAX_OPEN_S", "300"))
+    circuit_slow_ms = int(env.get("IMAGE_SAGE_CIRCUIT_SLOW_MS", "0"))
+    max_concurrency = int(env.get("IMAGE_SAGE_MAX_CONCURRENCY", "0"))
+    rate_limit_rpm = int(env.get("IMAGE_SAGE_RATE_RPM", "0"))
+    rate_limit_tpm = int(env.get("IMAGE_SAGE_RATE_TPM", "0"))
+    queue_timeout_ms = int(env.get("IMAGE_SAGE_QUEUE_TIMEOUT_MS", "2000"))
+    openrouter_batch_size = max(1, int(env.get("IMAGE_SAGE_OPENROUTER_BATCH_SIZE", "1")))
+    openrouter_batch_window_ms = int(env.get("IMAGE_SAGE_OPENROUTER_BATCH_WINDOW_MS", "50"))
+    openrouter_batch_max_mb = int(env.get("IMAGE_SAGE_OPENROUTER_BATCH_MAX_MB", "8"))
+    openrouter_stream = env.get("IMAGE_SAGE_STREAM", "0") in {"1", "true", "True"}
+    max_output_tokens = max(0, int(env.get("IMAGE_SAGE_MAX_OUTPUT_TOKENS", "0")))
+    batch_max_items = int(env.get("IMAGE_SAGE_BATCH_MAX_ITEMS", "100"))
+    batch_concurrency = max(1, int(env.get("IMAGE_SAGE_BATCH_CONCURRENCY", "4")))
+    preprocess_enabled = env.get("IMAGE_SAGE_PREPROCESS", "1") not in {"0", "false", "False"}
+    upload_format = env.get("IMAGE_SAGE_UPLOAD_FORMAT", "jpeg").strip().upper()
+    upload_quality = int(env.get("IMAGE_SAGE_UPLOAD_QUALITY", "85"))
+    upload_max_dimensions = _parse_dimensions(env.get("IMAGE_SAGE_UPLOAD_MAX_PX", ""))
+    log_level = env.get("IMAGE_SAGE_LOG", "INFO")
+
+    roots_env = env.get("IMAGE_SAGE_ALLOWED_FS_ROOTS", "").strip()
     allowed_fs_roots = [p.strip() for p in roots_env.split(";") if p.strip()] if roots_env else []
 
     return ServerConfig(
@@ -32,9 +149,73 @@ def load_config() -> ServerConfig:
         request_timeout_seconds=request_timeout_seconds,
         cache_enabled=cache_enabled,
         cache_ttl_seconds=cache_ttl_seconds,
+        cache_max_mb=cache_max_mb,
+        cache_dir=cache_dir,
+        cache_disk_max_mb=cache_disk_max_mb,
+        store_path=store_path,
+        store_batch_size=store_batch_size,
+        store_flush_ms=store_flush_ms,
+        phash_enabled=phash_enabled,
+        phash_max_distance=phash_max_distance,
+        phash_max_entries=phash_max_entries,
+        local_analysis=local_analysis,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        otel_enabled=otel_enabled,
+        response_timings=response_timings,
+        hf_model=hf_model,
+        hf_task=hf_task,
+        hf_route=hf_route,
+        hf_threads=hf_threads,
+        hf_batch_size=hf_batch_size,
+        hf_batch_window_ms=hf_batch_window_ms,
+        worker_mode=worker_mode,
+        worker_count=worker_count,
+        worker_queue=worker_queue,
+        local_min_px=local_min_px,
+        tiling_enabled=tiling_enabled,
+        tile_px=tile_px,
+        tile_overlap=tile_overlap,
+        tile_max=tile_max,
+        tile_min_px=tile_min_px,
+        tile_concurrency=tile_concurrency,
+        tile_timeout_seconds=tile_timeout_seconds,
+        http_max_connections=http_max_connections,
+        http_max_keepalive=http_max_keepalive,
+        http_keepalive_expiry=http_keepalive_expiry,
+        http2=http2,
+        dns_cache_ttl_seconds=dns_cache_ttl_seconds,
+        dns_cache_size=dns_cache_size,
+        execution_strategy=execution_strategy,
+        hedge_percentile=hedge_percentile,
+        hedge_min_ms=hedge_min_ms,
+        hedge_max_ms=hedge_max_ms,
+        hedge_default_ms=hedge_default_ms,
+        circuit_enabled=circuit_enabled,
+        circuit_window_seconds=circuit_window_seconds,
+        circuit_min_requests=circuit_min_requests,
+        circuit_error_rate=circuit_error_rate,
+        circuit_open_seconds=circuit_open_seconds,
+        circuit_max_open_seconds=circuit_max_open_seconds,
+        circuit_slow_ms=circuit_slow_ms,
+        max_concurrency=max_concurrency,
+        rate_limit_rpm=rate_limit_rpm,
+        rate_limit_tpm=rate_limit_tpm,
+        queue_timeout_ms=queue_timeout_ms,
+        openrouter_batch_size=openrouter_batch_size,
+        openrouter_batch_window_ms=openrouter_batch_window_ms,
+        openrouter_batch_max_mb=openrouter_batch_max_mb,
+        openrouter_stream=openrouter_stream,
+        max_output_tokens=max_output_tokens,
+        batch_max_items=batch_max_items,
+        batch_concurrency=batch_concurrency,
+        preprocess_enabled=preprocess_enabled,
+        upload_format=upload_format,
+        upload_quality=upload_quality,
+        upload_max_dimensions=upload_max_dimensions,
         log_level=log_level,
-        openrouter_model=os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini"),
+        openrouter_model=env.get("OPENROUTER_MODEL", "openai/gpt-4o-mini"),
+        openrouter_base_url=env.get("OPENROUTER_BASE_URL", "").strip().rstrip("/") or OPENROUTER_BASE_URL,
+        allow_private_urls=env.get("IMAGE_SAGE_ALLOW_PRIVATE_URLS", "0") in {"1", "true", "True"},
         allowed_fs_roots=allowed_fs_roots,
     )
-
-
@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import os
+import signal
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .cache import AnalysisCache
+from .config import config_file_path, load_config
+from .fetcher import ImageFetcher
+from .formatter import ResponseFormatter
+from .health import CircuitSettings
+from .http_pool import HTTPClientPool, pool_from_config
+from .huggingface import HuggingFaceBackend, ModelRunner
+from .local import LocalBackend, LocalFeatureCache
+from .metrics import REGISTRY, enable_opentelemetry
+from .microbatch import BatchingOpenRouterBackend
+from .models import AnalysisResult, ImageData, ServerConfig
+from .phash import PerceptualIndex, numpy_available
+from .preprocess import ImagePreparer, UploadProfile
+from .ratelimit import AdmissionController
+from .processor import OpenRouterBackend, StubBackend, VisionBackend, VisionProcessor
+from .singleflight import SingleFlight
+from .store import AnalysisStore
+from .tiling import TileSettings
+from .workers import ImageWorkerPool
+from .validation import DNSResolver, URLValidator
+
+
+CONFIG_POLL_INTERVAL_SECONDS = 1.0
+
+
+def build_circuit_settings(config: ServerConfig) -> Optional[CircuitSettings]:
+    if not config.circuit_enabled:
+        return None
+    return CircuitSettings(
+        window_seconds=config.circuit_window_seconds,
+        min_requests=config.circuit_min_requests,
+        error_rate_threshold=config.circuit_error_rate,
+        open_seconds=config.circuit_open_seconds,
+        max_open_seconds=config.circuit_max_open_seconds,
+        slow_call_seconds=config.circuit_slow_ms / 1000.0 if config.circuit_slow_ms > 0 else None,
+    )
+
+
+def build_admission(name: str, config: ServerConfig) -> Optional[AdmissionController]:
+    if config.max_concurrency <= 0 and config.rate_limit_rpm <= 0 and config.rate_limit_tpm <= 0:
+        return None
+    return AdmissionController(
+        name,
+        max_concurrency=config.max_concurrency,
+        requests_per_minute=config.rate_limit_rpm,
+        tokens_per_minute=config.rate_limit_tpm,
+        max_wait_seconds=config.queue_timeout_ms / 1000.0,
+    )
+
+
+def build_upload_profile(config: ServerConfig) -> Optional[UploadProfile]:
+    if not config.preprocess_enabled:
+        return None
+    return UploadProfile(
+        max_dimensions=dict(config.upload_max_dimensions),
+        format=config.upload_format,
+        quality=config.upload_quality,
+    )
+
+
+def build_backends(
+    config: ServerConfig,
+    pool: Optional[HTTPClientPool] = None,
+    preparer: Optional[ImagePreparer] = None,
+    local_features: Optional[LocalFeatureCache] = None,
+    workers: Optional[ImageWorkerPool] = None,
+    model_runner: Optional[ModelRunner] = None,
+) -> List[VisionBackend]:
+    backends: List[VisionBackend] = []
+    if model_runner is not None and config.hf_route in ("cheap", "primary"):
+        # Ahead of the paid API; in "cheap" mode it declines requests that need OCR or high detail
+        backends.append(HuggingFaceBackend(model_runner, workers, cheap_only=config.hf_route == "cheap"))
+    if "openrouter" in config.vision_backends and config.api_keys.get("openrouter"):
+        client = pool.get("openrouter", base_url=config.openrouter_base_url) if pool else None
+        openrouter = OpenRouterBackend(
+            api_key=config.api_keys["openrouter"],
+            model=config.openrouter_model,
+            timeout_seconds=config.request_timeout_seconds,
+            client=client,
+            upload_profile=build_upload_profile(config),
+            preparer=preparer,
+            admission=build_admission(f"openrouter:{config.openrouter_model}", config),
+            base_url=config.openrouter_base_url,
+            stream=config.openrouter_stream,
+            max_output_tokens=config.max_output_tokens,
+            workers=workers,
+        )
+        if config.openrouter_batch_size > 1:
+            backends.append(
+                BatchingOpenRouterBackend(
+                    openrouter,
+                    max_images=config.openrouter_batch_size,
+                    window_seconds=config.openrouter_batch_window_ms / 1000.0,
+                    max_bytes=config.openrouter_batch_max_mb * 1024 * 1024,
+                )
+            )
+        else:
+            backends.append(openrouter)
+    if model_runner is not None and config.hf_route != "primary":
+        backends.append(HuggingFaceBackend(model_runner, workers, fallback_only=True))
+    if config.local_analysis:
+        backends.append(LocalBackend(local_features, workers))
+    # Always include stub as a final fallback
+    backends.append(StubBackend())
+    return backends
+
+
+def _cache_matches(cache: AnalysisCache, config: ServerConfig) -> bool:
+    return (
+        cache.ttl_seconds == config.cache_ttl_seconds
+        and cache.max_bytes == config.cache_max_mb * 1024 * 1024
+        and (cache.disk.directory if cache.disk else None) == config.cache_dir
+        and (cache.disk is None or cache.disk.max_bytes == config.cache_disk_max_mb * 1024 * 1024)
+    )
+
+
+def build_cache(config: ServerConfig, previous: Optional[AnalysisCache] = None) -> Optional[AnalysisCache]:
+    if not config.cache_enabled:
+        return None
+    # Keep warm entries across reloads unless the cache settings themselves changed
+    if previous is not None and _cache_matches(previous, config):
+        return previous
+    return AnalysisCache(
+        ttl_seconds=config.cache_ttl_seconds,
+        max_bytes=config.cache_max_mb * 1024 * 1024,
+        directory=config.cache_dir,
+        disk_max_bytes=config.cache_disk_max_mb * 1024 * 1024,
+    )
+
+
+def build_phash_index(config: ServerConfig, previous: Optional[PerceptualIndex] = None) -> Optional[PerceptualIndex]:
+    if not config.phash_enabled or not numpy_available():
+        return None
+    if (
+        previous is not None
+        and previous.max_distance == config.phash_max_distance
+        and previous.max_entries == config.phash_max_entries
+        and previous.ttl_seconds == config.cache_ttl_seconds
+    ):
+        return previous
+    return PerceptualIndex(
+        max_distance=config.phash_max_distance,
+        max_entries=config.phash_max_entries,
+        ttl_seconds=config.cache_ttl_seconds,
+    )
+
+
+def build_store(config: ServerConfig, previous: Optional[AnalysisStore] = None) -> Optional[AnalysisStore]:
+    if not config.store_path:
+        return None
+    if previous is not None and not previous.closed and previous.path == config.store_path:
+        previous.batch_size = config.store_batch_size
+        previous.flush_seconds = config.store_flush_ms / 1000.0
+        return previous
+    return AnalysisStore(config.store_path, batch_size=config.store_batch_size, flush_seconds=config.store_flush_ms / 1000.0)
+
+
+def build_tile_settings(config: ServerConfig) -> Optional[TileSettings]:
+    if not config.tiling_enabled:
+        return None
+    return TileSettings(
+        tile_px=config.tile_px,
+        overlap=config.tile_overlap,
+        max_tiles=config.tile_max,
+        min_px=config.tile_min_px,
+        concurrency=config.tile_concurrency,
+        timeout_seconds=config.tile_timeout_seconds,
+        deadline_seconds=config.request_timeout_seconds,
+    )
+
+
+def build_model_runner(config: ServerConfig, previous: Optional[ModelRunner] = None) -> Optional[ModelRunner]:
+    if not config.hf_model:
+        return None
+    window_seconds = config.hf_batch_window_ms / 1000.0
+    # A loaded model is kept across reloads unless its settings changed
+    if previous is not None and previous.matches(config.hf_task, config.hf_model, config.hf_threads, config.hf_batch_size, window_seconds):
+        return previous
+    return ModelRunner(
+        task=config.hf_task,
+        model_id=config.hf_model,
+        threads=config.hf_threads,
+        max_batch=config.hf_batch_size,
+        window_seconds=window_seconds,
+    )
+
+
+def build_workers(config: ServerConfig, previous: Optional[ImageWorkerPool] = None) -> ImageWorkerPool:
+    if (
+        previous is not None
+        and previous.mode == config.worker_mode
+        and previous.max_workers == config.worker_count
+        and previous.max_queue == config.worker_queue
+    ):
+        return previous
+    return ImageWorkerPool(mode=config.worker_mode, max_workers=config.worker_count, max_queue=config.worker_queue)
+
+
+class AppContext:
+    def __init__(self, config: ServerConfig, previous: Optional["AppContext"] = None) -> None:
+        self.config = config
+        self.http = pool_from_config(config)
+        self.workers = build_workers(config, previous.workers if previous else None)
+        self.owns_workers = True
+        self.model_runner = build_model_runner(config, previous.model_runner if previous else None)
+        self.owns_model_runner = True
+        self.resolver = DNSResolver(
+            ttl_seconds=config.dns_cache_ttl_seconds,
+            max_entries=config.dns_cache_size,
+            timeout_seconds=config.request_timeout_seconds,
+            allow_private=config.allow_private_urls,
+        )
+        self.validator = URLValidator(allowed_roots=config.allowed_fs_roots, resolver=self.resolver)
+        self.fetcher = ImageFetcher(
+            timeout_seconds=config.request_timeout_seconds,
+            max_size_mb=config.max_image_size_mb,
+            client=self.http.get("fetch", resolver=self.resolver),
+            workers=self.workers,
+        )
+        self.preparer = previous.preparer if previous else ImagePreparer()
+        self.local_features = previous.local_features if previous else LocalFeatureCache()
+        self.backends = build_backends(config, self.http, self.preparer, self.local_features, self.workers, self.model_runner)
+        self.processor = VisionProcessor(
+            backends=self.backends,
+            strategy=config.execution_strategy,
+            hedge_percentile=config.hedge_percentile,
+            hedge_min_delay=config.hedge_min_ms / 1000.0,
+            hedge_max_delay=config.hedge_max_ms / 1000.0,
+            hedge_default_delay=config.hedge_default_ms / 1000.0,
+            circuit=build_circuit_settings(config),
+            # Latency and circuit state survive reloads so hedge delays and open circuits don't reset
+            health=previous.processor.health if previous else None,
+        )
+        self.tiling = build_tile_settings(config)
+        self.formatter = ResponseFormatter()
+        self.cache = build_cache(config, previous.cache if previous else None)
+        self.store = build_store(config, previous.store if previous else None)
+        self.owns_store = True
+        self.phash_index = build_phash_index(config, previous.phash_index if previous else None)
+        self.fetch_flights: SingleFlight[ImageData] = SingleFlight()
+        self.analysis_flights: SingleFlight[AnalysisResult] = SingleFlight()
+        self.created_at = time.time()
+        self.inflight = 0
+        self.retired = False
+        self.closed = False
+        enable_opentelemetry(config.otel_enabled)
+        REGISTRY.set_collector("context", self.collect_metrics)
+        if previous is not None:
+            self._take_over(previous)
+
+    def _take_over(self, previous: "AppContext") -> None:
+        # Runs only once construction has succeeded: a failed reload leaves the previous context
+        # serving and still responsible for closing everything it owns. Whatever the successor
+        # shares, the retiring context must not shut down
+        if previous.workers is self.workers:
+            previous.owns_workers = False
+        if previous.model_runner is self.model_runner:
+            previous.owns_model_runner = False
+        if previous.store is self.store:
+            previous.owns_store = False
+
+    def collect_metrics(self) -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+        families: List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]] = []
+        if self.cache is not None:
+            stats = self.cache.stats
+            families += [
+                ("image_sage_cache_hits_total", "counter", "Result cache hits", [({"tier": "memory"}, stats.memory_hits), ({"tier": "disk"}, stats.disk_hits)]),
+                ("image_sage_cache_misses_total", "counter", "Result cache misses", [({}, stats.misses)]),
+                (
+                    "image_sage_cache_evictions_total",
+                    "counter",
+                    "Result cache evictions",
+                    [({"tier": "memory"}, stats.evictions)] + ([({"tier": "disk"}, self.cache.disk.evictions)] if self.cache.disk else []),
+                ),
+                ("image_sage_cache_bytes", "gauge", "Result cache memory tier size", [({}, self.cache.size_bytes)]),
+            ]
+        if self.phash_index is not None:
+            stats_p = self.phash_index.stats()
+            families.append(
+                ("image_sage_near_duplicate_total", "counter", "Perceptual index lookups", [({"result": "hit"}, stats_p["hits"]), ({"result": "miss"}, stats_p["misses"])])
+            )
+        states = {"closed": 0, "half_open": 1, "open": 2}
+        circuit: List[Tuple[Dict[str, Any], float]] = []
+        rejected: List[Tuple[Dict[str, Any], float]] = []
+        for name, health in self.processor.health.items():
+            if health.settings is None:
+                continue
+            circuit.append(({"backend": name}, states.get(health.state, 0)))
+            rejected.append(({"backend": name}, health.rejected))
+        families += [
+            ("image_sage_circuit_state", "gauge", "Circuit state (0 closed, 1 half-open, 2 open)", circuit),
+            ("image_sage_circuit_rejected_total", "counter", "Calls skipped by an open circuit", rejected),
+        ]
+        admission: List[Tuple[Dict[str, Any], float]] = []
+        admission_rejected: List[Tuple[Dict[str, Any], float]] = []
+        for backend in self.backends:
+            controller = getattr(backend, "admission", None) or getattr(getattr(backend, "inner", None), "admission", None)
+            if controller is not None:
+                snapshot = controller.snapshot()
+                admission += [({"backend": controller.name, "state": key}, snapshot[key]) for key in ("inflight", "waiting")]
+                admission_rejected.append(({"backend": controller.name}, snapshot["rejected"]))
+        families += [
+            ("image_sage_admission_calls", "gauge", "Upstream calls admitted or queued", admission),
+            ("image_sage_admission_rejected_total", "counter", "Calls rejected by admission control", admission_rejected),
+        ]
+        families += [
+            (
+                "image_sage_coalesced_total",
+                "counter",
+                "Requests that joined an identical in-flight request",
+                [({"stage": "fetch"}, self.fetch_flights.coalesced), ({"stage": "analysis"}, self.analysis_flights.coalesced)],
+            ),
+            ("image_sage_worker_jobs_total", "counter", "Jobs submitted to the image worker pool", [({"mode": self.workers.mode}, self.workers.submitted)]),
+            ("image_sage_worker_waiting", "gauge", "Jobs waiting for a worker pool slot", [({"mode": self.workers.mode}, self.workers.waiting)]),
+        ]
+        if self.store is not None:
+            stats_s = self.store.stats()
+            families += [
+                ("image_sage_store_pending", "gauge", "Analyses queued for the store", [({}, stats_s["pending"])]),
+                (
+                    "image_sage_store_records_total",
+                    "counter",
+                    "Analyses handed to the store by outcome",
+                    [({"outcome": key}, stats_s[key]) for key in ("written", "dropped", "failed")],
+                ),
+            ]
+        return families
+
+    async def preload(self) -> None:
+        # Model weights load at startup rather than on the first request that needs them
+        if self.model_runner is not None:
+            await self.model_runner.preload()
+
+    async def aclose(self) -> None:
+        self.closed = True
+        await self.http.aclose()
+        if self.owns_workers:
+            self.workers.shutdown()
+        if self.owns_model_runner and self.model_runner is not None:
+            self.model_runner.close()
+        if self.owns_store and self.store is not None:
+            # Flushes queued writes before the connection closes
+            await self.store.aclose()
+
+
+class ContextHolder:
+    def __init__(self, loader: Callable[[], ServerConfig] = load_config) -> None:
+        self._loader = loader
+        self._context: Optional[AppContext] = None
+        self._reload_requested = False
+        self._config_path = config_file_path()
+        self._config_mtime = self._stat_config()
+        self._last_poll = time.monotonic()
+
+    def request_reload(self) -> None:
+        # Only flips a flag, so it is safe to call from a signal handler
+        self._reload_requested = True
+
+    def install_signal_handler(self) -> bool:
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        signal.signal(signal.SIGHUP, lambda _signum, _frame: self.request_reload())
+        return True
+
+    def _stat_config(self) -> Optional[float]:
+        if not self._config_path:
+            return None
+        try:
+            return os.stat(self._config_path).st_mtime
+        except OSError:
+            return None
+
+    def _config_changed(self) -> bool:
+        if not self._config_path:
+            return False
+        now = time.monotonic()
+        if now - self._last_poll < CONFIG_POLL_INTERVAL_SECONDS:
+            return False
+        self._last_poll = now
+        mtime = self._stat_config()
+        if mtime != self._config_mtime:
+            self._config_mtime = mtime
+            return True
+        return False
+
+    async def current(self) -> AppContext:
+        if self._context is None:
+            self._context = AppContext(self._loader())
+        elif self._reload_requested or self._config_changed():
+            self._reload_requested = False
+            await self._reload()
+        return self._context
+
+    async def _reload(self) -> None:
+        previous = self._context
+        try:
+            self._context = AppContext(self._loader(), previous=previous)
+        except Exception as exc:  # noqa: BLE001
+            # Keep serving with the last good configuration
+            sys.stderr.write(f"[image-sage-mcp] config reload failed: {exc}\n")
+            sys.stderr.flush()
+            return
+        if os.getenv("IMAGE_SAGE_DEBUG", ""):
+            sys.stderr.write("[image-sage-mcp] configuration reloaded\n")
+            sys.stderr.flush()
+        if previous is not None:
+            previous.retired = True
+            if previous.inflight == 0:
+                await previous.aclose()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AppContext]:
+        context = await self.current()
+        context.inflight += 1
+        try:
+            yield context
+        finally:
+            context.inflight -= 1
+            # A context replaced mid-request is closed by its last user
+            if context.retired and context.inflight == 0 and not context.closed:
+                await context.aclose()
+
+    async def aclose(self) -> None:
+        if self._context is not None:
+            await self._context.aclose()
+            self._context = None
@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import io
 import os
-from typing import Optional, Tuple
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Optional, Union
 from urllib.parse import urlparse
 
 import httpx
 from PIL import Image
 
-from .models import ImageData
+from .models import ImageData, LazyImageData
+from .workers import INLINE_WORKERS, ImageWorkerPool
 
 
 SUPPORTED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
@@ -18,49 +21,142 @@ SUPPORTED_MIME = {
     "image/gif": "GIF",
     "image/webp": "WEBP",
 }
+EXIF_ORIENTATION_TAG = 0x0112
+# Enough leading bytes to recognise every supported format (WEBP needs 12)
+SNIFF_BYTES = 12
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    if head[:3] == b"\xff\xd8\xff":
+        return "JPEG"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
 
 
 class ImageFetcher:
-    def __init__(self, timeout_seconds: int, max_size_mb: int) -> None:
+    def __init__(
+        self,
+        timeout_seconds: int,
+        max_size_mb: int,
+        client: Optional[httpx.AsyncClient] = None,
+        workers: Optional[ImageWorkerPool] = None,
+    ) -> None:
         self.timeout_seconds = timeout_seconds
         self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.client = client
+        self.workers = workers or INLINE_WORKERS
 
-    async def fetch_from_url(self, url: str) -> ImageData:
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[httpx.AsyncClient]:
+        # Prefer the shared pooled client; fall back to a one-off client when used standalone
+        if self.client is not None:
+            yield self.client
+            return
         async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
-            response = await client.get(url, follow_redirects=True)
-            response.raise_for_status()
-            data = response.content
-            if len(data) > self.max_size_bytes:
+            yield client
+
+    async def fetch_from_url(self, url: str) -> ImageData:
+        async with self._client() as client:
+            async with client.stream("GET", url, follow_redirects=True, timeout=self.timeout_seconds) as response:
+                response.raise_for_status()
+                declared = response.headers.get("content-length", "").strip()
+                if declared.isdigit() and int(declared) > self.max_size_bytes:
+                    raise ValueError("Image too large")
+                data = await self._read_bounded(response)
+                mime_type = response.headers.get("content-type", "").split(";")[0].strip()
+        return await self._to_imagedata(data, mime_type=mime_type)
+
+    async def _read_bounded(self, response: httpx.Response) -> bytes:
+        # Abort as soon as the body is clearly not an image or exceeds the byte budget
+        buffer = bytearray()
+        sniffed = False
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > self.max_size_bytes:
                 raise ValueError("Image too large")
-            mime_type = response.headers.get("content-type", "").split(";")[0].strip()
-            return self._to_imagedata(data, mime_type=mime_type)
+            if not sniffed and len(buffer) >= SNIFF_BYTES:
+                if sniff_format(bytes(buffer[:SNIFF_BYTES])) is None:
+                    raise ValueError("Unsupported image format")
+                sniffed = True
+        if not sniffed and sniff_format(bytes(buffer)) is None:
+            raise ValueError("Unsupported image format")
+        return bytes(buffer)
 
     async def fetch_from_file(self, path: str) -> ImageData:
-        with open(path, "rb") as f:
-            data = f.read()
-        if len(data) > self.max_size_bytes:
+        # Only the header is parsed here; pixels and bytes are mapped in when a consumer needs them
+        file_size = await self.workers.run_io(os.path.getsize, path)
+        if file_size > self.max_size_bytes:
             raise ValueError("Image too large")
-        return self._to_imagedata(data, mime_type=None)
+        probe = await self.workers.run_io(probe_image, path)
+        return LazyImageData(
+            path=path,
+            mime_type=_mime_for(probe.format, None),
+            format=probe.format,
+            file_size_bytes=file_size,
+            width=probe.width,
+            height=probe.height,
+            animated=probe.animated,
+            orientation=probe.orientation,
+        )
 
-    def _to_imagedata(self, data: bytes, mime_type: Optional[str]) -> ImageData:
-        image = Image.open(io.BytesIO(data))
-        image_format = (image.format or "").upper()
-        if image_format not in SUPPORTED_FORMATS:
-            raise ValueError(f"Unsupported image format: {image_format}")
-        width, height = image.size
-        if not mime_type:
-            # Infer mime
-            for k, v in SUPPORTED_MIME.items():
-                if v == image_format:
-                    mime_type = k
-                    break
+    async def _to_imagedata(self, data: bytes, mime_type: Optional[str]) -> ImageData:
+        probe = await self.workers.run_io(probe_image, io.BytesIO(data))
         return ImageData(
             bytes_data=data,
-            mime_type=mime_type or "application/octet-stream",
-            format=image_format,
+            mime_type=_mime_for(probe.format, mime_type),
+            format=probe.format,
             file_size_bytes=len(data),
-            width=width,
-            height=height,
+            width=probe.width,
+            height=probe.height,
+            animated=probe.animated,
+            orientation=probe.orientation,
         )
 
 
+@dataclass
+class ImageProbe:
+    format: str
+    width: int
+    height: int
+    animated: bool = False
+    orientation: int = 1
+
+
+def probe_image(source: Union[str, BinaryIO]) -> ImageProbe:
+    # Image.open only parses the header; nothing here triggers a pixel decode
+    with Image.open(source) as image:
+        image_format = (image.format or "").upper()
+        if image_format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        width, height = image.size
+        # is_animated stops at the second frame; n_frames would seek through the whole animation
+        animated = bool(getattr(image, "is_animated", False))
+        orientation = _exif_orientation(image.info.get("exif"))
+    return ImageProbe(format=image_format, width=width, height=height, animated=animated, orientation=orientation)
+
+
+def _exif_orientation(raw: Optional[bytes]) -> int:
+    # Parse the raw EXIF block ourselves; Image.getexif() can force a full load for some formats
+    if not raw:
+        return 1
+    try:
+        exif = Image.Exif()
+        exif.load(raw)
+        return int(exif.get(EXIF_ORIENTATION_TAG, 1) or 1)
+    except Exception:  # noqa: BLE001
+        return 1
+
+
+def _mime_for(image_format: str, mime_type: Optional[str]) -> str:
+    if not mime_type:
+        # Infer mime
+        for k, v in SUPPORTED_MIME.items():
+            if v == image_format:
+                mime_type = k
+                break
+    return mime_type or "application/octet-stream"
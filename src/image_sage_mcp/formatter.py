@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from .models import AnalysisResult
 
@@ -20,11 +20,15 @@ class ResponseFormatter:
                 "mime_type": analysis.metadata.mime_type,
                 "file_size_bytes": analysis.metadata.file_size_bytes,
                 "format": analysis.metadata.format,
+                **analysis.metadata.extra,
             },
             "processing_time_ms": analysis.processing_time_ms,
             "backend_used": analysis.backend_used,
         }
 
+    def format_batch_response(self, items: List[Dict[str, Any]], summary: Dict[str, Any]) -> Dict[str, Any]:
+        return {"results": items, "summary": summary}
+
     def format_error_response(self, code: str, message: str, details: Dict[str, Any] | None = None) -> Dict[str, Any]:
         tips: Dict[str, Any] = {}
         url = (details or {}).get("url") if isinstance(details, dict) else None
@@ -36,6 +40,12 @@ class ResponseFormatter:
                 tips["http_https_only"] = "Ensure the URL uses http or https and is publicly reachable (no private IPs)."
         if code == "FETCH_ERROR":
             tips["size_limit_mb"] = "Image may exceed size limit. Adjust IMAGE_SAGE_MAX_MB if needed."
+        if code == "BATCH_TOO_LARGE":
+            tips["batch_limit"] = "Split the request or raise IMAGE_SAGE_BATCH_MAX_ITEMS."
+        if code == "STORE_DISABLED":
+            tips["enable_store"] = "Set IMAGE_SAGE_STORE to a SQLite file path; images analyzed from then on become searchable."
+        if code == "OVERLOADED":
+            tips["retry"] = "The server is limiting upstream calls; retry after a short delay or raise IMAGE_SAGE_MAX_CONCURRENCY / IMAGE_SAGE_RATE_RPM."
         if code == "PROCESSING_ERROR":
             tips["try_model"] = "Try a different OPENROUTER_MODEL if the provider rejects data URLs."
         return {
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import bisect
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+def _bucket_bounds(min_ms: float = 5.0, max_ms: float = 120_000.0, per_doubling: int = 4) -> List[float]:
+    # Log-spaced upper bounds (ms): ~19% apart, so percentile estimates are within a bucket's width
+    count = int(math.ceil(math.log2(max_ms / min_ms) * per_doubling))
+    return [min_ms * 2 ** (i / per_doubling) for i in range(count + 1)]
+
+
+LATENCY_BUCKETS_MS = _bucket_bounds()
+
+
+class LatencyHistogram:
+    # Bucketed latency histogram. Counts are halved once `max_samples` is reached so the
+    # percentiles follow the backend's recent behaviour rather than its whole history.
+    def __init__(self, max_samples: int = 1000) -> None:
+        self.max_samples = max_samples
+        self.counts: List[float] = [0.0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        idx = bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000.0)
+        self.counts[idx] += 1
+        self.total += 1
+        if self.total >= self.max_samples:
+            self.counts = [c / 2 for c in self.counts]
+            self.total /= 2
+
+    @property
+    def count(self) -> float:
+        return self.total
+
+    def percentile(self, q: float) -> Optional[float]:
+        # Upper bound (seconds) of the bucket holding the q-th quantile, q in [0, 1]
+        if self.total <= 0:
+            return None
+        target = q * self.total
+        running = 0.0
+        for idx, count in enumerate(self.counts):
+            running += count
+            if running >= target and count > 0:
+                bound = LATENCY_BUCKETS_MS[idx] if idx < len(LATENCY_BUCKETS_MS) else LATENCY_BUCKETS_MS[-1]
+                return bound / 1000.0
+        return LATENCY_BUCKETS_MS[-1] / 1000.0
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": round(self.total, 1),
+            "p50_ms": _ms(self.percentile(0.5)),
+            "p95_ms": _ms(self.percentile(0.95)),
+            "p99_ms": _ms(self.percentile(0.99)),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000.0, 1)
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Client errors that say nothing about the backend's health
+_NEUTRAL_STATUS = {400, 401, 403, 404, 413, 415, 422}
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, backend: str, retry_in: float) -> None:
+        super().__init__(f"Backend '{backend}' circuit is open; retry in {retry_in:.1f}s")
+        self.backend = backend
+        self.retry_in = retry_in
+
+
+@dataclass
+class CircuitSettings:
+    window_seconds: float = 60.0
+    min_requests: int = 5
+    error_rate_threshold: float = 0.5
+    open_seconds: float = 30.0
+    max_open_seconds: float = 300.0
+    slow_call_seconds: Optional[float] = None
+    half_open_max_calls: int = 1
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class BackendHealth:
+    def __init__(self, name: str, settings: Optional[CircuitSettings] = None) -> None:
+        self.name = name
+        self.settings = settings
+        self.latency = LatencyHistogram()
+        # (timestamp, ok, slow) outcomes inside the rolling window
+        self.outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.consecutive_opens = 0
+        self.half_open_inflight = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        if self.settings is None:
+            return
+        horizon = now - self.settings.window_seconds
+        while self.outcomes and self.outcomes[0][0] < horizon:
+            self.outcomes.popleft()
+
+    def allow_request(self) -> bool:
+        if self.settings is None:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+            self.half_open_inflight = 0
+        if self.state == OPEN:
+            self.rejected += 1
+            return False
+        if self.state == HALF_OPEN:
+            # Let a few probe requests through; everyone else keeps skipping this backend
+            if self.half_open_inflight >= self.settings.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self.half_open_inflight += 1
+        return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self.open_until - time.monotonic())
+
+    def release(self) -> None:
+        # A probe that was cancelled (e.g. lost a hedge race) frees its half-open slot
+        if self.state == HALF_OPEN and self.half_open_inflight > 0:
+            self.half_open_inflight -= 1
+
+    def record_success(self, seconds: float) -> None:
+        self.latency.record(seconds)
+        if self.settings is None:
+            return
+        now = time.monotonic()
+        slow = self.settings.slow_call_seconds is not None and seconds >= self.settings.slow_call_seconds
+        self.outcomes.append((now, True, slow))
+        self._trim(now)
+        if self.state == HALF_OPEN:
+            self.release()
+            if not slow:
+                self._close()
+                return
+        self._evaluate(now)
+
+    def record_failure(self, exc: BaseException) -> None:
+        if self.settings is None:
+            return
+        status = _status_code(exc)
+        if status in _NEUTRAL_STATUS:
+            self.release()
+            return
+        now = time.monotonic()
+        self.outcomes.append((now, False, False))
+        self._trim(now)
+        was_half_open = self.state == HALF_OPEN
+        self.release()
+        retry_after = retry_after_seconds(exc)
+        if status == 429 or retry_after is not None:
+            # The upstream told us to back off; honour it even if the error rate is still low
+            self._open(now, retry_after)
+        elif was_half_open:
+            self._open(now)
+        else:
+            self._evaluate(now)
+
+    def _evaluate(self, now: float) -> None:
+        assert self.settings is not None
+        total = len(self.outcomes)
+        if self.state != CLOSED or total < self.settings.min_requests:
+            return
+        failures = sum(1 for _, ok, _ in self.outcomes if not ok)
+        slow = sum(1 for _, _, is_slow in self.outcomes if is_slow)
+        threshold = self.settings.error_rate_threshold
+        if failures / total >= threshold or slow / total >= threshold:
+            self._open(now)
+
+    def _open(self, now: float, duration: Optional[float] = None) -> None:
+        assert self.settings is not None
+        if duration is None:
+            # Exponential backoff across consecutive trips, capped
+            duration = min(self.settings.max_open_seconds, self.settings.open_seconds * 2 ** self.consecutive_opens)
+        else:
+            duration = min(self.settings.max_open_seconds, duration)
+        self.consecutive_opens += 1
+        self.state = OPEN
+        self.open_until = max(self.open_until, now + duration)
+        self.half_open_inflight = 0
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.consecutive_opens = 0
+        self.outcomes.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self.outcomes:
+            errors = sum(1 for _, ok, _ in self.outcomes if not ok)
+            error_rate: Optional[float] = round(errors / len(self.outcomes), 4)
+        else:
+            error_rate = None
+        return {
+            "state": self.state if self.settings is not None else "disabled",
+            "retry_in_s": round(self.retry_in(), 1) if self.state == OPEN else 0.0,
+            "window_requests": len(self.outcomes),
+            "error_rate": error_rate,
+            "rejected": self.rejected,
+            "latency": self.latency.snapshot(),
+        }
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import sys
+from contextlib import contextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterator, Optional
+
+import httpcore
+import httpx
+
+from .models import ServerConfig
+from .validation import DNSResolver
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # type: ignore  # noqa: F401
+    except Exception:  # noqa: BLE001
+        return False
+    return True
+
+
+# httpcore errors to their httpx equivalents, most specific first
+HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+@contextmanager
+def _httpx_errors() -> Iterator[None]:
+    try:
+        yield
+    except Exception as exc:
+        for source, target in HTTPCORE_ERRORS:
+            if isinstance(exc, source):
+                raise target(str(exc)) from exc
+        raise
+
+
+class PinnedNetworkBackend(httpcore.AsyncNetworkBackend):
+    # Every TCP connect re-checks the hostname through the validating resolver and dials only
+    # addresses that passed, so a DNS answer can't change between validation and connect (this
+    # also covers redirect targets). Addresses are tried in order until one accepts.
+    def __init__(self, resolver: DNSResolver, inner: Optional[httpcore.AsyncNetworkBackend] = None) -> None:
+        self.resolver = resolver
+        self.inner = inner or httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Any = None,
+    ) -> httpcore.AsyncNetworkStream:
+        addresses = await self.resolver.resolve_safe(host)
+        if not addresses:
+            raise httpcore.ConnectError(f"Refusing to connect to private or unresolvable host: {host}")
+        last_error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self.inner.connect_tcp(address, port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout, OSError) as exc:
+                last_error = exc
+        assert last_error is not None
+        raise last_error
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options: Any = None) -> httpcore.AsyncNetworkStream:
+        raise httpcore.ConnectError("Unix sockets are not allowed for image fetching")
+
+    async def sleep(self, seconds: float) -> None:
+        await self.inner.sleep(seconds)
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterable[bytes]) -> None:
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _httpx_errors():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self) -> None:
+        close = getattr(self._stream, "aclose", None)
+        if close is not None:
+            await close()
+
+
+class PinnedTransport(httpx.AsyncBaseTransport):
+    # An httpcore connection pool built with the pinned network backend, adapted to httpx. Only
+    # public httpcore API is used; httpx doesn't let a caller choose the network backend.
+    def __init__(self, resolver: DNSResolver, limits: httpx.Limits, http2: bool) -> None:
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=PinnedNetworkBackend(resolver),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host, port=request.url.port, target=request.url.raw_path),
+            headers=request.headers.raw,
+            content=request.stream,  # type: ignore[arg-type]
+            extensions=request.extensions,
+        )
+        with _httpx_errors():
+            response = await self._pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),  # type: ignore[arg-type]
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._pool.aclose()
+
+
+class HTTPClientPool:
+    def __init__(
+        self,
+        timeout_seconds: float,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ) -> None:
+        self.timeout_seconds = timeout_seconds
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not http2_available():
+            sys.stderr.write("[image-sage-mcp] HTTP/2 requested but 'h2' is not installed; using HTTP/1.1\n")
+            sys.stderr.flush()
+            http2 = False
+        self.http2 = http2
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.closed = False
+
+    def get(self, name: str, base_url: str = "", resolver: Optional[DNSResolver] = None) -> httpx.AsyncClient:
+        # One long-lived client per purpose so each upstream keeps its own keep-alive pool
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            if self.closed:
+                raise RuntimeError("HTTP client pool is closed")
+            transport = PinnedTransport(resolver, self.limits, self.http2) if resolver else None
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=self.timeout_seconds,
+                limits=self.limits,
+                http2=self.http2,
+                transport=transport,
+                # Environment proxies would be mounted with their own, unpinned transport
+                trust_env=transport is None,
+            )
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        self.closed = True
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:  # noqa: BLE001
+                pass
+
+
+def pool_from_config(config: ServerConfig) -> HTTPClientPool:
+    return HTTPClientPool(
+        timeout_seconds=config.request_timeout_seconds,
+        max_connections=config.http_max_connections,
+        max_keepalive_connections=config.http_max_keepalive,
+        keepalive_expiry=config.http_keepalive_expiry,
+        http2=config.http2,
+    )
+
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional
+
+from PIL import Image, ImageOps
+
+from .metrics import REGISTRY
+from .microbatch import MicroBatcher
+from .models import AnalysisResult, ImageData, ImageMetadata
+from .processor import VisionBackend, normalize_options
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+
+MODEL_TASKS = ("image-to-text", "image-classification")
+MODEL_ROUTES = ("fallback", "cheap", "primary")
+# Inputs are resized before they reach the model; its processor would do so anyway
+MODEL_INPUT_PX = 384
+MIN_LABEL_SCORE = 0.1
+PERSON_WORDS = re.compile(r"\b(person|people|man|men|woman|women|boy|girl|child|children|kid|kids|player|crowd)\b", re.IGNORECASE)
+
+
+def transformers_available() -> bool:
+    # Checked without importing: torch alone adds hundreds of MB to a server that may never load a model
+    return importlib.util.find_spec("torch") is not None and importlib.util.find_spec("transformers") is not None
+
+
+def model_input(image: ImageData) -> Image.Image:
+    # Worker-side: decode and shrink to the model's input scale; the result is small and picklable
+    with image.open_image() as source:
+        if source.format == "JPEG":
+            source.draft("RGB", (MODEL_INPUT_PX, MODEL_INPUT_PX))
+        source.seek(0)
+        frame = ImageOps.exif_transpose(source).convert("RGB")
+    frame.thumbnail((MODEL_INPUT_PX, MODEL_INPUT_PX), Image.Resampling.BILINEAR)
+    return frame
+
+
+class ModelRunner:
+    # Owns one loaded pipeline and a dedicated single-thread executor: inference never competes
+    # with the image pool for a slot, and torch's own intra-op threads do the parallel work.
+    # Concurrent submissions within the batch window share one forward pass.
+    def __init__(self, task: str, model_id: str, threads: int = 4, max_batch: int = 8, window_seconds: float = 0.01) -> None:
+        self.task = task if task in MODEL_TASKS else "image-to-text"
+        self.model_id = model_id
+        self.threads = max(1, threads)
+        self.max_batch = max(1, max_batch)
+        self.window_seconds = window_seconds
+        self.error: Optional[str] = None
+        self._pipeline: Any = None
+        self._torch: Any = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loading: Optional["asyncio.Future[None]"] = None
+        self.batcher: MicroBatcher[Image.Image, Any] = MicroBatcher(self._run_batch, max_items=self.max_batch, window_seconds=window_seconds)
+
+    def matches(self, task: str, model_id: str, threads: int, max_batch: int, window_seconds: float) -> bool:
+        current = (self.task, self.model_id, self.threads, self.max_batch, self.window_seconds)
+        return current == (task, model_id, max(1, threads), max(1, max_batch), window_seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self._pipeline is not None
+
+    def _executor_for(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-sage-model")
+        return self._executor
+
+    def _load(self) -> None:
+        import torch
+        from transformers import pipeline
+
+        torch.set_num_threads(self.threads)
+        self._torch = torch
+        self._pipeline = pipeline(self.task, model=self.model_id, device=-1)
+
+    async def preload(self) -> bool:
+        # Loads once; concurrent callers wait on the same load. A failed load is remembered so
+        # requests fall through to the next backend instead of retrying a multi-GB download
+        if self.ready or self.error is not None:
+            return self.ready
+        if not transformers_available():
+            self.error = "transformers/torch not installed"
+            return False
+        if self._loading is None:
+            self._loading = asyncio.get_running_loop().run_in_executor(self._executor_for(), self._load)
+        started = time.perf_counter()
+        try:
+            await asyncio.shield(self._loading)
+        except Exception as exc:  # noqa: BLE001
+            self.error = f"{type(exc).__name__}: {exc}"
+            sys.stderr.write(f"[image-sage-mcp] local model {self.model_id} failed to load: {self.error}\n")
+            sys.stderr.flush()
+            return False
+        REGISTRY.inc("image_sage_model_load_seconds_total", time.perf_counter() - started, help="Time spent loading local models", model=self.model_id)
+        return True
+
+    def _forward(self, inputs: List[Image.Image]) -> List[Any]:
+        with self._torch.inference_mode():
+            outputs = self._pipeline(inputs, batch_size=len(inputs))
+        return list(outputs)
+
+    async def _run_batch(self, _key: Hashable, inputs: List[Image.Image]) -> List[Any]:
+        REGISTRY.inc("image_sage_model_batches_total", help="Local model forward passes", model=self.model_id)
+        REGISTRY.inc("image_sage_model_images_total", len(inputs), help="Images run through the local model", model=self.model_id)
+        return await asyncio.get_running_loop().run_in_executor(self._executor_for(), self._forward, inputs)
+
+    async def infer(self, frame: Image.Image) -> Optional[Any]:
+        if not await self.preload():
+            return None
+        return await self.batcher.submit(self.task, frame)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pipeline = None
+        self._torch = None
+
+
+def _label(raw: str) -> str:
+    # ImageNet-style labels list synonyms: "tabby, tabby cat"
+    return raw.split(",")[0].strip()
+
+
+def result_from_output(task: str, output: Any, image: ImageData, backend: str, model: str, elapsed_ms: int) -> AnalysisResult:
+    # Per image, captioners return [{"generated_text": ...}] and classifiers the top-k [{"label", "score"}, ...]
+    entries = [o for o in (output if isinstance(output, list) else [output]) if isinstance(o, dict)]
+    objects: List[str] = []
+    if task == "image-classification":
+        objects = [_label(str(o.get("label", ""))) for o in entries if float(o.get("score", 0.0)) >= MIN_LABEL_SCORE]
+        confidence = float(entries[0].get("score", 0.0)) if entries else 0.0
+        description = f"Likely {', '.join(objects[:3])}" if objects else ""
+    else:
+        description = str(entries[0].get("generated_text", "")).strip() if entries else ""
+        # Captioners don't score their output; rank below remote models but above the heuristics
+        confidence = 0.5 if description else 0.0
+    return AnalysisResult(
+        contains_person=bool(PERSON_WORDS.search(description)) or any(PERSON_WORDS.search(o) for o in objects),
+        objects_detected=[o for o in objects if o],
+        scene_type="unknown",
+        description=description,
+        ocr_text="",
+        confidence=round(confidence, 3),
+        metadata=ImageMetadata(
+            width=image.width or 0,
+            height=image.height or 0,
+            mime_type=image.mime_type,
+            file_size_bytes=image.file_size_bytes,
+            format=image.format,
+            extra={"model": model},
+        ),
+        processing_time_ms=elapsed_ms,
+        backend_used=backend,
+    )
+
+
+def is_cheap(options: Optional[Dict[str, Any]]) -> bool:
+    # The model can't read text, and high detail is a request for more than a caption
+    normalized = normalize_options(options)
+    return not normalized["include_ocr"] and normalized["detail_level"] != "high"
+
+
+class HuggingFaceBackend(VisionBackend):
+    name = "hf"
+
+    def __init__(self, runner: ModelRunner, workers: Optional[ImageWorkerPool] = None, cheap_only: bool = False, fallback_only: bool = False) -> None:
+        self.runner = runner
+        self.model = runner.model_id
+        self.workers = workers
+        self.cheap_only = cheap_only
+        self.fallback_only = fallback_only
+        self.route = "cheap" if cheap_only else "fallback" if fallback_only else "primary"
+
+    @property
+    def health_key(self) -> str:
+        # The cheap-only and fallback-only instances share a model but must not share a circuit
+        return f"{self.name}:{self.model}:{self.route}"
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        if self.cheap_only and not is_cheap(options):
+            # Declining hands the request to the next backend without counting as a failure
+            return None
+        start = time.perf_counter()
+        if not await self.runner.preload():
+            return None
+        frame = await (self.workers or INLINE_WORKERS).run_image(model_input, image)
+        output = await self.runner.infer(frame)
+        if output is None:
+            return None
+        result = result_from_output(self.runner.task, output, image, self.name, self.model, int((time.perf_counter() - start) * 1000))
+        if self.fallback_only:
+            result.metadata.extra["route"] = "fallback"
+        return result if result.description or result.objects_detected else None
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import ExifTags, Image, ImageChops, ImageFilter, ImageOps, ImageStat
+
+from .cache import image_digest
+from .models import AnalysisResult, ImageData, ImageMetadata
+from .processor import VisionBackend, normalize_options
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+
+# Features are computed on a thumbnail; enough for colour and edge statistics
+SAMPLE_SIZE = 256
+SOLID_STDDEV = 3.0
+LAPLACIAN = ImageFilter.Kernel((3, 3), [-1, -1, -1, -1, 8, -1, -1, -1, -1], scale=1, offset=128)
+EDGE_THRESHOLD = 32
+# Glyph strokes on a flat background give near-saturated edge responses
+STRONG_EDGE_THRESHOLD = 96
+# text_likelihood below this means no text was found at all
+TEXT_PRESENT = 0.05
+# Straight edge runs at least this long (sample pixels) are shape outlines, not glyphs
+LINE_RUN = 12
+FLAT_EDGE_THRESHOLD = 1
+# Palette sizes above this on a nearest-neighbour sample look like a photograph
+FLAT_PALETTE_COLORS = 1024
+SCREEN_RATIOS = (16 / 9, 16 / 10, 4 / 3, 3 / 2, 9 / 16, 10 / 16, 3 / 4, 9 / 19.5, 19.5 / 9)
+CAMERA_TAGS = ("Make", "Model", "LensModel", "ExposureTime", "FNumber", "ISOSpeedRatings")
+EXIF_KEEP = ("Make", "Model", "LensModel", "Software", "DateTime", "DateTimeOriginal", "ExposureTime", "FNumber", "ISOSpeedRatings", "FocalLength")
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+
+@dataclass
+class LocalFeatures:
+    width: int
+    height: int
+    dominant_colors: List[Dict[str, Any]]
+    solid: bool
+    blank: bool
+    edge_density: float
+    flat_ratio: float
+    palette_colors: Optional[int]
+    text_likelihood: float
+    screenshot_score: float
+    kind: str
+    exif: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("width")
+        data.pop("height")
+        data["edge_density"] = round(self.edge_density, 4)
+        data["flat_ratio"] = round(self.flat_ratio, 4)
+        data["text_likelihood"] = round(self.text_likelihood, 3)
+        data["screenshot_score"] = round(self.screenshot_score, 3)
+        return data
+
+
+def _exif_summary(source: Image.Image) -> Dict[str, Any]:
+    try:
+        exif = source.getexif()
+    except Exception:  # noqa: BLE001
+        return {}
+    if not exif:
+        return {}
+    tags: Dict[str, Any] = {}
+    merged = dict(exif)
+    try:
+        merged.update(exif.get_ifd(EXIF_IFD_POINTER))
+    except Exception:  # noqa: BLE001
+        pass
+    for tag_id, value in merged.items():
+        name = ExifTags.TAGS.get(tag_id)
+        if name not in EXIF_KEEP:
+            continue
+        if isinstance(value, bytes):
+            continue
+        tags[name] = value if isinstance(value, (int, str)) else str(value)
+    # Report that location data exists without echoing coordinates back
+    if GPS_IFD_POINTER in exif:
+        tags["has_gps"] = True
+    return tags
+
+
+def _dominant_colors(rgb: Image.Image, count: int = 5) -> List[Dict[str, Any]]:
+    quantized = rgb.quantize(colors=count, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette() or []
+    colors = sorted(quantized.getcolors() or [], reverse=True)
+    total = sum(n for n, _ in colors) or 1
+    result = []
+    for n, index in colors:
+        r, g, b = palette[index * 3 : index * 3 + 3]
+        result.append({"hex": f"#{r:02x}{g:02x}{b:02x}", "share": round(n / total, 3)})
+    return result
+
+
+def _edge_histogram(gray: Image.Image) -> List[int]:
+    # Absolute Laplacian response; FIND_EDGES alone clips the negative half to zero. Kernel
+    # filters leave the outermost pixels unfiltered (raw grey levels, which read as strong
+    # edges on white or black), so that 1px border is cropped off
+    width, height = gray.size
+    if width < 3 or height < 3:
+        return [width * height] + [0] * 255
+    laplacian = gray.filter(LAPLACIAN).crop((1, 1, width - 1, height - 1))
+    return ImageChops.difference(laplacian, Image.new("L", laplacian.size, 128)).histogram()
+
+
+def _shift(mask: Image.Image, dx: int, dy: int) -> Image.Image:
+    moved = Image.new("L", mask.size, 0)
+    moved.paste(mask, (dx, dy))
+    return moved
+
+
+def _long_runs(mask: Image.Image, dx: int, dy: int) -> Image.Image:
+    # Morphological opening with a LINE_RUN-long line: keeps only edge pixels that are part of a
+    # straight horizontal (dx) or vertical (dy) run at least that long
+    starts = mask
+    for step in range(1, LINE_RUN):
+        starts = ImageChops.darker(starts, _shift(mask, -dx * step, -dy * step))
+    runs = starts
+    for step in range(1, LINE_RUN):
+        runs = ImageChops.lighter(runs, _shift(starts, dx * step, dy * step))
+    return runs
+
+
+def _strong_edges(gray: Image.Image) -> Tuple[int, int]:
+    # Strong edge pixels, and how many of them are not part of long straight lines. Glyph strokes
+    # are short; the borders of boxes, panels and table rules are not and say nothing about text
+    width, height = gray.size
+    if width < 3 or height < 3:
+        return 0, 0
+    laplacian = gray.filter(LAPLACIAN).crop((1, 1, width - 1, height - 1))
+    magnitude = ImageChops.difference(laplacian, Image.new("L", laplacian.size, 128))
+    mask = magnitude.point(lambda v: 255 if v >= STRONG_EDGE_THRESHOLD else 0)
+    strong = mask.histogram()[255]
+    lines = ImageChops.lighter(_long_runs(mask, 1, 0), _long_runs(mask, 0, 1))
+    return strong, strong - ImageChops.darker(mask, lines).histogram()[255]
+
+
+def _screen_ratio(width: int, height: int) -> bool:
+    if not width or not height:
+        return False
+    ratio = width / height
+    return any(abs(ratio - r) / r < 0.02 for r in SCREEN_RATIOS)
+
+
+def extract_features(image: ImageData) -> LocalFeatures:
+    with image.open_image() as source:
+        exif = _exif_summary(source)
+        if source.format == "JPEG":
+            source.draft("RGB", (SAMPLE_SIZE, SAMPLE_SIZE))
+        source.seek(0)
+        frame = ImageOps.exif_transpose(source)
+        has_alpha = frame.mode in ("RGBA", "LA") or (frame.mode == "P" and "transparency" in frame.info)
+        frame = frame.convert("RGBA" if has_alpha else "RGB")
+        # Nearest-neighbour keeps the real palette and hard edges; the smooth thumbnail is for statistics
+        nearest = frame.resize(_fit(frame.size), Image.Resampling.NEAREST)
+        frame.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.BILINEAR)
+
+    width, height = image.width or 0, image.height or 0
+    transparent = has_alpha and frame.getchannel("A").getextrema()[1] == 0
+    rgb = frame.convert("RGB")
+    gray = rgb.convert("L")
+    stddev = max(ImageStat.Stat(rgb).stddev)
+    solid = transparent or stddev < SOLID_STDDEV
+    mean = ImageStat.Stat(gray).mean[0]
+    blank = transparent or (solid and (mean > 245 or mean < 10))
+
+    # Edges on the unsmoothed sample: flat UI areas stay exactly flat, photo noise doesn't
+    sample = nearest.convert("L")
+    edges = _edge_histogram(sample)
+    pixels = sum(edges) or 1
+    edge_density = sum(edges[EDGE_THRESHOLD:]) / pixels
+    _, short_strong = _strong_edges(sample)
+    strong_density = short_strong / pixels
+    flat_ratio = sum(edges[:FLAT_EDGE_THRESHOLD]) / pixels
+    palette = nearest.convert("RGB").getcolors(maxcolors=FLAT_PALETTE_COLORS)
+    palette_colors = len(palette) if palette is not None else None
+
+    camera = any(tag in exif for tag in CAMERA_TAGS)
+    score = 0.0
+    if palette_colors is not None:
+        score += 0.35
+    if flat_ratio > 0.5:
+        score += 0.2
+    if image.format in ("PNG", "WEBP", "GIF"):
+        score += 0.15
+    if not camera:
+        score += 0.15
+    if _screen_ratio(width, height):
+        score += 0.15
+    # Text shows up as short, sharp edges on flat backgrounds; a couple of UI labels is enough to count
+    text_likelihood = min(1.0, max(0.0, (strong_density - 0.001) / 0.03)) * min(1.0, flat_ratio * 2)
+
+    if blank:
+        kind = "blank"
+    elif solid:
+        kind = "solid_color"
+    elif camera or (palette_colors is None and flat_ratio < 0.3):
+        kind = "photo"
+    elif score >= 0.6 and text_likelihood >= TEXT_PRESENT:
+        # Flat, lossless and screen-shaped but without any text is a diagram or illustration
+        kind = "screenshot"
+    else:
+        kind = "graphic"
+
+    return LocalFeatures(
+        width=width,
+        height=height,
+        dominant_colors=_dominant_colors(rgb),
+        solid=solid,
+        blank=blank,
+        edge_density=edge_density,
+        flat_ratio=flat_ratio,
+        palette_colors=palette_colors,
+        text_likelihood=text_likelihood,
+        screenshot_score=min(1.0, score),
+        kind=kind,
+        exif=exif,
+    )
+
+
+def _fit(size: Tuple[int, int]) -> Tuple[int, int]:
+    width, height = size
+    scale = min(1.0, SAMPLE_SIZE / max(width, height, 1))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def describe(features: LocalFeatures) -> str:
+    size = f"{features.width}x{features.height}"
+    colors = ", ".join(c["hex"] for c in features.dominant_colors[:3])
+    if features.blank:
+        return f"Blank {size} image"
+    if features.solid:
+        return f"Solid {colors} {size} image"
+    label = {"photo": "Photograph", "screenshot": "Screenshot or UI capture", "graphic": "Graphic"}.get(features.kind, "Image")
+    text = " with likely text" if features.text_likelihood >= 0.5 else ""
+    return f"{label}{text}, {size}, dominant colors {colors}"
+
+
+class LocalFeatureCache:
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Optional[LocalFeatures]]" = OrderedDict()
+
+    async def get(self, image: ImageData, workers: Optional[ImageWorkerPool] = None) -> Optional[LocalFeatures]:
+        workers = workers or INLINE_WORKERS
+        digest = await workers.run_io(image_digest, image)
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            return self._entries[digest]
+        try:
+            features = await workers.run_image(extract_features, image)
+        except Exception:  # noqa: BLE001
+            features = None
+        self._entries[digest] = features
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return features
+
+
+class LocalBackend(VisionBackend):
+    # Pillow-only analysis: no objects or OCR, but real colours, kind and EXIF instead of empties
+    name = "local"
+    fallback_only = True
+
+    def __init__(self, features: Optional[LocalFeatureCache] = None, workers: Optional[ImageWorkerPool] = None) -> None:
+        self.features = features or LocalFeatureCache()
+        self.workers = workers
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        start = time.perf_counter()
+        features = await self.features.get(image, self.workers)
+        if features is None:
+            return None
+        return local_result(image, features, int((time.perf_counter() - start) * 1000))
+
+
+def local_result(image: ImageData, features: LocalFeatures, elapsed_ms: int = 0) -> AnalysisResult:
+    trivial = features.blank or features.solid
+    return AnalysisResult(
+        contains_person=False,
+        objects_detected=[],
+        scene_type=features.kind,
+        description=describe(features),
+        ocr_text="",
+        confidence=0.9 if trivial else 0.3,
+        metadata=ImageMetadata(
+            width=image.width or 0,
+            height=image.height or 0,
+            mime_type=image.mime_type,
+            file_size_bytes=image.file_size_bytes,
+            format=image.format,
+            extra={"local": features.as_dict()},
+        ),
+        processing_time_ms=elapsed_ms,
+        backend_used=LocalBackend.name,
+    )
+
+
+@dataclass
+class GateDecision:
+    options: Dict[str, Any]
+    answer_locally: bool = False
+    reasons: List[str] = field(default_factory=list)
+
+
+def plan_analysis(features: LocalFeatures, options: Optional[Dict[str, Any]], min_pixels: int) -> GateDecision:
+    tuned = normalize_options(options)
+    decision = GateDecision(options=tuned)
+    if features.blank or features.solid:
+        decision.answer_locally = True
+        decision.reasons.append(features.kind)
+        return decision
+    # By area, so a thin banner or scanline strip with a long readable side still goes upstream
+    if features.width * features.height < min_pixels * min_pixels:
+        decision.answer_locally = True
+        decision.reasons.append("tiny")
+        return decision
+    # Photo texture hides text from the edge heuristic, so only flat images lose OCR
+    if tuned["include_ocr"] and features.kind != "photo" and features.text_likelihood < TEXT_PRESENT:
+        tuned["include_ocr"] = False
+        decision.reasons.append("no_text_detected")
+    if tuned["include_ocr"] and features.text_likelihood >= 0.5 and tuned["detail_level"] == "low":
+        # Text at the low-detail upload size is often illegible
+        tuned["detail_level"] = "medium"
+        decision.reasons.append("text_needs_detail")
+    if max(features.width, features.height) <= SAMPLE_SIZE and tuned["detail_level"] != "low":
+        # A higher detail level can't add pixels that aren't there
+        tuned["detail_level"] = "low"
+        decision.reasons.append("small_image")
+    return decision
+
+
+def enrich_result(analysis: AnalysisResult, features: LocalFeatures, decision: Optional[GateDecision] = None) -> AnalysisResult:
+    extra = {**analysis.metadata.extra, "local": features.as_dict()}
+    if decision is not None and decision.reasons:
+        extra["gate"] = {"options": decision.options, "reasons": decision.reasons}
+    scene_type = analysis.scene_type
+    if not scene_type or scene_type == "unknown":
+        scene_type = features.kind
+    return replace(analysis, scene_type=scene_type, metadata=replace(analysis.metadata, extra=extra))
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextvars
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from opentelemetry import trace as otel_trace  # type: ignore
+except Exception:  # noqa: BLE001
+    otel_trace = None  # type: ignore[assignment]
+
+
+# Prometheus histogram bounds in seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns (metric name, type, help, [(labels, value)]) tuples at scrape time
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+def _labels(values: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+@dataclass
+class _Histogram:
+    counts: List[int] = field(default_factory=lambda: [0] * (len(STAGE_BUCKETS) + 1))
+    total: float = 0.0
+    count: int = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: Dict[str, Collector] = {}
+
+    def inc(self, name: str, amount: float = 1.0, help: str = "", **labels: Any) -> None:
+        series = self._counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0.0) + amount
+        if help:
+            self._help.setdefault(name, help)
+
+    def observe(self, name: str, seconds: float, help: str = "", **labels: Any) -> None:
+        series = self._histograms.setdefault(name, {})
+        key = _labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = _Histogram()
+        histogram.observe(seconds)
+        if help:
+            self._help.setdefault(name, help)
+
+    def counter_value(self, name: str, **labels: Any) -> float:
+        return self._counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def set_collector(self, key: str, collector: Collector) -> None:
+        # Keyed so a reloaded context replaces its predecessor's collector
+        self._collectors[key] = collector
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self._counters.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, hseries in sorted(self._histograms.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(hseries.items()):
+                running = 0
+                for bound, count in zip(STAGE_BUCKETS, histogram.counts):
+                    running += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {running}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        # Collectors may report the same family more than once (one entry per controller, or
+        # from several collectors); the exposition format allows one HELP/TYPE block per name
+        grouped: Dict[str, Tuple[str, str, List[Tuple[Dict[str, Any], float]]]] = {}
+        for collector in list(self._collectors.values()):
+            try:
+                families = collector()
+            except Exception:  # noqa: BLE001
+                continue
+            for name, kind, help_text, samples in families:
+                grouped.setdefault(name, (kind, help_text, []))[2].extend(samples)
+        for name, (kind, help_text, samples) in grouped.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels_dict, value in samples:
+                lines.append(f"{name}{_format_labels(_labels(labels_dict))} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@dataclass
+class _Span:
+    stage: str
+    started_at: float
+    duration: float
+    attributes: Dict[str, Any]
+
+
+class RequestTrace:
+    # Per-call record of stage timings; reached through a context variable so the fetcher,
+    # backends and worker pool can add to it without threading it through every signature
+    def __init__(self, tool: str) -> None:
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.spans: List[_Span] = []
+
+    def add(self, stage: str, started_at: float, duration: float, attributes: Dict[str, Any]) -> None:
+        self.spans.append(_Span(stage, started_at, duration, attributes))
+
+    def stage_totals_ms(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.stage] = totals.get(span.stage, 0.0) + span.duration * 1000.0
+        totals = {k: round(v, 1) for k, v in totals.items()}
+        totals["total"] = round((time.perf_counter() - self.started) * 1000.0, 1)
+        return totals
+
+
+_CURRENT: "contextvars.ContextVar[Optional[RequestTrace]]" = contextvars.ContextVar("image_sage_trace", default=None)
+_OTEL_ENABLED = False
+
+
+def enable_opentelemetry(enabled: bool) -> bool:
+    global _OTEL_ENABLED
+    _OTEL_ENABLED = enabled and otel_trace is not None
+    return _OTEL_ENABLED
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def request_trace(tool: str) -> Iterator[RequestTrace]:
+    trace = RequestTrace(tool)
+    token = _CURRENT.set(trace)
+    try:
+        if _OTEL_ENABLED:
+            with otel_trace.get_tracer("image_sage_mcp").start_as_current_span(f"image_sage.{tool}"):
+                yield trace
+        else:
+            yield trace
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    # Times a pipeline stage into the request trace, the stage histogram and (if enabled) an
+    # OpenTelemetry span. Callers may add attributes to the yielded dict while the stage runs.
+    attrs = dict(attributes)
+    span_cm = otel_trace.get_tracer("image_sage_mcp").start_as_current_span(f"image_sage.{name}") if _OTEL_ENABLED else None
+    span = span_cm.__enter__() if span_cm is not None else None
+    start = time.perf_counter()
+    outcome = "ok"
+    error: Optional[BaseException] = None
+    try:
+        yield attrs
+    except asyncio.CancelledError as exc:
+        # Lost a hedge race or the caller went away
+        outcome = "cancelled"
+        error = exc
+        raise
+    except BaseException as exc:
+        outcome = "error"
+        error = exc
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        attrs.setdefault("outcome", outcome)
+        trace = _CURRENT.get()
+        if trace is not None:
+            trace.add(name, start, duration, attrs)
+        label_attrs = {k: v for k, v in attrs.items() if k in ("backend", "outcome", "source", "job")}
+        REGISTRY.observe("image_sage_stage_seconds", duration, help="Time spent per pipeline stage", stage=name, **label_attrs)
+        if span is not None:
+            for key, value in attrs.items():
+                if isinstance(value, (str, bool, int, float)):
+                    span.set_attribute(f"image_sage.{key}", value)
+            if error is not None:
+                span_cm.__exit__(type(error), error, error.__traceback__)
+            else:
+                span_cm.__exit__(None, None, None)
+
+
+def count_bytes(direction: str, amount: int, **labels: Any) -> None:
+    # "in": image bytes fetched or read; "out": request bytes uploaded to a backend
+    help_text = "Image bytes fetched or read" if direction == "in" else "Request bytes uploaded to vision backends"
+    REGISTRY.inc(f"image_sage_bytes_{direction}_total", amount, help=help_text, **labels)
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        # Drain the headers; the body (if any) is ignored
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            status = "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+            content_type = "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                "latin-1"
+            )
+            + body
+        )
+        await writer.drain()
+    except Exception:  # noqa: BLE001
+        pass
+    finally:
+        writer.close()
+
+
+@asynccontextmanager
+async def metrics_server(host: str, port: int) -> AsyncIterator[Optional[asyncio.AbstractServer]]:
+    if port <= 0:
+        yield None
+        return
+    server = await asyncio.start_server(_serve_metrics, host, port)
+    try:
+        yield server
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from .models import AnalysisResult, ImageData
+from .processor import OpenRouterBackend, VisionBackend, normalize_options
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Handler receives the group key and the items, and returns one result (or exception) per item
+BatchHandler = Callable[[Hashable, List[T]], Awaitable[List[Any]]]
+
+
+@dataclass
+class _PendingGroup(Generic[T]):
+    items: List[Tuple[T, "asyncio.Future[Any]"]] = field(default_factory=list)
+    cost: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher(Generic[T, R]):
+    # Collects concurrent submissions per key for up to `window_seconds` and hands them to the
+    # handler together; a group is flushed early once it reaches `max_items` or `max_cost`.
+    def __init__(self, handler: BatchHandler, max_items: int, window_seconds: float, max_cost: Optional[int] = None) -> None:
+        self.handler = handler
+        self.max_items = max(1, max_items)
+        self.window_seconds = window_seconds
+        self.max_cost = max_cost
+        self._groups: Dict[Hashable, _PendingGroup[T]] = {}
+        self._tasks: "set[asyncio.Task[None]]" = set()
+
+    async def submit(self, key: Hashable, item: T, cost: int = 0) -> R:
+        loop = asyncio.get_running_loop()
+        group = self._groups.get(key)
+        # An item that would push the group over budget goes out in the next batch instead
+        if group is not None and self.max_cost is not None and group.items and group.cost + cost > self.max_cost:
+            self._flush(key)
+            group = None
+        if group is None:
+            group = _PendingGroup()
+            self._groups[key] = group
+            group.timer = loop.call_later(self.window_seconds, self._flush, key)
+        future: "asyncio.Future[Any]" = loop.create_future()
+        group.items.append((item, future))
+        group.cost += cost
+        if len(group.items) >= self.max_items or (self.max_cost is not None and group.cost >= self.max_cost):
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        if group.timer is not None:
+            group.timer.cancel()
+        task = asyncio.ensure_future(self._run(key, group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, group: _PendingGroup[T]) -> None:
+        pending = [(item, fut) for item, fut in group.items if not fut.cancelled()]
+        if not pending:
+            return
+        try:
+            results = await self.handler(key, [item for item, _ in pending])
+            if len(results) != len(pending):
+                raise RuntimeError(f"Batch handler returned {len(results)} results for {len(pending)} items")
+        except Exception as exc:  # noqa: BLE001
+            results = [exc] * len(pending)
+        for (_, fut), result in zip(pending, results):
+            if fut.done():
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+
+class BatchingOpenRouterBackend(VisionBackend):
+    # Packs concurrent single-image requests into multi-image completions
+    def __init__(self, inner: OpenRouterBackend, max_images: int, window_seconds: float, max_bytes: int) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.model = inner.model
+        self.upload_profile = inner.upload_profile
+        self.batcher: MicroBatcher[ImageData, AnalysisResult] = MicroBatcher(
+            self._handle, max_items=max_images, window_seconds=window_seconds, max_cost=max_bytes
+        )
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        normalized = normalize_options(options)
+        key = (normalized["include_ocr"], normalized["detail_level"])
+        # Preparing here sizes the upload for the byte budget; the result is reused from the preparer cache
+        cost = len((await self.inner.prepare(image, normalized)).data)
+        return await self.batcher.submit(key, image, cost)
+
+    async def _handle(self, key: Hashable, images: List[ImageData]) -> List[Any]:
+        include_ocr, detail_level = key  # type: ignore[misc]
+        options = {"include_ocr": include_ocr, "detail_level": detail_level}
+        if len(images) == 1:
+            return [await self.inner.analyze(images[0], options)]
+        try:
+            return list(await self.inner.analyze_many(images, options))
+        except RuntimeError:
+            # Malformed or short multi-image answer: fall back to one request per image
+            return list(
+                await asyncio.gather(*(self.inner.analyze(image, options) for image in images), return_exceptions=True)
+            )
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import io
+import mmap
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+from PIL import Image
 
 
 @dataclass
@@ -11,6 +15,7 @@ class ImageMetadata:
     mime_type: str
     file_size_bytes: int
     format: str
+    extra: Dict[str, Any] = field(default_factory=dict)
 
 
 @dataclass
@@ -34,8 +39,75 @@ class ServerConfig:
     request_timeout_seconds: int = 10
     cache_enabled: bool = True
     cache_ttl_seconds: int = 3600
+    cache_max_mb: int = 64
+    cache_dir: Optional[str] = None
+    cache_disk_max_mb: int = 512
+    store_path: Optional[str] = None
+    store_batch_size: int = 64
+    store_flush_ms: int = 500
+    phash_enabled: bool = True
+    phash_max_distance: int = 4
+    phash_max_entries: int = 10000
+    local_analysis: bool = True
+    local_min_px: int = 16
+    tiling_enabled: bool = False
+    tile_px: int = 1024
+    tile_overlap: float = 0.1
+    tile_max: int = 16
+    tile_min_px: int = 2048
+    tile_concurrency: int = 4
+    tile_timeout_seconds: int = 10
+    hf_model: str = ""
+    hf_task: str = "image-to-text"
+    hf_route: str = "fallback"
+    hf_threads: int = 4
+    hf_batch_size: int = 8
+    hf_batch_window_ms: int = 10
+    worker_mode: str = "thread"
+    worker_count: int = 4
+    worker_queue: int = 16
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    otel_enabled: bool = False
+    response_timings: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2: bool = False
+    dns_cache_ttl_seconds: float = 60.0
+    dns_cache_size: int = 1024
+    execution_strategy: str = "sequential"
+    hedge_percentile: float = 0.95
+    hedge_min_ms: int = 100
+    hedge_max_ms: int = 5000
+    hedge_default_ms: int = 2000
+    circuit_enabled: bool = True
+    circuit_window_seconds: int = 60
+    circuit_min_requests: int = 5
+    circuit_error_rate: float = 0.5
+    circuit_open_seconds: int = 30
+    circuit_max_open_seconds: int = 300
+    circuit_slow_ms: int = 0
+    max_concurrency: int = 0
+    rate_limit_rpm: int = 0
+    rate_limit_tpm: int = 0
+    queue_timeout_ms: int = 2000
+    openrouter_batch_size: int = 1
+    openrouter_batch_window_ms: int = 50
+    openrouter_batch_max_mb: int = 8
+    openrouter_stream: bool = False
+    max_output_tokens: int = 0
+    batch_max_items: int = 100
+    batch_concurrency: int = 4
+    preprocess_enabled: bool = True
+    upload_format: str = "JPEG"
+    upload_quality: int = 85
+    upload_max_dimensions: Dict[str, int] = field(default_factory=lambda: {"low": 512, "medium": 1024, "high": 2048})
     log_level: str = "INFO"
     openrouter_model: str = "openai/gpt-4o-mini"
+    openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    # Testing only: lets URLs resolve to loopback/private addresses (local mock servers)
+    allow_private_urls: bool = False
     allowed_fs_roots: List[str] = None  # set at load time
 
 
@@ -47,5 +119,104 @@ class ImageData:
     file_size_bytes: int
     width: Optional[int] = None
     height: Optional[int] = None
+    content_hash: Optional[str] = None
+    animated: bool = False
+    orientation: int = 1
+
+    @property
+    def buffer(self) -> Union[bytes, mmap.mmap]:
+        # Bytes-like view for hashing/encoding without forcing a copy
+        return self.bytes_data
+
+    def read_bytes(self) -> bytes:
+        return self.bytes_data
+
+    def open_image(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.bytes_data))
+
+    def retain(self) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+class LazyImageData(ImageData):
+    # File-backed ImageData: `bytes_data` stays empty; `buffer` memory-maps the file and
+    # `read_bytes()` copies it, both only when a consumer needs them. Requests sharing the image
+    # retain() it and release() it when done; the last release unmaps the file, so a mapping
+    # never outlives the requests using it (a file truncated while mapped faults on access).
+    def __init__(
+        self,
+        path: str,
+        mime_type: str,
+        format: str,
+        file_size_bytes: int,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        animated: bool = False,
+        orientation: int = 1,
+    ) -> None:
+        super().__init__(
+            bytes_data=b"",
+            mime_type=mime_type,
+            format=format,
+            file_size_bytes=file_size_bytes,
+            width=width,
+            height=height,
+            animated=animated,
+            orientation=orientation,
+        )
+        self.path = path
+        self.users = 0
+        self._mmap: Optional[mmap.mmap] = None
+        self._bytes: Optional[bytes] = None
+
+    @property
+    def buffer(self) -> Union[bytes, mmap.mmap]:
+        if self._bytes is not None:
+            return self._bytes
+        if self._mmap is None or self._mmap.closed:
+            with open(self.path, "rb") as f:
+                # Never more than the size checked at fetch time; a file that shrank since fails here
+                self._mmap = mmap.mmap(f.fileno(), self.file_size_bytes, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read_bytes(self) -> bytes:
+        if self._bytes is None:
+            self._bytes = bytes(self.buffer)
+        return self._bytes
+
+    @property
+    def loaded(self) -> bool:
+        return self._bytes is not None or (self._mmap is not None and not self._mmap.closed)
+
+    def open_image(self) -> Image.Image:
+        return Image.open(self.path)
+
+    def retain(self) -> None:
+        self.users += 1
+
+    def release(self) -> None:
+        self.users = max(0, self.users - 1)
+        if self.users == 0:
+            self.close()
+
+    def close(self) -> None:
+        self._bytes = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A memoryview of the mapping is still alive; the mapping goes when it is collected
+                return
+            self._mmap = None
 
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, LazyImageData) and other.path == self.path and other.file_size_bytes == self.file_size_bytes
 
+    def __repr__(self) -> str:
+        return (
+            f"LazyImageData(path={self.path!r}, format={self.format!r}, "
+            f"size={self.width}x{self.height}, file_size_bytes={self.file_size_bytes})"
+        )
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import base64
+import json
+import mmap
+from typing import Any, AsyncIterator, Dict, List, Sequence, Union
+
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# Raw bytes per base64 chunk; a multiple of 3 so chunks concatenate without padding
+B64_CHUNK_BYTES = 3 * 64 * 1024
+
+
+def image_placeholder(index: int) -> str:
+    return f"__IMAGE_SAGE_IMAGE_{index}__"
+
+
+def data_uri_placeholder(mime_type: str, index: int) -> str:
+    return f"data:{mime_type};base64,{image_placeholder(index)}"
+
+
+def base64_length(size: int) -> int:
+    return 4 * ((size + 2) // 3)
+
+
+# The payload is serialized once with short placeholders where the image data goes; image
+# bytes are then base64-encoded chunk by chunk straight into the request stream, so neither
+# the full base64 string nor the full JSON document is ever held in memory.
+class StreamingJSONBody:
+    def __init__(self, payload: Dict[str, Any], images: Sequence[Buffer]) -> None:
+        document = json.dumps(payload, separators=(",", ":"), ensure_ascii=True)
+        self._segments: List[bytes] = []
+        self._images: List[Buffer] = list(images)
+        rest = document
+        for index in range(len(self._images)):
+            marker = image_placeholder(index)
+            head, found, rest = rest.partition(marker)
+            if not found:
+                raise ValueError(f"Payload is missing the placeholder for image {index}")
+            self._segments.append(head.encode("ascii"))
+        self._segments.append(rest.encode("ascii"))
+        self.content_length = sum(len(s) for s in self._segments) + sum(base64_length(len(img)) for img in self._images)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "Content-Length": str(self.content_length)}
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for index, image in enumerate(self._images):
+            yield self._segments[index]
+            view = memoryview(image)
+            try:
+                for start in range(0, len(view), B64_CHUNK_BYTES):
+                    yield base64.b64encode(view[start : start + B64_CHUNK_BYTES])
+            finally:
+                view.release()
+        yield self._segments[-1]
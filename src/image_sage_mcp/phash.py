@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from .cache import analysis_from_dict, analysis_to_dict
+from .models import AnalysisResult, ImageData
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+try:
+    import numpy as np
+except Exception:  # noqa: BLE001
+    np = None  # type: ignore[assignment]
+
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+# Nearly flat images hash to noise; matching them would pair unrelated blank frames
+MIN_CONTRAST = 2.0
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+@dataclass(frozen=True)
+class PerceptualHashes:
+    ahash: int
+    dhash: int
+    phash: int
+
+    def as_hex(self) -> Dict[str, str]:
+        return {"ahash": f"{self.ahash:016x}", "dhash": f"{self.dhash:016x}", "phash": f"{self.phash:016x}"}
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _bits_to_int(bits: "np.ndarray") -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+_DCT_MATRIX: Optional["np.ndarray"] = None
+
+
+def _dct_matrix() -> "np.ndarray":
+    global _DCT_MATRIX
+    if _DCT_MATRIX is None:
+        k = np.arange(DCT_SIZE)[:, None]
+        n = np.arange(DCT_SIZE)[None, :]
+        _DCT_MATRIX = np.cos(math.pi * (2 * n + 1) * k / (2 * DCT_SIZE))
+    return _DCT_MATRIX
+
+
+def _grayscale(image: ImageData) -> Image.Image:
+    with image.open_image() as source:
+        if source.format == "JPEG":
+            # Decode at 1/8 scale where possible; hashes only need a 32x32 thumbnail
+            source.draft("L", (DCT_SIZE * 2, DCT_SIZE * 2))
+        source.seek(0)
+        frame = ImageOps.exif_transpose(source).convert("L")
+        return frame.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def compute_hashes(image: ImageData) -> Optional[PerceptualHashes]:
+    if np is None:
+        return None
+    small = _grayscale(image)
+    pixels = np.asarray(small, dtype=np.float64)
+    if pixels.std() < MIN_CONTRAST:
+        return None
+    # aHash: 8x8 block means against their mean
+    blocks = pixels.reshape(HASH_SIZE, DCT_SIZE // HASH_SIZE, HASH_SIZE, DCT_SIZE // HASH_SIZE).mean(axis=(1, 3))
+    ahash = _bits_to_int(blocks > blocks.mean())
+    # dHash: horizontal gradient sign on a 9x8 thumbnail
+    gradient = np.asarray(small.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.float64)
+    dhash = _bits_to_int(gradient[:, 1:] > gradient[:, :-1])
+    # pHash: low-frequency 8x8 block of the 2-D DCT against its median (DC term excluded)
+    dct = _dct_matrix()
+    low = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    median = np.median(low.ravel()[1:])
+    phash = _bits_to_int(low > median)
+    return PerceptualHashes(ahash=ahash, dhash=dhash, phash=phash)
+
+
+class BKTree:
+    # Burkhard-Keller tree over 64-bit hashes under Hamming distance; each node keeps the
+    # ids that share its exact hash
+    def __init__(self) -> None:
+        self._root: Optional[Tuple[int, List[int], Dict[int, Any]]] = None
+        self.size = 0
+
+    def add(self, value: int, item_id: int) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [item_id], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item_id], {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        # (distance, id) pairs within max_distance; the triangle inequality prunes subtrees
+        found: List[Tuple[int, int]] = []
+        if self._root is None:
+            return found
+        stack = [self._root]
+        while stack:
+            node_value, ids, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item_id) for item_id in ids)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+@dataclass
+class _IndexEntry:
+    hashes: PerceptualHashes
+    scope: Hashable
+    digest: str
+    expires_at: float
+    result: Dict[str, Any]
+
+
+@dataclass
+class NearDuplicate:
+    result: AnalysisResult
+    distance: int
+    source_digest: str
+
+
+def index_scope(backend: str, model: str, options: Dict[str, Any]) -> str:
+    return json.dumps({"backend": backend, "model": model, "options": options}, sort_keys=True, separators=(",", ":"))
+
+
+class PerceptualIndex:
+    # Maps perceptual hashes of analyzed images to their results so re-encoded, resized or
+    # lightly edited copies reuse the analysis. One BK-tree per (backend, model, options) scope;
+    # the pHash is the tree key and a close dHash or aHash is required to confirm a match.
+    def __init__(self, max_distance: int = 4, max_entries: int = 10000, ttl_seconds: int = 3600) -> None:
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _IndexEntry]" = OrderedDict()
+        self._trees: Dict[Hashable, BKTree] = {}
+        self._digests: Dict[Tuple[Hashable, str], int] = {}
+        self._hash_memo: "OrderedDict[str, Optional[PerceptualHashes]]" = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def hashes_for(
+        self, image: ImageData, digest: str, workers: Optional[ImageWorkerPool] = None
+    ) -> Optional[PerceptualHashes]:
+        if digest in self._hash_memo:
+            self._hash_memo.move_to_end(digest)
+            return self._hash_memo[digest]
+        try:
+            hashes = await (workers or INLINE_WORKERS).run_image(compute_hashes, image)
+        except Exception:  # noqa: BLE001
+            # Undecodable for hashing purposes; the backend may still cope with it
+            hashes = None
+        self._hash_memo[digest] = hashes
+        while len(self._hash_memo) > self.max_entries:
+            self._hash_memo.popitem(last=False)
+        return hashes
+
+    def lookup(self, hashes: PerceptualHashes, scope: Hashable) -> Optional[NearDuplicate]:
+        tree = self._trees.get(scope)
+        if tree is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        best: Optional[Tuple[int, int]] = None
+        for distance, item_id in tree.search(hashes.phash, self.max_distance):
+            entry = self._entries.get(item_id)
+            if entry is None or entry.expires_at <= now:
+                continue
+            confirm = min(hamming(hashes.dhash, entry.hashes.dhash), hamming(hashes.ahash, entry.hashes.ahash))
+            if confirm > self.max_distance:
+                continue
+            score = distance + confirm
+            if best is None or score < best[0]:
+                best = (score, item_id)
+        if best is None:
+            self.misses += 1
+            return None
+        entry = self._entries[best[1]]
+        self._entries.move_to_end(best[1])
+        self.hits += 1
+        return NearDuplicate(
+            result=analysis_from_dict(entry.result),
+            distance=hamming(hashes.phash, entry.hashes.phash),
+            source_digest=entry.digest,
+        )
+
+    def add(self, hashes: PerceptualHashes, scope: Hashable, digest: str, result: AnalysisResult) -> None:
+        existing = self._digests.get((scope, digest))
+        if existing is not None and existing in self._entries:
+            self._entries[existing].result = analysis_to_dict(result)
+            self._entries[existing].expires_at = time.time() + self.ttl_seconds
+            self._entries.move_to_end(existing)
+            return
+        item_id = self._next_id
+        self._next_id += 1
+        self._entries[item_id] = _IndexEntry(hashes, scope, digest, time.time() + self.ttl_seconds, analysis_to_dict(result))
+        self._digests[(scope, digest)] = item_id
+        self._trees.setdefault(scope, BKTree()).add(hashes.phash, item_id)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._digests.pop((evicted.scope, evicted.digest), None)
+        self._compact()
+
+    def _compact(self) -> None:
+        # BK-trees can't delete in place; rebuild once evicted ids outnumber live ones
+        indexed = sum(tree.size for tree in self._trees.values())
+        if indexed <= 2 * max(len(self._entries), 1):
+            return
+        self._trees = {}
+        for item_id, entry in self._entries.items():
+            self._trees.setdefault(entry.scope, BKTree()).add(entry.hashes.phash, item_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def adapt_near_duplicate(match: NearDuplicate, image: ImageData) -> AnalysisResult:
+    # The description carries over; metadata describes the image actually asked about
+    metadata = replace(
+        match.result.metadata,
+        width=image.width or 0,
+        height=image.height or 0,
+        mime_type=image.mime_type,
+        file_size_bytes=image.file_size_bytes,
+        format=image.format,
+        extra={"near_duplicate_of": match.source_digest, "hash_distance": match.distance},
+    )
+    return replace(match.result, metadata=metadata, processing_time_ms=0)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import os
+import sys
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from .cache import image_digest, make_cache_key
+from .context import AppContext
+from .local import GateDecision, LocalBackend, enrich_result, local_result, plan_analysis
+from .models import AnalysisResult, ImageData
+from .metrics import REGISTRY, count_bytes, request_trace, stage
+from .phash import PerceptualHashes, adapt_near_duplicate, index_scope
+from .processor import StubBackend, normalize_options
+from .ratelimit import OverloadedError
+from .singleflight import file_identity, normalize_url
+from .store import StoreRecord
+from .tiling import analyze_tiled, should_tile
+
+
+class PipelineError(Exception):
+    def __init__(self, code: str, message: str, details: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.details = details or {}
+
+    def to_response(self, context: AppContext) -> Dict[str, Any]:
+        return context.formatter.format_error_response(self.code, self.message, self.details)
+
+
+def local_path(url: str) -> str:
+    # local path or file://
+    if url.startswith("file://"):
+        return url[len("file://") :]
+    return url
+
+
+def is_remote(url: str) -> bool:
+    return url.startswith("http://") or url.startswith("https://")
+
+
+async def load_image(context: AppContext, url: str) -> ImageData:
+    config = context.config
+    with stage("validate"):
+        vr = await context.validator.validate_url_async(url)
+    if not vr.ok:
+        raise PipelineError(
+            "INVALID_URL",
+            vr.message or "Invalid URL",
+            {"url": url, "allowed_fs_roots": config.allowed_fs_roots},
+        )
+    source = "url" if is_remote(url) else "file"
+    try:
+        with stage("fetch", source=source):
+            if source == "url":
+                image = await context.fetch_flights.do(("url", normalize_url(url)), lambda: context.fetcher.fetch_from_url(url))
+            else:
+                path = local_path(url)
+                identity = file_identity(path)
+                if identity is None:
+                    image = await context.fetcher.fetch_from_file(path)
+                else:
+                    image = await context.fetch_flights.do(("file",) + identity, lambda: context.fetcher.fetch_from_file(path))
+        count_bytes("in", image.file_size_bytes, source=source)
+        # Coalesced requests share one image; each releases it when done (see LazyImageData)
+        image.retain()
+        return image
+    except Exception as exc:  # noqa: BLE001
+        raise PipelineError(
+            "FETCH_ERROR",
+            "Unable to fetch or read image",
+            {"url": url, "reason": str(exc), "allowed_fs_roots": config.allowed_fs_roots},
+        ) from exc
+
+
+async def analyze_image(context: AppContext, image: ImageData, options: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+    cache = context.cache
+    primary = context.backends[0]
+    # Hashing a multi-MB buffer is worth moving off the loop; the digest is memoized on the image
+    await context.workers.run_io(image_digest, image)
+    key = make_cache_key(image_digest(image), primary.name, primary.model, normalize_options(options))
+    if cache is not None:
+        cached = await cache.get_async(key, context.workers)
+        if os.getenv("IMAGE_SAGE_DEBUG", ""):
+            sys.stderr.write(f"[image-sage-mcp] cache {'hit' if cached else 'miss'}: {cache.stats.as_dict()}\n")
+            sys.stderr.flush()
+        if cached is not None:
+            return cached
+    index = context.phash_index
+    scope: Optional[str] = None
+    hashes: Optional[PerceptualHashes] = None
+    if index is not None:
+        scope = index_scope(primary.name, primary.model, normalize_options(options))
+        hashes = await index.hashes_for(image, image_digest(image), context.workers)
+        match = index.lookup(hashes, scope) if hashes is not None else None
+        if match is not None:
+            return adapt_near_duplicate(match, image)
+    # Identical concurrent requests share one backend call instead of each paying for it
+    analysis = await context.analysis_flights.do(key, lambda: _analyze_uncached(context, image, options, key))
+    if index is not None and hashes is not None and scope is not None and _reusable(analysis):
+        index.add(hashes, scope, image_digest(image), analysis)
+    return analysis
+
+
+def _reusable(analysis: AnalysisResult) -> bool:
+    # Fallback answers are placeholders, and partial answers and tiled ones with missing tiles
+    # have holes; a later call may do better
+    if analysis.backend_used in (StubBackend.name, LocalBackend.name):
+        return False
+    extra = analysis.metadata.extra
+    if extra.get("route") == "fallback" or "partial_output" in extra:
+        return False
+    return bool(extra.get("tiling", {}).get("complete", True))
+
+
+async def _analyze_uncached(context: AppContext, image: ImageData, options: Optional[Dict[str, Any]], key: str) -> AnalysisResult:
+    features = await context.local_features.get(image, context.workers) if context.config.local_analysis else None
+    decision: Optional[GateDecision] = None
+    if features is not None:
+        decision = plan_analysis(features, options, context.config.local_min_px)
+        if decision.answer_locally:
+            # Blank, solid or tiny images: nothing a paid model could add
+            return local_result(image, features)
+        options = decision.options
+    tiled = should_tile(image, options, context.tiling) and not (decision is not None and "no_text_detected" in decision.reasons)
+    try:
+        if tiled:
+            # Large high-detail images lose small text when downscaled to one upload
+            analysis = await analyze_tiled(context.processor, image, options, context.tiling, context.workers)
+        else:
+            analysis = await context.processor.analyze_image(image, options)
+    except OverloadedError as exc:
+        details: Dict[str, Any] = {"backend": exc.name, "reason": exc.reason}
+        if exc.retry_after is not None:
+            details["retry_after_s"] = round(exc.retry_after, 1)
+        raise PipelineError("OVERLOADED", "Vision backend is at capacity; retry shortly", details) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise PipelineError("PROCESSING_ERROR", "Vision processing failed", {"reason": str(exc)}) from exc
+    if features is not None and analysis.backend_used != LocalBackend.name:
+        analysis = enrich_result(analysis, features, decision)
+    if context.cache is not None and _reusable(analysis):
+        await context.cache.put_async(key, analysis, context.workers)
+    return analysis
+
+
+def store_source(url: str) -> str:
+    # Credentials in a URL must not end up on disk; local paths are stored resolved
+    if is_remote(url):
+        parts = urlsplit(normalize_url(url))
+        return urlunsplit((parts.scheme, parts.netloc.rpartition("@")[2], parts.path, parts.query, ""))
+    return os.path.realpath(local_path(url))
+
+
+def store_analysis(context: AppContext, url: str, image: ImageData, analysis: AnalysisResult, options: Optional[Dict[str, Any]]) -> None:
+    # Only queued here; the store writes in batches off the request path
+    if context.store is None or not _reusable(analysis):
+        return
+    model = next((b.model for b in context.backends if b.name == analysis.backend_used), "")
+    context.store.record(StoreRecord(image_digest(image), store_source(url), model, normalize_options(options), analysis))
+
+
+def record_outcome(tool: str, response: Dict[str, Any]) -> None:
+    error = response.get("error")
+    outcome = error.get("code", "ERROR") if isinstance(error, dict) else "ok"
+    backend = response.get("backend_used", "none")
+    REGISTRY.inc("image_sage_requests_total", help="Tool calls by outcome", tool=tool, outcome=outcome, backend=backend)
+
+
+async def run_image_sage(context: AppContext, url: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    with request_trace("analyze") as trace:
+        image: Optional[ImageData] = None
+        try:
+            image = await load_image(context, url)
+            analysis = await analyze_image(context, image, options)
+        except PipelineError as err:
+            response = err.to_response(context)
+        else:
+            store_analysis(context, url, image, analysis, options)
+            with stage("format"):
+                response = context.formatter.format_success_response(analysis)
+            if context.config.response_timings:
+                response["timings_ms"] = trace.stage_totals_ms()
+        finally:
+            if image is not None:
+                image.release()
+    record_outcome("analyze", response)
+    return response
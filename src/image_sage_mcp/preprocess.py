@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import io
+import mmap
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from .cache import image_digest
+from .models import ImageData
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+
+UPLOAD_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Formats vision APIs accept as-is; PNG stays lossless so screenshot text keeps its edges for OCR
+PASSTHROUGH_FORMATS = {"JPEG", "WEBP", "PNG"}
+LOSSLESS_SOURCES = {"PNG", "GIF"}
+DEFAULT_MAX_DIMENSIONS = {"low": 512, "medium": 1024, "high": 2048}
+
+
+@dataclass
+class UploadProfile:
+    max_dimensions: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_MAX_DIMENSIONS))
+    format: str = "JPEG"
+    quality: int = 85
+
+    def max_dimension(self, detail_level: str) -> int:
+        return self.max_dimensions.get(detail_level, self.max_dimensions.get("medium", 1024))
+
+
+@dataclass
+class PreparedImage:
+    data: Union[bytes, mmap.mmap]
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    reencoded: bool
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.original_bytes - len(self.data))
+
+    def as_metadata(self) -> Dict[str, int]:
+        return {
+            "upload_bytes": len(self.data),
+            "upload_width": self.width,
+            "upload_height": self.height,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+def _passthrough(image: ImageData) -> PreparedImage:
+    # Send the source buffer itself (memory-mapped for files) rather than a copy
+    return PreparedImage(
+        data=image.buffer,
+        mime_type=image.mime_type,
+        width=image.width or 0,
+        height=image.height or 0,
+        original_bytes=image.file_size_bytes,
+        reencoded=False,
+    )
+
+
+def _needs_reencode(image: ImageData, max_dim: int) -> bool:
+    if max(image.width or 0, image.height or 0) > max_dim:
+        return True
+    # Animated or rotated sources are normalized so the model sees the frame a viewer would
+    return image.animated or image.orientation != 1 or image.format not in PASSTHROUGH_FORMATS
+
+
+def prepare_image(image: ImageData, profile: UploadProfile, detail_level: str) -> PreparedImage:
+    max_dim = profile.max_dimension(detail_level)
+    if not _needs_reencode(image, max_dim):
+        return _passthrough(image)
+
+    target_format = profile.format.upper() if profile.format.upper() in UPLOAD_FORMATS else "JPEG"
+    # Lossy JPEG rings around glyphs; lossless sources are downscaled into lossless WebP instead
+    lossless = image.format in LOSSLESS_SOURCES
+    if lossless:
+        target_format = "WEBP"
+    with image.open_image() as source:
+        if source.format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of decoding full size then shrinking
+            source.draft("RGB", (max_dim, max_dim))
+        source.seek(0)
+        frame = ImageOps.exif_transpose(source)
+        has_alpha = frame.mode in ("RGBA", "LA") or (frame.mode == "P" and "transparency" in frame.info)
+        if has_alpha and target_format == "JPEG":
+            rgba = frame.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            frame = flattened
+        elif has_alpha:
+            frame = frame.convert("RGBA")
+        else:
+            frame = frame.convert("RGB")
+        frame.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        if lossless:
+            frame.save(out, format=target_format, lossless=True)
+        else:
+            frame.save(out, format=target_format, quality=profile.quality, optimize=target_format == "JPEG")
+        width, height = frame.size
+
+    data = out.getvalue()
+    within_bounds = max(image.width or 0, image.height or 0) <= max_dim and not image.animated and image.orientation == 1
+    if within_bounds and len(data) >= image.file_size_bytes and image.format in PASSTHROUGH_FORMATS:
+        return _passthrough(image)
+    return PreparedImage(
+        data=data,
+        mime_type=UPLOAD_FORMATS[target_format],
+        width=width,
+        height=height,
+        original_bytes=image.file_size_bytes,
+        reencoded=True,
+    )
+
+
+def _reencode_only(image: ImageData, profile: UploadProfile, detail_level: str) -> Optional[PreparedImage]:
+    # Worker-side entry point: pass-through results alias the caller's buffer, which can't be
+    # sent back from another process, so the caller rebuilds those itself
+    prepared = prepare_image(image, profile, detail_level)
+    return prepared if prepared.reencoded else None
+
+
+class ImagePreparer:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int, str, int], PreparedImage]" = OrderedDict()
+        self._bytes = 0
+
+    def prepare(self, image: ImageData, profile: Optional[UploadProfile], detail_level: str) -> PreparedImage:
+        if profile is None:
+            return _passthrough(image)
+        key = (image_digest(image), profile.max_dimension(detail_level), profile.format.upper(), profile.quality)
+        prepared = self._entries.get(key)
+        if prepared is not None:
+            self._entries.move_to_end(key)
+            return prepared
+        prepared = prepare_image(image, profile, detail_level)
+        # Pass-through results just alias the source bytes; only re-encoded payloads are worth keeping
+        if prepared.reencoded:
+            self._store(key, prepared)
+        return prepared
+
+    async def prepare_async(
+        self,
+        image: ImageData,
+        profile: Optional[UploadProfile],
+        detail_level: str,
+        workers: Optional[ImageWorkerPool] = None,
+    ) -> PreparedImage:
+        if profile is None or not _needs_reencode(image, profile.max_dimension(detail_level)):
+            return _passthrough(image)
+        workers = workers or INLINE_WORKERS
+        digest = await workers.run_io(image_digest, image)
+        key = (digest, profile.max_dimension(detail_level), profile.format.upper(), profile.quality)
+        prepared = self._entries.get(key)
+        if prepared is not None:
+            self._entries.move_to_end(key)
+            return prepared
+        reencoded = await workers.run_image(_reencode_only, image, profile, detail_level)
+        if reencoded is None:
+            return _passthrough(image)
+        self._store(key, reencoded)
+        return reencoded
+
+    def _store(self, key: Tuple[str, int, str, int], prepared: PreparedImage) -> None:
+        size = len(prepared.data)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = prepared
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.data)
@@ -1,16 +1,65 @@
 from __future__ import annotations
 
+import asyncio
 import time
-from typing import Any, Dict, List, Optional
-import base64
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
 import json
 import httpx
 
+from .health import BackendHealth, CircuitOpenError, CircuitSettings
+from .metrics import REGISTRY, count_bytes, stage
 from .models import AnalysisResult, ImageData, ImageMetadata
+from .payload import StreamingJSONBody, data_uri_placeholder
+from .preprocess import ImagePreparer, PreparedImage, UploadProfile
+from .ratelimit import AdmissionController, OverloadedError, estimate_image_tokens
+from .streaming import CHARS_PER_TOKEN, IncrementalJSONParser, ParsedObject, parse_json_object, sse_data
+from .workers import ImageWorkerPool
+
+
+DETAIL_LEVELS = ("low", "medium", "high")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+RESULT_FIELDS = ("contains_person", "objects_detected", "scene_type", "description", "ocr_text", "confidence")
+# Set by _complete when the model's JSON had to be repaired: the fields that never arrived and
+# the ones that were cut off and closed up
+PARTIAL_OUTPUT_KEY = "_partial_output"
+
+RESULT_KEYS_PROMPT = (
+    "contains_person (bool), objects_detected (array of strings), scene_type (string), "
+    "description (string, a concise natural language summary), ocr_text (string), confidence (0..1)"
+)
+SYSTEM_PROMPT = (
+    "You are an image analysis engine. Return only a compact JSON object with keys: " + RESULT_KEYS_PROMPT + "."
+)
+MULTI_IMAGE_SYSTEM_PROMPT = (
+    "You are an image analysis engine. You will be given several images. Return only a compact JSON object "
+    "of the form {\"results\": [...]} where the array has exactly one entry per image, in the order given, "
+    "and each entry is an object with keys: " + RESULT_KEYS_PROMPT + "."
+)
+
+
+def normalize_options(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    include_ocr = True
+    detail_level = "medium"
+    if isinstance(options, dict):
+        include_ocr = bool(options.get("include_ocr", True))
+        detail_level = str(options.get("detail_level", "medium")).lower()
+    if detail_level not in DETAIL_LEVELS:
+        detail_level = "medium"
+    return {"include_ocr": include_ocr, "detail_level": detail_level}
 
 
 class VisionBackend:
     name: str = "stub"
+    model: str = ""
+    upload_profile: Optional[UploadProfile] = None
+    # Fallback-only backends never take part in hedging/racing; they answer only when the others can't
+    fallback_only: bool = False
+
+    @property
+    def health_key(self) -> str:
+        return f"{self.name}:{self.model}" if self.model else self.name
 
     async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
         raise NotImplementedError
@@ -18,6 +67,7 @@ class VisionBackend:
 
 class StubBackend(VisionBackend):
     name = "stub"
+    fallback_only = True
 
     async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
         start = time.perf_counter()
@@ -49,17 +99,111 @@ class StubBackend(VisionBackend):
         )
 
 
+STRATEGIES = ("sequential", "hedged", "race")
+
+
 class VisionProcessor:
-    def __init__(self, backends: List[VisionBackend]) -> None:
+    def __init__(
+        self,
+        backends: List[VisionBackend],
+        strategy: str = "sequential",
+        hedge_percentile: float = 0.95,
+        hedge_min_delay: float = 0.1,
+        hedge_max_delay: float = 5.0,
+        hedge_default_delay: float = 2.0,
+        hedge_min_samples: int = 20,
+        circuit: Optional[CircuitSettings] = None,
+        health: Optional[Dict[str, BackendHealth]] = None,
+    ) -> None:
         self.backends = backends
+        self.strategy = strategy if strategy in STRATEGIES else "sequential"
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.circuit = circuit
+        self.health: Dict[str, BackendHealth] = health if health is not None else {}
+
+    def backend_health(self, backend: VisionBackend) -> BackendHealth:
+        key = backend.health_key
+        health = self.health.get(key)
+        if health is None:
+            # The last-resort fallback must always be allowed to answer
+            settings = None if backend.fallback_only else self.circuit
+            health = self.health[key] = BackendHealth(key, settings)
+        elif not backend.fallback_only:
+            health.settings = self.circuit
+        return health
+
+    def hedge_delay(self, backend: VisionBackend) -> float:
+        # Wait roughly as long as this backend usually takes before starting the next one
+        histogram = self.backend_health(backend).latency
+        if histogram.count < self.hedge_min_samples:
+            return self.hedge_default_delay
+        observed = histogram.percentile(self.hedge_percentile) or self.hedge_default_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, observed))
+
+    async def _timed(self, backend: VisionBackend, image_data: ImageData, options: Optional[Dict[str, Any]]) -> Optional[AnalysisResult]:
+        health = self.backend_health(backend)
+        if not health.allow_request():
+            # Skip instantly instead of waiting out a timeout against a struggling upstream
+            raise CircuitOpenError(backend.name, health.retry_in())
+        start = time.perf_counter()
+        try:
+            with stage("backend", backend=backend.name) as attrs:
+                result = await backend.analyze(image_data, options)
+                if result is None:
+                    attrs["outcome"] = "empty"
+        except (asyncio.CancelledError, OverloadedError):
+            # Our own admission control rejecting a call says nothing about the backend's health
+            health.release()
+            raise
+        except Exception as exc:  # noqa: BLE001
+            health.record_failure(exc)
+            raise
+        if result is not None:
+            health.record_success(time.perf_counter() - start)
+        else:
+            health.release()
+        return result
 
     async def analyze_image(self, image_data: ImageData, options: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+        primaries = [b for b in self.backends if not b.fallback_only]
+        if self.strategy == "sequential" or len(primaries) < 2:
+            return await self._run_sequential(self.backends, image_data, options)
         last_error: Optional[Exception] = None
-        for backend in self.backends:
+        try:
+            result = await self._run_concurrent(primaries, image_data, options, hedged=self.strategy == "hedged")
+            if result is not None:
+                return result
+        except OverloadedError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            last_error = exc
+        fallbacks = [b for b in self.backends if b.fallback_only]
+        try:
+            return await self._run_sequential(fallbacks, image_data, options)
+        except Exception:  # noqa: BLE001
+            if last_error:
+                raise last_error
+            raise
+
+    async def _run_sequential(self, backends: List[VisionBackend], image_data: ImageData, options: Optional[Dict[str, Any]]) -> AnalysisResult:
+        last_error: Optional[Exception] = None
+        overloaded: Optional[OverloadedError] = None
+        for backend in backends:
+            if backend.fallback_only and overloaded is not None:
+                # Tell the caller to retry rather than masking saturation with a placeholder answer
+                raise overloaded
             try:
-                result = await backend.analyze(image_data, options)
+                result = await self._timed(backend, image_data, options)
                 if result is not None:
                     return result
+            except OverloadedError as exc:
+                overloaded = exc
+                last_error = exc
+                continue
             except Exception as exc:  # noqa: BLE001
                 last_error = exc
                 continue
@@ -67,77 +211,202 @@ class VisionProcessor:
             raise last_error
         raise RuntimeError("All vision backends returned no result")
 
+    async def _run_concurrent(
+        self, backends: List[VisionBackend], image_data: ImageData, options: Optional[Dict[str, Any]], hedged: bool
+    ) -> Optional[AnalysisResult]:
+        # Hedged: start the next backend when the current one exceeds its usual latency or fails.
+        # Race: start everything at once. Either way the first usable result wins and the rest are cancelled.
+        pending: "set[asyncio.Task[Optional[AnalysisResult]]]" = set()
+        launched = 0
+        last_error: Optional[Exception] = None
+        overloaded: Optional[OverloadedError] = None
+
+        def launch() -> None:
+            nonlocal launched
+            backend = backends[launched]
+            launched += 1
+            pending.add(asyncio.ensure_future(self._timed(backend, image_data, options)))
+
+        launch()
+        while not hedged and launched < len(backends):
+            launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(backends[launched - 1]) if hedged and launched < len(backends) else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    exc = task.exception()
+                    if exc is not None:
+                        if overloaded is None or not isinstance(exc, OverloadedError):
+                            last_error = exc  # type: ignore[assignment]
+                        if isinstance(exc, OverloadedError):
+                            overloaded = exc
+                        continue
+                    result = task.result()
+                    if result is not None:
+                        return result
+                # Everything that finished was unusable; don't wait out the hedge delay
+                if launched < len(backends):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        if overloaded is not None:
+            raise overloaded
+        if last_error:
+            raise last_error
+        return None
+
 
 class OpenRouterBackend(VisionBackend):
     name = "openrouter"
 
-    def __init__(self, api_key: str, model: str, timeout_seconds: int = 20) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        timeout_seconds: int = 20,
+        client: Optional[httpx.AsyncClient] = None,
+        upload_profile: Optional[UploadProfile] = None,
+        preparer: Optional[ImagePreparer] = None,
+        admission: Optional[AdmissionController] = None,
+        workers: Optional[ImageWorkerPool] = None,
+        base_url: str = OPENROUTER_BASE_URL,
+        stream: bool = False,
+        max_output_tokens: int = 0,
+    ) -> None:
         self.api_key = api_key
         self.model = model
         self.timeout_seconds = timeout_seconds
+        self.client = client
+        self.upload_profile = upload_profile
+        self.preparer = preparer or ImagePreparer()
+        self.admission = admission
+        self.workers = workers
+        self.base_url = base_url
+        self.stream = stream
+        self.max_output_tokens = max_output_tokens
 
-    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
-        # Prepare base64 data URL
-        b64 = base64.b64encode(image.bytes_data).decode("ascii")
-        data_uri = f"data:{image.mime_type};base64,{b64}"
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[httpx.AsyncClient]:
+        if self.client is not None:
+            yield self.client
+            return
+        async with httpx.AsyncClient(timeout=self.timeout_seconds, base_url=self.base_url) as client:
+            yield client
 
-        include_ocr = True
-        detail_level = "medium"
-        if isinstance(options, dict):
-            include_ocr = bool(options.get("include_ocr", True))
-            detail_level = str(options.get("detail_level", "medium"))
-
-        system_prompt = (
-            "You are an image analysis engine. Return only a compact JSON object with keys: "
-            "contains_person (bool), objects_detected (array of strings), scene_type (string), "
-            "description (string, a concise natural language summary), ocr_text (string), confidence (0..1)."
-        )
-        user_prompt = (
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://local.image-sage-mcp",
+            "X-Title": "Image Sage MCP",
+        }
+
+    def _user_prompt(self, include_ocr: bool, detail_level: str) -> str:
+        return (
             f"Analyze the image with {detail_level} detail. "
             + ("Include OCR text in 'ocr_text'. " if include_ocr else "Set 'ocr_text' to an empty string. ")
             + "Do not include any text outside of the JSON object."
         )
 
-        payload = {
+    async def _complete(
+        self, user_content: List[Dict[str, Any]], system_prompt: str, images: List[PreparedImage], required: Sequence[str] = ()
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {"type": "image_url", "image_url": {"url": data_uri}},
-                    ],
-                },
+                {"role": "user", "content": user_content},
             ],
             "response_format": {"type": "json_object"},
         }
+        if self.max_output_tokens > 0:
+            payload["max_tokens"] = self.max_output_tokens
+        if self.stream:
+            payload["stream"] = True
+        # The base64 images are encoded in chunks straight into the request stream
+        body = StreamingJSONBody(payload, [p.data for p in images])
+        headers = {**self._headers(), **body.headers}
+        count_bytes("out", body.content_length, backend=self.name)
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://local.image-sage-mcp",
-            "X-Title": "Image Sage MCP",
-        }
+        if self.admission is not None:
+            estimated = sum(estimate_image_tokens(p.width, p.height) for p in images)
+            async with self.admission.admit(estimated):
+                reply = await self._send(headers, body, required)
+        else:
+            reply = await self._send(headers, body, required)
 
-        async with httpx.AsyncClient(timeout=self.timeout_seconds, base_url="https://openrouter.ai/api/v1") as client:
-            resp = await client.post("/chat/completions", headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
+        parsed = reply.fields
+        if not parsed:
+            raise RuntimeError("OpenRouter returned no usable JSON")
+        if reply.partial:
+            # Keep what did parse instead of discarding the whole answer, but say so: a partial
+            # result is never cached or stored
+            parsed[PARTIAL_OUTPUT_KEY] = {"missing": [key for key in required if key not in parsed], "repaired": reply.repaired}
+        return parsed
 
+    async def _send(self, headers: Dict[str, str], body: StreamingJSONBody, required: Sequence[str]) -> ParsedObject:
+        if self.stream:
+            return await self._post_stream(headers, body, required)
+        data = await self._post(headers, body)
         # Extract the first choice content
         try:
             content = data["choices"][0]["message"]["content"]
         except Exception as exc:  # noqa: BLE001
             raise RuntimeError(f"OpenRouter malformed response: {exc}")
+        return parse_json_object(content if isinstance(content, str) else "")
 
-        try:
-            parsed = json.loads(content)
-        except Exception:
-            # If not strict JSON, try to heuristically extract
-            # Fallback to minimal structure
-            parsed = {}
+    async def _post(self, headers: Dict[str, str], body: StreamingJSONBody) -> Dict[str, Any]:
+        async with self._client() as client:
+            resp = await client.post("/chat/completions", headers=headers, content=body, timeout=self.timeout_seconds)
+            resp.raise_for_status()
+            return resp.json()
+
+    async def _post_stream(self, headers: Dict[str, str], body: StreamingJSONBody, required: Sequence[str]) -> ParsedObject:
+        # Reads the SSE stream only as long as it is useful: leaving the block closes the
+        # connection, which stops generation (and billing) upstream
+        parser = IncrementalJSONParser()
+        budget = self.max_output_tokens * CHARS_PER_TOKEN if self.max_output_tokens > 0 else 0
+        started = time.perf_counter()
+        first_token = True
+        reason = "eof"
+        async with self._client() as client:
+            async with client.stream("POST", "/chat/completions", headers=headers, content=body, timeout=self.timeout_seconds) as resp:
+                resp.raise_for_status()
+                async for data in sse_data(resp.aiter_lines()):
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    if chunk.get("error"):
+                        raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content") or ""
+                    if delta and first_token:
+                        first_token = False
+                        REGISTRY.observe(
+                            "image_sage_stream_first_token_seconds", time.perf_counter() - started, help="Time to first streamed token", backend=self.name
+                        )
+                    parser.feed(delta)
+                    if parser.done:
+                        reason = "complete"
+                    elif required and all(key in parser.fields for key in required):
+                        reason = "fields"
+                    elif budget and len(parser.text) >= budget:
+                        reason = "budget"
+                    if reason != "eof":
+                        break
+        REGISTRY.inc("image_sage_stream_stops_total", help="Streamed completions by stop reason", backend=self.name, reason=reason)
+        # Stopping once every required field is in leaves an unwanted member unfinished on purpose
+        return parser.result(repair=reason != "fields")
 
+    def _to_result(self, parsed: Dict[str, Any], image: ImageData, prepared: PreparedImage, elapsed_ms: int = 0) -> AnalysisResult:
+        extra: Dict[str, Any] = prepared.as_metadata()
+        if PARTIAL_OUTPUT_KEY in parsed:
+            extra["partial_output"] = parsed[PARTIAL_OUTPUT_KEY]
         contains_person = bool(parsed.get("contains_person", False))
         objects_detected = list(parsed.get("objects_detected", []))
         scene_type = str(parsed.get("scene_type", "unknown"))
@@ -151,9 +420,9 @@ class OpenRouterBackend(VisionBackend):
             mime_type=image.mime_type,
             file_size_bytes=image.file_size_bytes,
             format=image.format,
+            extra=extra,
         )
 
-        # processing_time_ms is not measured here; leave as 0 (server measures overall)
         return AnalysisResult(
             contains_person=contains_person,
             objects_detected=objects_detected,
@@ -162,8 +431,58 @@ class OpenRouterBackend(VisionBackend):
             ocr_text=ocr_text,
             confidence=confidence,
             metadata=meta,
-            processing_time_ms=0,
+            processing_time_ms=elapsed_ms,
             backend_used=self.name,
         )
 
+    async def prepare(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> PreparedImage:
+        # Downscale/re-encode to what the model will actually look at
+        detail_level = normalize_options(options)["detail_level"]
+        return await self.preparer.prepare_async(image, self.upload_profile, detail_level, self.workers)
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        start = time.perf_counter()
+        normalized = normalize_options(options)
+        prepared = await self.prepare(image, options)
+        user_content = [
+            {"type": "text", "text": self._user_prompt(normalized["include_ocr"], normalized["detail_level"])},
+            {"type": "image_url", "image_url": {"url": data_uri_placeholder(prepared.mime_type, 0)}},
+        ]
+        required = [key for key in RESULT_FIELDS if normalized["include_ocr"] or key != "ocr_text"]
+        parsed = await self._complete(user_content, SYSTEM_PROMPT, [prepared], required)
+        return self._to_result(parsed, image, prepared, int((time.perf_counter() - start) * 1000))
 
+    async def analyze_many(self, images: List[ImageData], options: Optional[Dict[str, Any]] = None) -> List[AnalysisResult]:
+        # Several images in one completion; the model answers with one JSON object per image, in order
+        start = time.perf_counter()
+        normalized = normalize_options(options)
+        prepared = list(await asyncio.gather(*(self.prepare(image, options) for image in images)))
+        user_content: List[Dict[str, Any]] = [
+            {
+                "type": "text",
+                "text": (
+                    f"You will receive {len(images)} images, numbered 1 to {len(images)} in order. "
+                    + self._user_prompt(normalized["include_ocr"], normalized["detail_level"]).replace("the image", "each image")
+                ),
+            }
+        ]
+        for index, item in enumerate(prepared):
+            user_content.append({"type": "text", "text": f"Image {index + 1}:"})
+            user_content.append({"type": "image_url", "image_url": {"url": data_uri_placeholder(item.mime_type, index)}})
+        parsed = await self._complete(user_content, MULTI_IMAGE_SYSTEM_PROMPT, prepared)
+        results = parsed.get("results")
+        if not isinstance(results, list) or len(results) != len(images):
+            raise RuntimeError(
+                f"OpenRouter returned {len(results) if isinstance(results, list) else 'no'} results for {len(images)} images"
+            )
+        # Every image in the batch waited for the whole completion
+        elapsed_ms = int((time.perf_counter() - start) * 1000)
+        partial = parsed.get(PARTIAL_OUTPUT_KEY)
+        outputs = []
+        for entry, image, item in zip(results, images, prepared):
+            entry = dict(entry) if isinstance(entry, dict) else {}
+            if partial is not None:
+                # Which entry the cut landed in isn't known, so none of them can be trusted as complete
+                entry[PARTIAL_OUTPUT_KEY] = {"missing": [k for k in RESULT_FIELDS if k not in entry], "repaired": partial["repaired"]}
+            outputs.append(self._to_result(entry, image, item, elapsed_ms))
+        return outputs
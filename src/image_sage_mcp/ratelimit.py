@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+class OverloadedError(RuntimeError):
+    def __init__(self, name: str, reason: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"'{name}' is overloaded: {reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_image_tokens(width: int, height: int, prompt_tokens: int = 250, output_tokens: int = 400) -> int:
+    # OpenAI-style accounting (85 base + 170 per 512px tile); close enough for budgeting other providers
+    tiles = max(1, math.ceil(max(width, 1) / 512)) * max(1, math.ceil(max(height, 1) / 512))
+    return 85 + 170 * tiles + prompt_tokens + output_tokens
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float) -> None:
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # Requests larger than the bucket are admitted once it is full rather than never
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdmissionController:
+    # Per backend+model admission: a FIFO queue in front of request/token buckets and a
+    # concurrency semaphore. Callers that can't be admitted within `max_wait_seconds` get an
+    # immediate OverloadedError instead of piling onto a backend that would answer 429.
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 0,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_wait_seconds: float = 2.0,
+    ) -> None:
+        self.name = name
+        self.max_wait_seconds = max_wait_seconds
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        # Burst capacity is ten seconds' worth of the per-minute budget
+        self._requests = TokenBucket(requests_per_minute / 60.0, requests_per_minute / 6.0) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute / 6.0) if tokens_per_minute > 0 else None
+        self._queue = asyncio.Lock()
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _bucket_wait(self, tokens: int) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def _reject(self, reason: str, retry_after: Optional[float] = None) -> OverloadedError:
+        self.rejected += 1
+        return OverloadedError(self.name, reason, retry_after)
+
+    @asynccontextmanager
+    async def admit(self, tokens: int = 0) -> AsyncIterator[None]:
+        deadline = time.monotonic() + self.max_wait_seconds
+        self.waiting += 1
+        try:
+            # asyncio.Lock wakes waiters in arrival order, which makes the queue fair
+            try:
+                await asyncio.wait_for(self._queue.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._reject("admission queue wait exceeded") from None
+            try:
+                wait = self._bucket_wait(tokens)
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    # Fail fast: no point sleeping if the budget can't refill in time
+                    raise self._reject("rate limit budget exhausted", retry_after=wait)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if self._slots is not None:
+                    try:
+                        await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        raise self._reject("too many concurrent requests") from None
+                if self._requests is not None:
+                    self._requests.take(1)
+                if self._tokens is not None:
+                    self._tokens.take(tokens)
+            finally:
+                self._queue.release()
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+        }
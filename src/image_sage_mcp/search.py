@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .context import AppContext
+from .metrics import stage
+from .pipeline import record_outcome
+from .store import SearchQuery, fts_expression
+
+
+SEARCH_TOOL_SCHEMA: Dict[str, Any] = {
+    "name": "Image Sage Search",
+    "description": (
+        "Search images analyzed earlier by words in their description or OCR text and by detected objects, "
+        "scene type or people, without re-analyzing them"
+    ),
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Words that must all appear in the description or OCR text; end a word with * for prefix match"},
+            "objects": {"type": "array", "items": {"type": "string"}, "description": "Objects that must all have been detected"},
+            "scene_type": {"type": "string", "description": "Exact scene type, e.g. screenshot"},
+            "contains_person": {"type": "boolean", "description": "Only images with (true) or without (false) people"},
+            "source": {"type": "string", "description": "URL or path prefix the image was loaded from"},
+            "content_hash": {"type": "string", "description": "SHA-256 of the image bytes, as returned by the batch tool"},
+            "limit": {"type": "integer", "minimum": 1, "maximum": 200, "default": 20},
+        },
+    },
+}
+
+
+def split_objects(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    if isinstance(value, (list, tuple)):
+        return [str(part).strip() for part in value if str(part).strip()]
+    return []
+
+
+def build_query(arguments: Dict[str, Any]) -> Tuple[SearchQuery, Optional[str]]:
+    # Tool arguments to a query, plus an error message when the text has nothing to match on
+    person = arguments.get("contains_person")
+    try:
+        limit = int(arguments.get("limit") or 20)
+    except (TypeError, ValueError):
+        limit = 20
+    query = SearchQuery(
+        text=str(arguments.get("query") or ""),
+        objects=split_objects(arguments.get("objects")),
+        scene_type=str(arguments["scene_type"]) if arguments.get("scene_type") else None,
+        contains_person=person if isinstance(person, bool) else None,
+        source=str(arguments["source"]) if arguments.get("source") else None,
+        digest=str(arguments["content_hash"]).lower() if arguments.get("content_hash") else None,
+        limit=limit,
+    )
+    if query.text.strip() and not fts_expression(query.text):
+        return query, "Query has no searchable words"
+    return query, None
+
+
+async def run_search(context: AppContext, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    formatter = context.formatter
+    store = context.store
+    if store is None:
+        return formatter.format_error_response("STORE_DISABLED", "The analysis store is not enabled", {})
+    query, problem = build_query(arguments)
+    if problem:
+        return formatter.format_error_response("INVALID_REQUEST", problem, {"query": query.text})
+    start = time.perf_counter()
+    try:
+        with stage("search"):
+            results = await store.search(query)
+    except Exception as exc:  # noqa: BLE001
+        response = formatter.format_error_response("SEARCH_ERROR", "Search failed", {"reason": str(exc)})
+    else:
+        response = {"results": results, "count": len(results), "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+    record_outcome("search", response)
+    return response
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
 import os
 import sys
 
-from .config import load_config
-from .fetcher import ImageFetcher
-from .formatter import ResponseFormatter
-from .models import ImageData
-from .processor import OpenRouterBackend, StubBackend, VisionProcessor
-from .validation import URLValidator
+from .batch import BATCH_TOOL_SCHEMA, run_batch
+from .context import AppContext, ContextHolder
+from .metrics import metrics_server
+from .pipeline import run_image_sage
+from .search import SEARCH_TOOL_SCHEMA, run_search
 
 
 TOOL_SCHEMA: Dict[str, Any] = {
@@ -38,51 +39,22 @@ TOOL_SCHEMA: Dict[str, Any] = {
 }
 
 
-async def _handle_image_sage(url: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    config = load_config()
+_HOLDER: Optional[ContextHolder] = None
 
-    validator = URLValidator(allowed_roots=config.allowed_fs_roots)
-    # Temporarily extend allowed roots from config for local files
-    vr = validator.validate_url(url)
-    if not vr.ok:
-        return ResponseFormatter().format_error_response(
-            "INVALID_URL",
-            vr.message or "Invalid URL",
-            {"url": url, "allowed_fs_roots": config.allowed_fs_roots},
-        )
 
-    fetcher = ImageFetcher(timeout_seconds=config.request_timeout_seconds, max_size_mb=config.max_image_size_mb)
-    try:
-        if url.startswith("http://") or url.startswith("https://"):
-            image: ImageData = await fetcher.fetch_from_url(url)
-        else:
-            # local path or file://
-            path = url
-            if url.startswith("file://"):
-                path = url[len("file://") :]
-            image = await fetcher.fetch_from_file(path)
-    except Exception as exc:  # noqa: BLE001
-        return ResponseFormatter().format_error_response(
-            "FETCH_ERROR",
-            "Unable to fetch or read image",
-            {"url": url, "reason": str(exc), "allowed_fs_roots": config.allowed_fs_roots},
-        )
+def _get_holder() -> ContextHolder:
+    global _HOLDER
+    if _HOLDER is None:
+        _HOLDER = ContextHolder()
+    return _HOLDER
 
-    backends = []
-    if "openrouter" in config.vision_backends and config.api_keys.get("openrouter"):
-        backends.append(
-            OpenRouterBackend(api_key=config.api_keys["openrouter"], model=config.openrouter_model, timeout_seconds=config.request_timeout_seconds)
-        )
-    # Always include stub as a final fallback
-    backends.append(StubBackend())
-    processor = VisionProcessor(backends=backends)
-    try:
-        analysis = await processor.analyze_image(image, options)
-    except Exception as exc:  # noqa: BLE001
-        return ResponseFormatter().format_error_response(
-            "PROCESSING_ERROR", "Vision processing failed", {"reason": str(exc)}
-        )
-    return ResponseFormatter().format_success_response(analysis)
+
+async def _handle_image_sage(url: str, options: Optional[Dict[str, Any]] = None, context: Optional[AppContext] = None) -> Dict[str, Any]:
+    if context is None:
+        async with _get_holder().session() as ctx:
+            return await _handle_image_sage(url, options, ctx)
+
+    return await run_image_sage(context, url, options)
 
 
 def main() -> None:
@@ -98,7 +70,22 @@ def main() -> None:
         sys.stderr.write(f"[image-sage-mcp] starting (pid={os.getpid()})\n")
         sys.stderr.flush()
 
-    mcp = FastMCP("image-sage-mcp")
+    holder = _get_holder()
+    holder.install_signal_handler()
+
+    @asynccontextmanager
+    async def lifespan(_server: Any) -> AsyncIterator[None]:
+        # Build the shared context up front so the first tool call doesn't pay for it
+        context = await holder.current()
+        await context.preload()
+        try:
+            # Bound once at startup; changing the port needs a restart
+            async with metrics_server(context.config.metrics_host, context.config.metrics_port):
+                yield None
+        finally:
+            await holder.aclose()
+
+    mcp = FastMCP("image-sage-mcp", lifespan=lifespan)
 
     @mcp.tool(
         name=TOOL_SCHEMA["name"],
@@ -108,7 +95,52 @@ def main() -> None:
         if os.getenv("IMAGE_SAGE_DEBUG", ""):
             sys.stderr.write(f"[image-sage-mcp] tool call: url={url}\n")
             sys.stderr.flush()
-        return await _handle_image_sage(url, options)
+        async with holder.session() as context:
+            return await _handle_image_sage(url, options, context)
+
+    @mcp.tool(
+        name=BATCH_TOOL_SCHEMA["name"],
+        description=BATCH_TOOL_SCHEMA["description"],
+    )
+    async def image_sage_batch(
+        urls: List[str], options: Optional[Dict[str, Any]] = None, concurrency: Optional[int] = None
+    ) -> Dict[str, Any]:
+        if os.getenv("IMAGE_SAGE_DEBUG", ""):
+            sys.stderr.write(f"[image-sage-mcp] batch call: {len(urls)} item(s)\n")
+            sys.stderr.flush()
+        request_ctx = mcp.get_context()
+
+        async def progress(done: int, total: int, item: Dict[str, Any]) -> None:
+            # Each finished item is streamed as a progress notification (no-op without a progress token)
+            await request_ctx.report_progress(done, total, json.dumps(item, separators=(",", ":")))
+
+        async with holder.session() as context:
+            return await run_batch(context, urls, options, concurrency, progress)
+
+    @mcp.tool(
+        name=SEARCH_TOOL_SCHEMA["name"],
+        description=SEARCH_TOOL_SCHEMA["description"],
+    )
+    async def image_sage_search(
+        query: Optional[str] = None,
+        objects: Optional[List[str]] = None,
+        scene_type: Optional[str] = None,
+        contains_person: Optional[bool] = None,
+        source: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        limit: int = 20,
+    ) -> Dict[str, Any]:
+        arguments = {
+            "query": query,
+            "objects": objects,
+            "scene_type": scene_type,
+            "contains_person": contains_person,
+            "source": source,
+            "content_hash": content_hash,
+            "limit": limit,
+        }
+        async with holder.session() as context:
+            return await run_search(context, arguments)
 
     mcp.run()
 
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from .cache import analysis_to_dict
+from .models import AnalysisResult
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    source TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    model TEXT NOT NULL,
+    options TEXT NOT NULL,
+    contains_person INTEGER NOT NULL,
+    scene_type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    ocr_text TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    analyzed_at REAL NOT NULL,
+    result TEXT NOT NULL,
+    UNIQUE (digest, source)
+);
+CREATE INDEX IF NOT EXISTS analyses_scene ON analyses (scene_type);
+CREATE INDEX IF NOT EXISTS analyses_person ON analyses (contains_person);
+CREATE INDEX IF NOT EXISTS analyses_source ON analyses (source);
+CREATE INDEX IF NOT EXISTS analyses_analyzed_at ON analyses (analyzed_at);
+CREATE TABLE IF NOT EXISTS objects (
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    object TEXT NOT NULL,
+    PRIMARY KEY (object, analysis_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5 (
+    description, ocr_text, content='analyses', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS analyses_ai AFTER INSERT ON analyses BEGIN
+    INSERT INTO analyses_fts (rowid, description, ocr_text) VALUES (new.id, new.description, new.ocr_text);
+END;
+CREATE TRIGGER IF NOT EXISTS analyses_ad AFTER DELETE ON analyses BEGIN
+    INSERT INTO analyses_fts (analyses_fts, rowid, description, ocr_text) VALUES ('delete', old.id, old.description, old.ocr_text);
+END;
+CREATE TRIGGER IF NOT EXISTS analyses_au AFTER UPDATE ON analyses BEGIN
+    INSERT INTO analyses_fts (analyses_fts, rowid, description, ocr_text) VALUES ('delete', old.id, old.description, old.ocr_text);
+    INSERT INTO analyses_fts (rowid, description, ocr_text) VALUES (new.id, new.description, new.ocr_text);
+END;
+"""
+
+UPSERT = """
+INSERT INTO analyses (
+    digest, source, backend, model, options, contains_person, scene_type, description, ocr_text,
+    confidence, width, height, analyzed_at, result
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (digest, source) DO UPDATE SET
+    backend = excluded.backend, model = excluded.model, options = excluded.options,
+    contains_person = excluded.contains_person, scene_type = excluded.scene_type,
+    description = excluded.description, ocr_text = excluded.ocr_text, confidence = excluded.confidence,
+    width = excluded.width, height = excluded.height, analyzed_at = excluded.analyzed_at, result = excluded.result
+"""
+
+MAX_SEARCH_RESULTS = 200
+FTS_TOKEN = re.compile(r"[\w\-']+\*?", re.UNICODE)
+
+
+@dataclass
+class StoreRecord:
+    digest: str
+    source: str
+    model: str
+    options: Dict[str, Any]
+    analysis: AnalysisResult
+    analyzed_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class SearchQuery:
+    text: str = ""
+    objects: List[str] = field(default_factory=list)
+    scene_type: Optional[str] = None
+    contains_person: Optional[bool] = None
+    source: Optional[str] = None
+    digest: Optional[str] = None
+    limit: int = 20
+
+
+def fts_expression(text: str) -> str:
+    # Every word must match; words are quoted so user input can't form FTS5 syntax. A trailing
+    # `*` keeps prefix search
+    terms = []
+    for token in FTS_TOKEN.findall(text):
+        prefix = token.endswith("*")
+        word = token.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class AnalysisStore:
+    # SQLite index of every real analysis, keyed by content hash and source. Requests only append
+    # to an in-memory queue; a background task writes it out in one transaction per batch on the
+    # store's own thread, so disk I/O stays off the request path.
+    def __init__(self, path: str, batch_size: int = 64, flush_seconds: float = 0.5, max_pending: int = 10000) -> None:
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._pending: Deque[StoreRecord] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-sage-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional["asyncio.Task[None]"] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record(self, record: StoreRecord) -> None:
+        if self.closed:
+            return
+        if len(self._pending) >= self.max_pending:
+            # Losing the oldest index entry beats growing without bound behind a stuck disk
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(record)
+        self._ensure_writer()
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._lock = self._lock or asyncio.Lock()
+            self._writer = asyncio.ensure_future(self._write_loop())
+
+    async def _write_loop(self) -> None:
+        assert self._wakeup is not None
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+                    self.written += len(batch)
+                except Exception as exc:  # noqa: BLE001
+                    self.failed += len(batch)
+                    sys.stderr.write(f"[image-sage-mcp] analysis store write failed: {exc}\n")
+                    sys.stderr.flush()
+
+    def _write(self, batch: List[StoreRecord]) -> None:
+        conn = self._connect()
+        with conn:
+            for item in batch:
+                analysis = item.analysis
+                conn.execute(
+                    UPSERT,
+                    (
+                        item.digest,
+                        item.source,
+                        analysis.backend_used,
+                        item.model,
+                        json.dumps(item.options, sort_keys=True),
+                        int(analysis.contains_person),
+                        analysis.scene_type,
+                        analysis.description,
+                        analysis.ocr_text,
+                        float(analysis.confidence),
+                        analysis.metadata.width,
+                        analysis.metadata.height,
+                        item.analyzed_at,
+                        json.dumps(analysis_to_dict(analysis), separators=(",", ":"), default=str),
+                    ),
+                )
+                analysis_id = conn.execute("SELECT id FROM analyses WHERE digest = ? AND source = ?", (item.digest, item.source)).fetchone()[0]
+                conn.execute("DELETE FROM objects WHERE analysis_id = ?", (analysis_id,))
+                objects = {str(o).strip().lower() for o in analysis.objects_detected if str(o).strip()}
+                conn.executemany("INSERT INTO objects (analysis_id, object) VALUES (?, ?)", [(analysis_id, o) for o in objects])
+
+    def _search(self, query: SearchQuery) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        clauses: List[str] = []
+        params: List[Any] = []
+        expression = fts_expression(query.text)
+        for obj in query.objects:
+            clauses.append("EXISTS (SELECT 1 FROM objects o WHERE o.analysis_id = a.id AND o.object = ?)")
+            params.append(obj.strip().lower())
+        if query.scene_type:
+            clauses.append("a.scene_type = ? COLLATE NOCASE")
+            params.append(query.scene_type)
+        if query.contains_person is not None:
+            clauses.append("a.contains_person = ?")
+            params.append(int(query.contains_person))
+        if query.source:
+            # Prefix match, so a directory or site finds everything under it
+            clauses.append("a.source >= ? AND a.source < ?")
+            params += [query.source, query.source + "\uffff"]
+        if query.digest:
+            clauses.append("a.digest = ?")
+            params.append(query.digest)
+        where = " AND ".join(clauses) or "1"
+        if expression:
+            sql = (
+                "SELECT a.*, snippet(analyses_fts, -1, '[', ']', '...', 12) AS snippet, bm25(analyses_fts) AS rank "
+                "FROM analyses a JOIN analyses_fts ON analyses_fts.rowid = a.id "
+                f"WHERE analyses_fts MATCH ? AND {where} ORDER BY rank LIMIT ?"
+            )
+            params = [expression] + params
+        else:
+            sql = f"SELECT a.*, NULL AS snippet, NULL AS rank FROM analyses a WHERE {where} ORDER BY a.analyzed_at DESC LIMIT ?"
+        params.append(max(1, min(query.limit, MAX_SEARCH_RESULTS)))
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        rows = cursor.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            objects = [r[0] for r in conn.execute("SELECT object FROM objects WHERE analysis_id = ? ORDER BY object", (row["id"],))]
+            item: Dict[str, Any] = {
+                "source": row["source"],
+                "content_hash": row["digest"],
+                "contains_person": bool(row["contains_person"]),
+                "objects_detected": objects,
+                "scene_type": row["scene_type"],
+                "description": row["description"],
+                "confidence": row["confidence"],
+                "width": row["width"],
+                "height": row["height"],
+                "backend_used": row["backend"],
+                "analyzed_at": row["analyzed_at"],
+            }
+            if row["snippet"]:
+                item["match"] = row["snippet"]
+            results.append(item)
+        return results
+
+    async def search(self, query: SearchQuery) -> List[Dict[str, Any]]:
+        # Queued writes go out first so a search sees every analysis that already returned
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._search, query)
+
+    def _count(self) -> int:
+        return int(self._connect().execute("SELECT COUNT(*) FROM analyses").fetchone()[0])
+
+    async def count(self) -> int:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._count)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped, "failed": self.failed}
+
+    async def aclose(self) -> None:
+        self.closed = True
+        await self.flush()
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+
+        def close() -> None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, close)
+        self._executor.shutdown(wait=False)
+
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+# Rough characters-per-token ratio used to enforce the output budget on the streamed text
+CHARS_PER_TOKEN = 4
+# Longest tail trimmed when repairing a truncated member (covers a cut-off \uXXXX escape)
+MAX_REPAIR_TRIM = 6
+CLOSERS = {"{": "}", "[": "]"}
+
+
+@dataclass
+class ParsedObject:
+    fields: Dict[str, Any]
+    # True when anything was repaired or lost; `repaired` names the members that were closed up
+    partial: bool = False
+    repaired: List[str] = field(default_factory=list)
+
+
+class IncrementalJSONParser:
+    # Parses a single top-level JSON object as text arrives. Each top-level member is decoded as
+    # soon as the comma or brace after it is seen, so callers can act on fields before the
+    # document is complete, and a malformed member costs only itself rather than the whole object.
+    def __init__(self) -> None:
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.dropped = 0
+        self.done = False
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[str]:
+        if self.done or not chunk:
+            return []
+        self.text += chunk
+        completed: List[str] = []
+        text = self.text
+        for index in range(self._pos, len(text)):
+            char = text[index]
+            if self._member_start is None:
+                # Anything before the opening brace (prose, code fences) is ignored
+                if char == "{":
+                    self._stack.append(char)
+                    self._member_start = index + 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in CLOSERS:
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    completed += self._finish(text[self._member_start : index])
+                    self.done = True
+                    self._pos = index + 1
+                    return completed
+            elif char == "," and len(self._stack) == 1:
+                completed += self._finish(text[self._member_start : index])
+                self._member_start = index + 1
+        self._pos = len(text)
+        return completed
+
+    def _finish(self, member: str) -> List[str]:
+        member = member.strip()
+        if not member:
+            return []
+        try:
+            decoded = json.loads("{" + member + "}")
+        except ValueError:
+            self.dropped += 1
+            return []
+        self.fields.update(decoded)
+        return list(decoded)
+
+    def _repair_pending(self) -> Dict[str, Any]:
+        # Close whatever the truncated member left open: the string, then nested containers
+        if self.done or self._member_start is None:
+            return {}
+        member = self.text[self._member_start :].rstrip()
+        for trim in range(min(MAX_REPAIR_TRIM, len(member)) + 1):
+            candidate = member[: len(member) - trim] if trim else member
+            in_string, stack = _scan(candidate)
+            candidate = candidate + ('"' if in_string else "")
+            candidate = candidate.rstrip().rstrip(",")
+            closing = "".join(CLOSERS[opener] for opener in reversed(stack[1:] if stack and stack[0] == "{" else stack))
+            try:
+                decoded = json.loads("{" + candidate + closing + "}")
+            except ValueError:
+                continue
+            if not isinstance(decoded, dict):
+                return {}
+            # A cut-off string or list is still a prefix of the real value; a cut-off number or
+            # literal is a guess (0.8 may have been 0.85), so it is dropped
+            return {key: value for key, value in decoded.items() if isinstance(value, (str, list, dict))}
+        return {}
+
+    def result(self, repair: bool = True) -> ParsedObject:
+        # Everything decodable so far. An unfinished member is repaired unless the caller stopped
+        # reading on purpose and has no use for it
+        if self.done or not repair:
+            return ParsedObject(dict(self.fields), partial=self.dropped > 0)
+        repaired = self._repair_pending()
+        return ParsedObject({**self.fields, **repaired}, partial=True, repaired=list(repaired))
+
+
+def _scan(member: str) -> Tuple[bool, List[str]]:
+    # String and bracket state at the end of a member fragment; the fragment starts inside the
+    # top-level object, so the stack is seeded with it
+    stack: List[str] = ["{"]
+    in_string = False
+    escape = False
+    for char in member:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            stack.append(char)
+        elif char in "}]" and len(stack) > 1:
+            stack.pop()
+    # A dangling backslash escapes the closing quote; the caller's trim-and-retry handles it
+    return in_string, stack
+
+
+def parse_json_object(text: str) -> ParsedObject:
+    # Strict parse first; otherwise keep every member that decodes and repair a truncated tail
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        return ParsedObject(parsed)
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.result()
+
+
+async def sse_data(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    # Server-sent events: yields each `data:` payload; comments and other fields are skipped
+    async for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            return
+        if data:
+            yield data
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import ImageOps, ImageStat
+
+from .metrics import REGISTRY
+from .models import AnalysisResult, ImageData, ImageMetadata
+from .processor import VisionProcessor, normalize_options
+from .ratelimit import OverloadedError
+from .workers import INLINE_WORKERS, ImageWorkerPool
+
+
+# Standard deviation (0-255 grey levels) below which a tile has nothing to read
+UNIFORM_STDDEV = 3.0
+MISSING_REASONS = ("failed", "timed_out", "overloaded", "fallback")
+TILE_QUALITY = 90
+Box = Tuple[int, int, int, int]
+
+
+@dataclass
+class TileSettings:
+    tile_px: int = 1024
+    overlap: float = 0.1
+    max_tiles: int = 16
+    min_px: int = 2048
+    concurrency: int = 4
+    # Per call, counted from when the tile gets its slot, so queued tiles don't eat each other's time
+    timeout_seconds: float = 10.0
+    # Whole tiled request; tiles still running when it passes are reported as timed out
+    deadline_seconds: float = 30.0
+
+
+@dataclass
+class Tile:
+    row: int
+    col: int
+    box: Box
+    # None when the tile is empty or uniform and not worth a backend call
+    image: Optional[ImageData]
+
+
+@dataclass
+class TilePlan:
+    overview: Optional[AnalysisResult]
+    tiles: List[Tile]
+    results: Dict[int, AnalysisResult] = field(default_factory=dict)
+    # Tiles that were sent but contributed nothing, with the reason: failed, timed_out,
+    # overloaded (refused by admission control) or fallback (answered only by a placeholder)
+    missing: Dict[int, str] = field(default_factory=dict)
+    retry_after: Optional[float] = None
+
+    def count(self, reason: str) -> int:
+        return sum(1 for r in self.missing.values() if r == reason)
+
+
+def should_tile(image: ImageData, options: Optional[Dict[str, Any]], settings: Optional[TileSettings]) -> bool:
+    if settings is None or normalize_options(options)["detail_level"] != "high":
+        return False
+    return max(image.width or 0, image.height or 0) > settings.min_px
+
+
+def _axis(length: int, tile: int, overlap: float) -> List[Tuple[int, int]]:
+    if length <= tile:
+        return [(0, length)]
+    stride = max(1, int(tile * (1.0 - overlap)))
+    count = math.ceil((length - tile) / stride) + 1
+    # Spread the tiles evenly so the last one ends exactly on the edge
+    step = (length - tile) / (count - 1)
+    return [(int(round(i * step)), int(round(i * step)) + tile) for i in range(count)]
+
+
+def plan_grid(width: int, height: int, settings: TileSettings) -> List[List[Box]]:
+    tile = settings.tile_px
+    while True:
+        cols = _axis(width, tile, settings.overlap)
+        rows = _axis(height, tile, settings.overlap)
+        if len(cols) * len(rows) <= max(1, settings.max_tiles):
+            break
+        # Too many tiles: grow them instead; the upload profile downscales oversized tiles
+        tile = int(tile * 1.25) + 1
+    return [[(x0, y0, x1, y1) for x0, x1 in cols] for y0, y1 in rows]
+
+
+def split_tiles(image: ImageData, settings: TileSettings) -> List[Tile]:
+    # Decodes once and crops every tile from the same frame; runs on the image worker pool
+    tiles: List[Tile] = []
+    with image.open_image() as source:
+        source.seek(0)
+        frame = ImageOps.exif_transpose(source).convert("RGB")
+    for row, line in enumerate(plan_grid(frame.width, frame.height, settings)):
+        for col, box in enumerate(line):
+            crop = frame.crop(box)
+            sample = crop.convert("L")
+            sample.thumbnail((128, 128))
+            if ImageStat.Stat(sample).stddev[0] < UNIFORM_STDDEV:
+                tiles.append(Tile(row, col, box, None))
+                continue
+            out = io.BytesIO()
+            crop.save(out, format="JPEG", quality=TILE_QUALITY)
+            data = out.getvalue()
+            tiles.append(Tile(row, col, box, ImageData(data, "image/jpeg", "JPEG", len(data), crop.width, crop.height)))
+    return tiles
+
+
+def _usable(result: Optional[AnalysisResult], processor: VisionProcessor) -> bool:
+    if result is None:
+        return False
+    fallbacks = {b.name for b in processor.backends if b.fallback_only}
+    return result.backend_used not in fallbacks
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    seen: Dict[str, str] = {}
+    for item in items:
+        key = " ".join(str(item).split()).lower()
+        if key and key not in seen:
+            seen[key] = str(item).strip()
+    return list(seen.values())
+
+
+def _lines(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def merge_ocr(tiles: List[Tile], results: Dict[int, AnalysisResult]) -> str:
+    # Reading order is row-major. Overlapping strips repeat text, so a line is dropped when the
+    # tile to its left or the tile above already produced it
+    by_position = {(tile.row, tile.col): results.get(index) for index, tile in enumerate(tiles)}
+    merged: List[str] = []
+    for index, tile in enumerate(tiles):
+        result = results.get(index)
+        if result is None or not result.ocr_text.strip():
+            continue
+        neighbours = set()
+        for position in ((tile.row, tile.col - 1), (tile.row - 1, tile.col)):
+            other = by_position.get(position)
+            if other is not None:
+                neighbours.update(line.lower() for line in _lines(other.ocr_text))
+        merged.extend(line for line in _lines(result.ocr_text) if line.lower() not in neighbours)
+    return "\n".join(merged)
+
+
+def merge_results(image: ImageData, plan: TilePlan, elapsed_ms: int) -> AnalysisResult:
+    overview = plan.overview
+    analyzed = [(plan.tiles[i], r) for i, r in sorted(plan.results.items())]
+    objects = list(overview.objects_detected) if overview else []
+    for _, result in analyzed:
+        objects.extend(result.objects_detected)
+    # Confidence is area-weighted over the tiles; the overview weighs as much as all tiles together
+    weights = [((t.box[2] - t.box[0]) * (t.box[3] - t.box[1]), r.confidence) for t, r in analyzed]
+    total = sum(w for w, _ in weights)
+    confidence = sum(w * c for w, c in weights) / total if total else 0.0
+    if overview is not None:
+        confidence = (confidence + overview.confidence) / 2 if total else overview.confidence
+        scene_type, description, backend = overview.scene_type, overview.description, overview.backend_used
+        metadata = overview.metadata
+    else:
+        best = max((r for _, r in analyzed), key=lambda r: r.confidence)
+        scene_type = Counter(r.scene_type for _, r in analyzed).most_common(1)[0][0]
+        description, backend = best.description, best.backend_used
+        metadata = ImageMetadata(
+            width=image.width or 0,
+            height=image.height or 0,
+            mime_type=image.mime_type,
+            file_size_bytes=image.file_size_bytes,
+            format=image.format,
+        )
+    rows = max((t.row for t in plan.tiles), default=0) + 1
+    cols = max((t.col for t in plan.tiles), default=0) + 1
+    tiling = {
+        "grid": [rows, cols],
+        "tile_px": max((t.box[2] - t.box[0] for t in plan.tiles), default=0),
+        "analyzed": len(analyzed),
+        "skipped_uniform": sum(1 for t in plan.tiles if t.image is None),
+        **{reason: plan.count(reason) for reason in MISSING_REASONS},
+        "complete": not plan.missing,
+    }
+    if plan.missing:
+        # Callers must be able to tell that the OCR text has holes, and where
+        tiling["missing"] = [
+            {"row": plan.tiles[i].row, "col": plan.tiles[i].col, "box": list(plan.tiles[i].box), "reason": r} for i, r in sorted(plan.missing.items())
+        ]
+        if plan.retry_after is not None:
+            tiling["retry_after_s"] = round(plan.retry_after, 1)
+    extra = {**metadata.extra, "tiling": tiling}
+    partial = [r for r in ([overview] if overview else []) + [r for _, r in analyzed] if "partial_output" in r.metadata.extra]
+    if partial and "partial_output" not in extra:
+        # One cut-off tile makes the merged text incomplete too
+        extra["partial_output"] = {"missing": [], "repaired": sorted({k for r in partial for k in r.metadata.extra["partial_output"].get("repaired", [])})}
+    return AnalysisResult(
+        contains_person=any(r.contains_person for _, r in analyzed) or bool(overview and overview.contains_person),
+        objects_detected=_dedupe(objects),
+        scene_type=scene_type,
+        description=description,
+        ocr_text=merge_ocr(plan.tiles, plan.results) or (overview.ocr_text if overview else ""),
+        confidence=round(confidence, 3),
+        metadata=replace(metadata, extra=extra),
+        processing_time_ms=elapsed_ms,
+        backend_used=backend,
+    )
+
+
+async def analyze_tiled(
+    processor: VisionProcessor,
+    image: ImageData,
+    options: Optional[Dict[str, Any]],
+    settings: TileSettings,
+    workers: Optional[ImageWorkerPool] = None,
+) -> AnalysisResult:
+    # One downscaled overview for the description and scene, plus overlapping tiles at full
+    # resolution for small text and objects. Every call has its own timeout and the whole
+    # request a deadline, after which whatever finished is merged
+    start = time.perf_counter()
+    workers = workers or INLINE_WORKERS
+    tiles = await workers.run_image(split_tiles, image, settings)
+    limit = asyncio.Semaphore(max(1, settings.concurrency))
+
+    async def run_tile(tile: Tile) -> AnalysisResult:
+        async with limit:
+            return await asyncio.wait_for(processor.analyze_image(tile.image, options), settings.timeout_seconds)  # type: ignore[arg-type]
+
+    overview_task = asyncio.ensure_future(asyncio.wait_for(processor.analyze_image(image, options), settings.timeout_seconds))
+    tile_tasks = {index: asyncio.ensure_future(run_tile(tile)) for index, tile in enumerate(tiles) if tile.image is not None}
+    try:
+        _, pending = await asyncio.wait([overview_task, *tile_tasks.values()], timeout=settings.deadline_seconds)
+    finally:
+        for task in (overview_task, *tile_tasks.values()):
+            task.cancel()
+    plan = TilePlan(overview=None, tiles=tiles)
+    overloaded: Optional[OverloadedError] = None
+    for index, task in tile_tasks.items():
+        error = asyncio.TimeoutError() if task in pending else task.exception()
+        if error is None and _usable(task.result(), processor):
+            plan.results[index] = task.result()
+        elif error is None:
+            plan.missing[index] = "fallback"
+        elif isinstance(error, asyncio.TimeoutError):
+            plan.missing[index] = "timed_out"
+        elif isinstance(error, OverloadedError):
+            plan.missing[index] = "overloaded"
+            overloaded = error
+            if error.retry_after is not None:
+                plan.retry_after = max(plan.retry_after or 0.0, error.retry_after)
+        else:
+            plan.missing[index] = "failed"
+    overview_error = asyncio.TimeoutError() if overview_task in pending else overview_task.exception()
+    if overview_error is None and (_usable(overview_task.result(), processor) or not plan.results):
+        plan.overview = overview_task.result()
+    outcomes = {"analyzed": len(plan.results), "skipped": sum(1 for t in tiles if t.image is None)}
+    outcomes.update({reason: plan.count(reason) for reason in MISSING_REASONS})
+    for outcome, count in outcomes.items():
+        if count:
+            REGISTRY.inc("image_sage_tiles_total", count, help="High-detail tiles by outcome", outcome=outcome)
+    if not plan.results:
+        # Without a single tile the answer is no better than an untiled one; admission control
+        # refusing the tiles is reported as such so the caller retries instead of trusting it
+        if overloaded is not None and (plan.overview is None or not _usable(plan.overview, processor)):
+            raise overloaded
+        if plan.overview is None:
+            if overview_error is not None:
+                raise overview_error
+            raise RuntimeError("Tiled analysis produced no result")
+    return merge_results(image, plan, int((time.perf_counter() - start) * 1000))
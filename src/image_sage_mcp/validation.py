@@ -1,32 +1,171 @@
 from __future__ import annotations
 
+import asyncio
+import bisect
 import ipaddress
 import os
 import socket
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 import re
 from urllib.parse import urlparse
 
 
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
 PRIVATE_NETWORKS = [
-    ipaddress.ip_network("127.0.0.0/8"),
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
-    ipaddress.ip_network("::1/128"),
+    ipaddress.ip_network(n)
+    for n in (
+        "0.0.0.0/8",  # "this" network
+        "10.0.0.0/8",
+        "100.64.0.0/10",  # carrier-grade NAT
+        "127.0.0.0/8",
+        "169.254.0.0/16",  # link-local (cloud metadata endpoints)
+        "172.16.0.0/12",
+        "192.0.0.0/24",
+        "192.0.2.0/24",
+        "192.168.0.0/16",
+        "198.18.0.0/15",
+        "198.51.100.0/24",
+        "203.0.113.0/24",
+        "224.0.0.0/4",  # multicast
+        "240.0.0.0/4",  # reserved + broadcast
+        "::/96",  # unspecified, loopback and deprecated IPv4-compatible
+        "100::/64",  # discard-only
+        "2001:db8::/32",
+        "fc00::/7",  # unique local
+        "fe80::/10",  # link-local
+        "fec0::/10",  # deprecated site-local
+        "ff00::/8",  # multicast
+    )
 ]
+# IPv6 prefixes that embed an IPv4 address in their low 32 bits
+NAT64_NETWORKS = [ipaddress.ip_network("64:ff9b::/96"), ipaddress.ip_network("64:ff9b:1::/48")]
+
+
+class AddressRangeSet:
+    # Networks flattened into sorted, merged integer ranges per IP version; lookups are a bisect
+    def __init__(self, networks: Iterable[IPNetwork]) -> None:
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        for version in (4, 6):
+            ranges = sorted(
+                (int(n.network_address), int(n.broadcast_address)) for n in networks if n.version == version
+            )
+            merged: List[Tuple[int, int]] = []
+            for start, end in ranges:
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self._starts[version] = [r[0] for r in merged]
+            self._ends[version] = [r[1] for r in merged]
+
+    def __contains__(self, ip: IPAddress) -> bool:
+        starts = self._starts[ip.version]
+        value = int(ip)
+        idx = bisect.bisect_right(starts, value) - 1
+        return idx >= 0 and value <= self._ends[ip.version][idx]
+
+
+_BLOCKED = AddressRangeSet(PRIVATE_NETWORKS)
+
+
+def is_private_address(ip: Union[str, IPAddress]) -> bool:
+    try:
+        ip_obj = ipaddress.ip_address(ip) if isinstance(ip, str) else ip
+    except ValueError:
+        return True
+    if ip_obj.version == 6:
+        # Unwrap IPv6 forms that tunnel to an IPv4 destination and check that too
+        embedded: List[ipaddress.IPv4Address] = []
+        if ip_obj.ipv4_mapped is not None:
+            embedded.append(ip_obj.ipv4_mapped)
+        if ip_obj.sixtofour is not None:
+            embedded.append(ip_obj.sixtofour)
+        if ip_obj.teredo is not None:
+            embedded.extend(ip_obj.teredo)
+        if any(ip_obj in net for net in NAT64_NETWORKS):
+            embedded.append(ipaddress.IPv4Address(int(ip_obj) & 0xFFFFFFFF))
+        if any(addr in _BLOCKED for addr in embedded):
+            return True
+    return ip_obj in _BLOCKED
+
+
+class DNSResolver:
+    # Async resolution (getaddrinfo in the loop's executor) with a bounded TTL cache.
+    # Only lists of addresses that passed the private-network check are cached.
+    def __init__(
+        self, ttl_seconds: float = 60.0, max_entries: int = 1024, timeout_seconds: float = 5.0, allow_private: bool = False
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.timeout_seconds = timeout_seconds
+        self.allow_private = allow_private
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+
+    def cached(self, host: str) -> Optional[List[str]]:
+        entry = self._entries.get(host.lower())
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._entries.pop(host.lower(), None)
+            return None
+        self._entries.move_to_end(host.lower())
+        return entry[1]
+
+    async def resolve_safe(self, host: str) -> Optional[List[str]]:
+        # Returns the validated addresses, or None if resolution failed or any address is private
+        host = host.strip("[]").lower()
+        try:
+            literal = ipaddress.ip_address(host)
+        except ValueError:
+            literal = None
+        if literal is not None:
+            return None if is_private_address(literal) and not self.allow_private else [str(literal)]
+        cached = self.cached(host)
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        try:
+            addr_info = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, type=socket.SOCK_STREAM), timeout=self.timeout_seconds
+            )
+        except (socket.gaierror, asyncio.TimeoutError, UnicodeError, OSError):
+            return None
+        addresses: List[str] = []
+        for family, _, _, _, sockaddr in addr_info:
+            if family not in (socket.AF_INET, socket.AF_INET6):
+                continue
+            ip_str = str(sockaddr[0]).split("%", 1)[0]
+            if is_private_address(ip_str) and not self.allow_private:
+                return None
+            if ip_str not in addresses:
+                addresses.append(ip_str)
+        if not addresses:
+            return None
+        self._entries[host] = (time.monotonic() + self.ttl_seconds, addresses)
+        self._entries.move_to_end(host)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return addresses
 
 
 @dataclass
 class ValidationResult:
     ok: bool
     message: Optional[str] = None
+    addresses: Optional[List[str]] = None
 
 
 class URLValidator:
-    def __init__(self, allowed_roots: Optional[List[str]] = None) -> None:
+    def __init__(self, allowed_roots: Optional[List[str]] = None, resolver: Optional[DNSResolver] = None) -> None:
         self.allowed_roots = allowed_roots or []
+        self.resolver = resolver or DNSResolver()
 
     def _is_windows_drive_path(self, url: str) -> bool:
         return bool(re.match(r"^[a-zA-Z]:[\\/]", url))
@@ -47,7 +186,21 @@ class URLValidator:
         else:
             return ValidationResult(False, "Unsupported URL scheme")
 
+    async def validate_url_async(self, url: str) -> ValidationResult:
+        # Same rules as validate_url, but DNS resolution doesn't block the event loop
+        parsed = urlparse(url)
+        if parsed.scheme in {"http", "https"}:
+            if not parsed.netloc or not parsed.hostname:
+                return ValidationResult(False, "Missing host in URL")
+            addresses = await self.resolver.resolve_safe(parsed.hostname)
+            if not addresses:
+                return ValidationResult(False, "URL points to a private or unsafe address")
+            return ValidationResult(True, addresses=addresses)
+        return self.validate_url(url)
+
     def is_safe_url(self, url: str) -> bool:
+        if self.resolver.allow_private:
+            return True
         parsed = urlparse(url)
         try:
             addr_info = socket.getaddrinfo(parsed.hostname, None)
@@ -61,22 +214,31 @@ class URLValidator:
                 ip_str = sockaddr[0]
             if not ip_str:
                 continue
-            ip_obj = ipaddress.ip_address(ip_str)
-            if any(ip_obj in net for net in PRIVATE_NETWORKS):
+            if is_private_address(str(ip_str).split("%", 1)[0]):
                 return False
         return True
 
-    def check_file_permissions(self, path: str, allowed_roots: Optional[List[str]] = None) -> bool:
+    def _in_allowed_roots(self, abs_path: str, allowed_roots: Optional[List[str]] = None) -> bool:
         # Restrict to current working directory subtree by default; allow configurable roots
+        cwd = os.path.abspath(os.getcwd())
+        roots = [cwd]
+        if allowed_roots:
+            roots.extend([os.path.abspath(r) for r in allowed_roots])
+        return any(abs_path.startswith(r + os.sep) or abs_path == r for r in roots)
+
+    def check_file_permissions(self, path: str, allowed_roots: Optional[List[str]] = None) -> bool:
         try:
             abs_path = os.path.abspath(path)
-            cwd = os.path.abspath(os.getcwd())
-            roots = [cwd]
-            if allowed_roots:
-                roots.extend([os.path.abspath(r) for r in allowed_roots])
-            in_allowed = any(abs_path.startswith(r + os.sep) or abs_path == r for r in roots)
+            in_allowed = self._in_allowed_roots(abs_path, allowed_roots)
             return in_allowed and os.path.exists(abs_path) and os.path.isfile(abs_path)
         except Exception:
             return False
 
+    def check_dir_permissions(self, path: str) -> bool:
+        try:
+            abs_path = os.path.abspath(path)
+            return self._in_allowed_roots(abs_path, self.allowed_roots) and os.path.isdir(abs_path)
+        except Exception:
+            return False
+
 
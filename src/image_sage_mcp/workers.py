@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+from .metrics import stage
+from .models import ImageData, LazyImageData
+
+
+T = TypeVar("T")
+
+WORKER_MODES = ("thread", "process", "inline")
+
+
+@dataclass
+class _ImageRef:
+    # Picklable stand-in for an ImageData: a file path (the worker maps the file itself) or the
+    # name of a shared-memory block holding the bytes, plus the probed header fields
+    mime_type: str
+    format: str
+    file_size_bytes: int
+    width: Optional[int]
+    height: Optional[int]
+    animated: bool
+    orientation: int
+    content_hash: Optional[str]
+    path: Optional[str] = None
+    shm_name: Optional[str] = None
+
+
+def _ship(image: ImageData) -> Tuple[_ImageRef, Optional[shared_memory.SharedMemory]]:
+    ref = _ImageRef(
+        mime_type=image.mime_type,
+        format=image.format,
+        file_size_bytes=image.file_size_bytes,
+        width=image.width,
+        height=image.height,
+        animated=image.animated,
+        orientation=image.orientation,
+        content_hash=image.content_hash,
+    )
+    if isinstance(image, LazyImageData):
+        ref.path = image.path
+        return ref, None
+    data = image.buffer
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[: len(data)] = data
+    ref.shm_name = block.name
+    return ref, block
+
+
+class _ViewReader(io.RawIOBase):
+    # Seekable file over a memoryview, so Pillow decodes straight from shared memory
+    def __init__(self, view: memoryview) -> None:
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        count = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:count] = self._view[self._pos : self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class _SharedImageData(ImageData):
+    # Worker-side ImageData over the caller's shared-memory block; nothing is copied until a
+    # consumer asks for bytes. The block is closed (not unlinked) on the last release
+    def __init__(self, block: shared_memory.SharedMemory, ref: _ImageRef) -> None:
+        super().__init__(
+            bytes_data=b"",
+            mime_type=ref.mime_type,
+            format=ref.format,
+            file_size_bytes=ref.file_size_bytes,
+            width=ref.width,
+            height=ref.height,
+            animated=ref.animated,
+            orientation=ref.orientation,
+        )
+        self.users = 0
+        self._block: Optional[shared_memory.SharedMemory] = block
+        self._view: Optional[memoryview] = block.buf[: ref.file_size_bytes]
+
+    @property
+    def buffer(self) -> memoryview:  # type: ignore[override]
+        if self._view is None:
+            raise ValueError("Shared image buffer is closed")
+        return self._view
+
+    def read_bytes(self) -> bytes:
+        return bytes(self.buffer)
+
+    def open_image(self) -> Image.Image:
+        return Image.open(_ViewReader(self.buffer))
+
+    def retain(self) -> None:
+        self.users += 1
+
+    def release(self) -> None:
+        self.users = max(0, self.users - 1)
+        if self.users == 0:
+            self.close()
+
+    def close(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._block is not None:
+            try:
+                self._block.close()
+            except BufferError:
+                # Something still holds a view; the mapping goes when the worker exits
+                return
+            self._block = None
+
+
+def _receive(ref: _ImageRef) -> ImageData:
+    if ref.path is not None:
+        image: ImageData = LazyImageData(
+            path=ref.path,
+            mime_type=ref.mime_type,
+            format=ref.format,
+            file_size_bytes=ref.file_size_bytes,
+            width=ref.width,
+            height=ref.height,
+            animated=ref.animated,
+            orientation=ref.orientation,
+        )
+    else:
+        image = _SharedImageData(shared_memory.SharedMemory(name=ref.shm_name), ref)
+    image.content_hash = ref.content_hash
+    return image
+
+
+def _run_shipped(fn: Callable[..., Any], ref: _ImageRef, args: Tuple[Any, ...]) -> Any:
+    # `fn` must not return anything that aliases the image buffer; it is closed on return
+    image = _receive(ref)
+    image.retain()
+    try:
+        return fn(image, *args)
+    finally:
+        image.release()
+
+
+def _unlink(block: shared_memory.SharedMemory) -> None:
+    block.close()
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ImageWorkerPool:
+    # Runs Pillow/NumPy work off the event loop. CPU-bound jobs go to a thread or process pool;
+    # blocking file I/O always goes to threads. At most `max_workers + max_queue` jobs are
+    # submitted at once; further callers wait for a slot, so bursts queue in the event loop
+    # instead of piling unbounded work (and decoded buffers) into the executor.
+    def __init__(self, mode: str = "thread", max_workers: int = 4, max_queue: int = 16) -> None:
+        self.mode = mode if mode in WORKER_MODES else "thread"
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._cpu: Optional[Executor] = None
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.submitted = 0
+        self.waiting = 0
+
+    def _cpu_executor(self) -> Executor:
+        if self._cpu is None:
+            if self.mode == "process":
+                # spawn: forking a process that runs an event loop and HTTP threads isn't safe
+                self._cpu = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._cpu = ThreadPoolExecutor(self.max_workers, thread_name_prefix="image-sage-cpu")
+        return self._cpu
+
+    def _io_executor(self) -> ThreadPoolExecutor:
+        if self._io is None:
+            self._io = ThreadPoolExecutor(self.max_workers, thread_name_prefix="image-sage-io")
+        return self._io
+
+    def _slot(self) -> asyncio.Semaphore:
+        # Created lazily so the pool can be built outside a running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    async def _submit(self, executor: Executor, fn: Callable[..., T], *args: Any, cleanup: Optional[Callable[[], None]] = None) -> T:
+        # `cleanup` runs once the executor is done with the job, even if the caller was cancelled
+        # while it ran; a job that never got submitted is cleaned up here
+        submitted = False
+        try:
+            slots = self._slot()
+            self.waiting += 1
+            try:
+                await slots.acquire()
+            finally:
+                self.waiting -= 1
+            try:
+                self.submitted += 1
+                future = executor.submit(fn, *args)
+                submitted = True
+                if cleanup is not None:
+                    future.add_done_callback(lambda _future: cleanup())
+                return await asyncio.wrap_future(future)
+            finally:
+                slots.release()
+        finally:
+            if not submitted and cleanup is not None:
+                cleanup()
+
+    async def run_io(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.mode == "inline":
+            return fn(*args)
+        return await self._submit(self._io_executor(), fn, *args)
+
+    async def run_image(self, fn: Callable[..., T], image: ImageData, *args: Any) -> T:
+        # `fn(image, *args)` off the loop; in process mode `fn` must be a module-level function
+        # and its arguments and result picklable
+        with stage("decode", job=fn.__name__.lstrip("_")):
+            return await self._run_image(fn, image, *args)
+
+    async def _run_image(self, fn: Callable[..., T], image: ImageData, *args: Any) -> T:
+        if self.mode == "inline":
+            return fn(image, *args)
+        if self.mode == "thread":
+            return await self._submit(self._cpu_executor(), fn, image, *args)
+        ref, block = _ship(image)
+        # Unlinking as soon as the caller gives up would pull the block from under a worker still
+        # attaching to it, so it goes when the executor's future completes
+        cleanup = (lambda: _unlink(block)) if block is not None else None
+        return await self._submit(self._cpu_executor(), _run_shipped, fn, ref, args, cleanup=cleanup)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "max_workers": self.max_workers, "submitted": self.submitted, "waiting": self.waiting}
+
+    def shutdown(self) -> None:
+        for executor in (self._cpu, self._io):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._cpu = None
+        self._io = None
+
+
+INLINE_WORKERS = ImageWorkerPool(mode="inline")
+
+
+def default_worker_count() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
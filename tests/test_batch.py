@@ -0,0 +1,79 @@
+import asyncio
+
+from PIL import Image
+
+from image_sage_mcp import batch as batch_module
+from image_sage_mcp.context import AppContext
+from image_sage_mcp.models import AnalysisResult, ImageData, ImageMetadata, ServerConfig
+
+
+def test_unexpected_item_errors_do_not_abort_the_batch(monkeypatch, tmp_path):
+    for name, color in (("a.png", "red"), ("b.png", "blue"), ("notes.txt", None)):
+        if color is None:
+            (tmp_path / name).write_text("not an image")
+        else:
+            Image.new("RGB", (8, 8), color).save(tmp_path / name)
+
+    async def analyze(_context, image, _options=None):
+        if image.read_bytes() == (tmp_path / "b.png").read_bytes():
+            raise ValueError("boom")
+        metadata = ImageMetadata(image.width, image.height, image.mime_type, image.file_size_bytes, image.format)
+        return AnalysisResult(False, [], "graphic", "ok", "", 1.0, metadata, 1, "stub")
+
+    monkeypatch.setattr(batch_module, "analyze_image", analyze)
+
+    async def run() -> dict:
+        context = AppContext(ServerConfig(vision_backends=[], api_keys={}, allowed_fs_roots=[str(tmp_path)]))
+        try:
+            return await batch_module.run_batch(context, [str(tmp_path)])
+        finally:
+            await context.aclose()
+
+    response = asyncio.run(run())
+    items = {item["url"].rsplit("/", 1)[-1]: item for item in response["results"]}
+    assert sorted(items) == ["a.png", "b.png"]
+    assert "error" not in items["a.png"]
+    assert items["b.png"]["error"]["code"] == "PROCESSING_ERROR"
+    assert "content_hash" in items["b.png"]
+
+
+class TrackedImage(ImageData):
+    live = 0
+    peak = 0
+
+    def retain(self) -> None:
+        TrackedImage.live += 1
+        TrackedImage.peak = max(TrackedImage.peak, TrackedImage.live)
+
+    def release(self) -> None:
+        TrackedImage.live -= 1
+
+
+def test_fetched_images_held_at_once_stay_bounded(monkeypatch):
+    async def load(_context, url):
+        await asyncio.sleep(0)
+        data = url.encode()
+        image = TrackedImage(data, "image/png", "PNG", len(data), 8, 8)
+        image.retain()
+        return image
+
+    async def analyze(_context, image, _options=None):
+        # Analysis is much slower than fetching, so unbounded fetching would pile up images
+        await asyncio.sleep(0.01)
+        metadata = ImageMetadata(8, 8, image.mime_type, image.file_size_bytes, image.format)
+        return AnalysisResult(False, [], "graphic", "ok", "", 1.0, metadata, 1, "stub")
+
+    monkeypatch.setattr(batch_module, "load_image", load)
+    monkeypatch.setattr(batch_module, "analyze_image", analyze)
+
+    async def run() -> dict:
+        context = AppContext(ServerConfig(vision_backends=[], api_keys={}, batch_concurrency=2))
+        try:
+            return await batch_module.run_batch(context, [f"https://img.test/{i}.png" for i in range(40)])
+        finally:
+            await context.aclose()
+
+    response = asyncio.run(run())
+    assert response["summary"]["succeeded"] == 40
+    assert TrackedImage.live == 0
+    assert TrackedImage.peak <= 4
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import time
+
+from image_sage_mcp.cache import AnalysisCache, DiskCache
+from image_sage_mcp.models import AnalysisResult, ImageMetadata
+
+
+# Fixed expiry so every entry serializes to the same size
+LATER = 4102444800.0
+
+
+def result(description: str) -> AnalysisResult:
+    return AnalysisResult(False, [], "photo", description, "", 0.9, ImageMetadata(10, 10, "image/png", 100, "PNG"), 5, "api")
+
+
+def entry_size(description: str) -> int:
+    cache = AnalysisCache(ttl_seconds=60, max_bytes=1 << 20)
+    cache.put("k", result(description))
+    return cache.size_bytes
+
+
+def test_memory_cache_evicts_least_recently_used_by_size():
+    size = entry_size("a")
+    cache = AnalysisCache(ttl_seconds=60, max_bytes=size * 2)
+    cache.put("a", result("a"))
+    cache.put("b", result("b"))
+    assert cache.get("a").description == "a"
+    cache.put("c", result("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats.evictions == 1 and cache.size_bytes == size * 2
+
+
+def test_entries_larger_than_the_budget_are_not_kept():
+    cache = AnalysisCache(ttl_seconds=60, max_bytes=10)
+    cache.put("a", result("a"))
+    assert len(cache) == 0 and cache.size_bytes == 0
+
+
+def test_expired_entries_are_dropped():
+    cache = AnalysisCache(ttl_seconds=-1, max_bytes=1 << 20)
+    cache.put("a", result("a"))
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1 and len(cache) == 0
+
+
+def test_disk_hits_are_promoted_back_into_memory(tmp_path):
+    first = AnalysisCache(ttl_seconds=60, max_bytes=1 << 20, directory=str(tmp_path))
+    first.put("ab12", result("persisted"))
+    second = AnalysisCache(ttl_seconds=60, max_bytes=1 << 20, directory=str(tmp_path))
+    assert second.get("ab12").description == "persisted"
+    assert second.get("ab12") is not None
+    assert (second.stats.disk_hits, second.stats.memory_hits) == (1, 1)
+
+
+def test_disk_cache_removes_expired_and_corrupt_entries(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.put("aa01", time.time() - 1, {"x": 1})
+    assert disk.get("aa01") is None
+    assert not os.path.exists(disk._path("aa01"))
+    os.makedirs(os.path.dirname(disk._path("bb02")), exist_ok=True)
+    with open(disk._path("bb02"), "w", encoding="utf-8") as f:
+        f.write('{"expires_at": ')
+    assert disk.get("bb02") is None
+    assert not os.path.exists(disk._path("bb02"))
+    disk.put("cc03", time.time() + 60, {"x": 2})
+    assert disk.get("cc03")[1] == {"x": 2}
+    assert not [name for name in os.listdir(os.path.dirname(disk._path("cc03"))) if name.endswith(".tmp")]
+    with open(disk._path("cc03"), encoding="utf-8") as f:
+        assert json.load(f)["result"] == {"x": 2}
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    probe = DiskCache(str(tmp_path / "probe"))
+    probe.put("aa00", LATER, {"x": "y" * 100})
+    size = probe.size_bytes
+    disk = DiskCache(str(tmp_path / "cache"), max_bytes=size * 3)
+    for index, key in enumerate(("aa01", "bb02", "cc03")):
+        disk.put(key, LATER, {"x": "y" * 100})
+        os.utime(disk._path(key), (1000 + index, 1000 + index))
+    # Reading the oldest entry makes it the most recently used
+    assert disk.get("aa01") is not None
+    disk.put("dd04", LATER, {"x": "y" * 100})
+    assert disk.get("bb02") is None
+    assert disk.get("aa01") is not None and disk.get("dd04") is not None
+    assert disk.evictions >= 1 and disk.size_bytes <= disk.max_bytes
+
+
+def test_disk_budget_counts_entries_left_by_an_earlier_process(tmp_path):
+    first = DiskCache(str(tmp_path), max_bytes=1 << 20)
+    for i in range(5):
+        first.put(f"{i:02d}ff", LATER, {"x": "y" * 1000})
+    second = DiskCache(str(tmp_path), max_bytes=first.size_bytes)
+    second.put("99ff", LATER, {"x": "y" * 1000})
+    assert second.size_bytes <= second.max_bytes
+    assert second.evictions >= 1
+
+
+def test_async_cache_reads_and_writes_disk_through_the_worker_pool(tmp_path):
+    calls = []
+
+    class Workers:
+        async def run_io(self, fn, *args):
+            calls.append(fn.__name__)
+            return fn(*args)
+
+    async def run() -> None:
+        cache = AnalysisCache(ttl_seconds=60, max_bytes=1 << 20, directory=str(tmp_path))
+        await cache.put_async("ab12", result("x"), Workers())
+        cache.clear()
+        assert (await cache.get_async("ab12", Workers())).description == "x"
+        assert (await cache.get_async("ab12", Workers())).description == "x"
+
+    asyncio.run(run())
+    assert calls == ["put", "get"]
+
+
+def test_cached_results_are_independent_copies():
+    cache = AnalysisCache(ttl_seconds=60, max_bytes=1 << 20)
+    original = result("x")
+    original.metadata.extra["gate"] = {"reasons": ["a"]}
+    cache.put("k", original)
+    original.metadata.extra["gate"]["reasons"].append("changed after put")
+    first = cache.get("k")
+    first.metadata.extra["tiling"] = {"grid": [2, 2]}
+    first.metadata.extra["gate"]["reasons"].append("changed after get")
+    second = cache.get("k")
+    assert second.metadata.extra == {"gate": {"reasons": ["a"]}}
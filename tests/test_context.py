@@ -0,0 +1,51 @@
+import asyncio
+
+from image_sage_mcp import context as context_module
+from image_sage_mcp.context import AppContext, ContextHolder
+from image_sage_mcp.models import ServerConfig
+
+
+def config(**overrides) -> ServerConfig:
+    return ServerConfig(vision_backends=[], api_keys={}, **overrides)
+
+
+def test_reload_shares_the_worker_pool_and_hands_over_ownership():
+    async def run() -> None:
+        holder = ContextHolder(loader=config)
+        first = await holder.current()
+        holder.request_reload()
+        second = await holder.current()
+        assert second is not first
+        assert second.workers is first.workers
+        assert second.owns_workers and not first.owns_workers
+        await holder.aclose()
+
+    asyncio.run(run())
+
+
+def test_failed_reload_keeps_ownership_with_the_serving_context(monkeypatch, tmp_path):
+    async def run() -> None:
+        holder = ContextHolder(loader=lambda: config(store_path=str(tmp_path / "store.db")))
+        first = await holder.current()
+
+        def broken(*_args, **_kwargs):
+            raise RuntimeError("bad phash settings")
+
+        # Fails after the workers, model runner and store have already been picked up for reuse
+        monkeypatch.setattr(context_module, "build_phash_index", broken)
+        holder.request_reload()
+        assert await holder.current() is first
+        assert first.owns_workers and first.owns_model_runner and first.owns_store
+        await holder.aclose()
+        assert first.store is not None and first.store.closed
+
+    asyncio.run(run())
+
+
+def test_context_can_be_built_without_a_predecessor():
+    async def run() -> None:
+        context = AppContext(config())
+        assert context.owns_workers and context.owns_store
+        await context.aclose()
+
+    asyncio.run(run())
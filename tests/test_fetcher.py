@@ -0,0 +1,113 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import GifImagePlugin, Image
+
+from image_sage_mcp.fetcher import ImageFetcher, probe_image
+
+MB = 1024 * 1024
+
+
+def png_bytes() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (16, 8), "red").save(out, format="PNG")
+    return out.getvalue()
+
+
+class Body(httpx.AsyncByteStream):
+    # Records how much of the body was actually pulled before the fetcher gave up
+    def __init__(self, head: bytes, chunk: int, count: int) -> None:
+        self.head = head
+        self.chunk = chunk
+        self.count = count
+        self.sent = 0
+
+    async def __aiter__(self):
+        self.sent += 1
+        yield self.head
+        for _ in range(self.count):
+            self.sent += 1
+            yield b"\0" * self.chunk
+
+
+def fetch(handler, max_size_mb: int = 1):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await ImageFetcher(5, max_size_mb, client=client).fetch_from_url("https://img.test/a.png")
+
+    return asyncio.run(run())
+
+
+def test_download_stops_once_it_passes_max_size():
+    body = Body(png_bytes(), 256 * 1024, 100)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/png"}, stream=body)
+
+    with pytest.raises(ValueError, match="too large"):
+        fetch(handler)
+    assert body.sent <= 6
+
+
+def test_lying_content_length_is_still_bounded():
+    body = Body(png_bytes(), 256 * 1024, 100)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/png", "content-length": "100"}, stream=body)
+
+    with pytest.raises(ValueError, match="too large"):
+        fetch(handler)
+    assert body.sent <= 6
+
+
+def test_declared_oversize_is_rejected_before_reading():
+    body = Body(png_bytes(), 1024, 10)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-length": str(2 * MB)}, stream=body)
+
+    with pytest.raises(ValueError, match="too large"):
+        fetch(handler)
+    assert body.sent == 0
+
+
+def test_non_image_is_rejected_by_its_magic_bytes():
+    body = Body(b"<!doctype html><html>", 64 * 1024, 100)
+
+    def handler(request):
+        # The content type claims an image; only the bytes tell the truth
+        return httpx.Response(200, headers={"content-type": "image/png"}, stream=body)
+
+    with pytest.raises(ValueError, match="Unsupported image format"):
+        fetch(handler)
+    assert body.sent == 1
+
+
+def test_valid_image_is_probed():
+    data = png_bytes()
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/png"}, content=data)
+
+    image = fetch(handler)
+    assert (image.format, image.width, image.height, image.file_size_bytes) == ("PNG", 16, 8, len(data))
+
+
+
+def test_probe_flags_animation_without_seeking_through_every_frame(monkeypatch):
+    frames = [Image.new("RGB", (8, 8), color) for color in ("red", "green", "blue", "white", "black")]
+    out = io.BytesIO()
+    frames[0].save(out, format="GIF", save_all=True, append_images=frames[1:])
+    seeks = []
+    original = GifImagePlugin.GifImageFile._seek
+
+    def seek(self, frame, *args):
+        seeks.append(frame)
+        return original(self, frame, *args)
+
+    monkeypatch.setattr(GifImagePlugin.GifImageFile, "_seek", seek)
+    assert probe_image(io.BytesIO(out.getvalue())).animated
+    assert max(seeks, default=0) <= 1
+    assert not probe_image(io.BytesIO(png_bytes())).animated
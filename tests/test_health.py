@@ -0,0 +1,118 @@
+import types
+
+import pytest
+
+from image_sage_mcp import health as health_module
+from image_sage_mcp.health import CLOSED, HALF_OPEN, OPEN, BackendHealth, CircuitSettings, LatencyHistogram
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(health_module, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def http_error(status: int, retry_after: str = ""):
+    headers = {"retry-after": retry_after} if retry_after else {}
+    error = RuntimeError(f"HTTP {status}")
+    error.response = types.SimpleNamespace(status_code=status, headers=headers)
+    return error
+
+
+def tripped(settings: CircuitSettings) -> BackendHealth:
+    health = BackendHealth("api", settings)
+    for _ in range(settings.min_requests):
+        assert health.allow_request()
+        health.record_failure(RuntimeError("boom"))
+    return health
+
+
+def test_opens_once_the_error_rate_crosses_the_threshold(clock):
+    health = BackendHealth("api", CircuitSettings(min_requests=4))
+    for ok in (True, True, False):
+        health.allow_request()
+        health.record_success(0.1) if ok else health.record_failure(RuntimeError("boom"))
+    assert health.state == CLOSED
+    health.allow_request()
+    health.record_failure(RuntimeError("boom"))
+    assert health.state == OPEN
+    assert not health.allow_request() and health.rejected == 1
+
+
+def test_half_open_admits_one_probe_and_closes_on_success(clock):
+    settings = CircuitSettings(min_requests=2, open_seconds=10)
+    health = tripped(settings)
+    clock.now += 10
+    assert health.allow_request()
+    assert health.state == HALF_OPEN
+    assert not health.allow_request()
+    health.record_success(0.1)
+    assert health.state == CLOSED and health.consecutive_opens == 0
+
+
+def test_failed_probe_reopens_with_backoff(clock):
+    health = tripped(CircuitSettings(min_requests=2, open_seconds=10, max_open_seconds=15))
+    clock.now += 10
+    health.allow_request()
+    health.record_failure(RuntimeError("still down"))
+    assert health.state == OPEN
+    assert health.retry_in() == pytest.approx(15)
+
+
+def test_cancelled_probe_frees_its_slot(clock):
+    health = tripped(CircuitSettings(min_requests=2, open_seconds=10))
+    clock.now += 10
+    assert health.allow_request()
+    health.release()
+    assert health.allow_request()
+
+
+def test_client_errors_are_neutral_and_429_honours_retry_after(clock):
+    health = BackendHealth("api", CircuitSettings(min_requests=1))
+    for _ in range(3):
+        health.allow_request()
+        health.record_failure(http_error(404))
+    assert health.state == CLOSED and not health.outcomes
+    health.allow_request()
+    health.record_failure(http_error(429, "7"))
+    assert health.state == OPEN
+    assert health.retry_in() == pytest.approx(7)
+
+
+def test_outcomes_outside_the_window_are_forgotten(clock):
+    health = BackendHealth("api", CircuitSettings(window_seconds=60, min_requests=3))
+    for _ in range(2):
+        health.allow_request()
+        health.record_failure(RuntimeError("boom"))
+    clock.now += 61
+    health.allow_request()
+    health.record_failure(RuntimeError("boom"))
+    assert health.state == CLOSED and len(health.outcomes) == 1
+
+
+def test_disabled_circuit_always_allows():
+    health = BackendHealth("stub")
+    for _ in range(20):
+        assert health.allow_request()
+        health.record_failure(RuntimeError("boom"))
+    assert health.snapshot()["state"] == "disabled"
+
+
+def test_latency_percentiles_use_bucket_upper_bounds():
+    histogram = LatencyHistogram()
+    for _ in range(90):
+        histogram.record(0.1)
+    for _ in range(10):
+        histogram.record(2.0)
+    assert 0.1 <= histogram.percentile(0.5) < 0.12
+    assert 2.0 <= histogram.percentile(0.99) < 2.4
+    assert LatencyHistogram().percentile(0.5) is None
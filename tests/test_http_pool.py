@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import httpx
+import pytest
+
+from image_sage_mcp.http_pool import HTTPClientPool
+from image_sage_mcp.validation import DNSResolver
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = b"pinned"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class FakeResolver(DNSResolver):
+    def __init__(self, answers: Dict[str, Optional[List[str]]]) -> None:
+        super().__init__()
+        self.answers = answers
+
+    async def resolve_safe(self, host: str) -> Optional[List[str]]:
+        return self.answers.get(host)
+
+
+def fetch(resolver: DNSResolver, url: str) -> httpx.Response:
+    async def run() -> httpx.Response:
+        pool = HTTPClientPool(timeout_seconds=2)
+        try:
+            response = await pool.get("fetch", resolver=resolver).get(url)
+            await response.aread()
+            return response
+        finally:
+            await pool.aclose()
+
+    return asyncio.run(run())
+
+
+def test_dials_the_validated_address_not_the_hostname(server):
+    # The hostname itself doesn't resolve; only the resolver's answer is dialled
+    response = fetch(FakeResolver({"images.invalid": ["127.0.0.1"]}), f"http://images.invalid:{server}/a.png")
+    assert response.status_code == 200
+    assert response.text == "pinned"
+
+
+def test_falls_through_to_the_next_validated_address(server):
+    # Nothing listens on 127.0.0.2 at this port
+    response = fetch(FakeResolver({"images.invalid": ["127.0.0.2", "127.0.0.1"]}), f"http://images.invalid:{server}/a.png")
+    assert response.status_code == 200
+
+
+def test_refuses_hosts_that_fail_validation(server):
+    with pytest.raises(httpx.ConnectError):
+        fetch(FakeResolver({}), f"http://images.invalid:{server}/a.png")
+
+
+def test_environment_proxies_are_ignored(server, monkeypatch):
+    for name in ("HTTP_PROXY", "http_proxy", "ALL_PROXY", "all_proxy"):
+        monkeypatch.setenv(name, "http://127.0.0.1:9")
+    response = fetch(FakeResolver({"images.invalid": ["127.0.0.1"]}), f"http://images.invalid:{server}/a.png")
+    assert response.text == "pinned"
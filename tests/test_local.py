@@ -0,0 +1,94 @@
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_sage_mcp.local import TEXT_PRESENT, extract_features, plan_analysis
+from image_sage_mcp.models import ImageData
+
+
+def image_data(image: Image.Image, fmt: str = "PNG") -> ImageData:
+    out = io.BytesIO()
+    image.save(out, format=fmt)
+    data = out.getvalue()
+    return ImageData(data, f"image/{fmt.lower()}", fmt, len(data), image.width, image.height)
+
+
+def rectangles() -> Image.Image:
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((50, 50, 350, 300), fill="#3366cc")
+    draw.rectangle((400, 200, 750, 550), fill="#cc3333")
+    return image
+
+
+def panels() -> Image.Image:
+    image = Image.new("RGB", (1200, 800), "#f0f0f0")
+    draw = ImageDraw.Draw(image)
+    for i in range(6):
+        draw.rectangle((40 + i * 190, 60, 200 + i * 190, 700), outline="black", width=3)
+    return image
+
+
+def text_page(size: int = 18) -> Image.Image:
+    image = Image.new("RGB", (1280, 800), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=size)
+    for y in range(20, 780, int(size * 1.5)):
+        draw.text((20, y), "The quick brown fox jumps over the lazy dog 0123456789", fill="black", font=font)
+    return image
+
+
+def test_blank_images_have_no_border_edges():
+    for color in ("white", "black"):
+        features = extract_features(image_data(Image.new("RGB", (256, 256), color)))
+        assert features.blank
+        assert features.edge_density == 0.0
+        assert features.text_likelihood == 0.0
+
+
+def test_flat_shapes_without_text_skip_ocr():
+    for image in (rectangles(), panels()):
+        features = extract_features(image_data(image))
+        assert features.text_likelihood < TEXT_PRESENT
+        assert features.kind == "graphic"
+        decision = plan_analysis(features, {"include_ocr": True, "detail_level": "low"}, 32)
+        assert decision.options == {"include_ocr": False, "detail_level": "low"}
+        assert decision.reasons == ["no_text_detected"]
+
+
+def test_text_is_detected_and_raises_low_detail():
+    for size in (12, 18, 40):
+        features = extract_features(image_data(text_page(size)))
+        assert features.text_likelihood >= 0.5
+        assert features.kind == "screenshot"
+        decision = plan_analysis(features, {"include_ocr": True, "detail_level": "low"}, 32)
+        assert decision.options == {"include_ocr": True, "detail_level": "medium"}
+        assert decision.reasons == ["text_needs_detail"]
+
+
+def test_sparse_ui_labels_keep_ocr():
+    image = Image.new("RGB", (1280, 800), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=20)
+    draw.rectangle((0, 0, 1280, 60), fill="#223355")
+    draw.text((20, 18), "Settings  Profile  Logout", fill="white", font=font)
+    draw.text((40, 120), "Your invoice total is $1,234.56", fill="black", font=font)
+    features = extract_features(image_data(image))
+    assert features.text_likelihood >= TEXT_PRESENT
+    assert "no_text_detected" not in plan_analysis(features, None, 32).reasons
+
+
+def test_solid_and_tiny_images_are_answered_locally():
+    solid = extract_features(image_data(Image.new("RGB", (300, 300), "#336699")))
+    assert solid.solid and not solid.blank
+    assert plan_analysis(solid, None, 32).answer_locally
+    tiny = extract_features(image_data(text_page().resize((40, 20))))
+    assert plan_analysis(tiny, None, 32).reasons == ["tiny"]
+
+
+def test_thin_banners_are_not_tiny():
+    banner = Image.new("RGB", (2000, 40), "white")
+    ImageDraw.Draw(banner).text((10, 10), "Summer sale: everything must go " * 6, fill="black", font=ImageFont.load_default(size=18))
+    decision = plan_analysis(extract_features(image_data(banner)), None, 48)
+    assert not decision.answer_locally
+    assert "tiny" not in decision.reasons
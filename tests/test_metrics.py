@@ -0,0 +1,51 @@
+from image_sage_mcp.metrics import MetricsRegistry
+
+
+def families_in(text: str):
+    help_lines = [line.split()[2] for line in text.splitlines() if line.startswith("# HELP ")]
+    type_lines = [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE ")]
+    return help_lines, type_lines
+
+
+def test_repeated_families_render_one_block_each():
+    registry = MetricsRegistry()
+    registry.inc("image_sage_requests_total", tool="analyze_image")
+    registry.observe("image_sage_stage_seconds", 0.02, stage="fetch")
+
+    def controllers():
+        # One entry per admission controller, as a context with several backends reports them
+        return [
+            ("image_sage_admission_rejected_total", "counter", "Calls rejected by admission control", [({"backend": "a"}, 1)]),
+            ("image_sage_admission_rejected_total", "counter", "Calls rejected by admission control", [({"backend": "b"}, 2)]),
+        ]
+
+    registry.set_collector("first", controllers)
+    registry.set_collector("second", lambda: [("image_sage_admission_rejected_total", "counter", "Calls rejected by admission control", [({"backend": "c"}, 3)])])
+    text = registry.render_prometheus()
+
+    help_lines, type_lines = families_in(text)
+    assert help_lines == type_lines
+    assert len(help_lines) == len(set(help_lines)) == 3
+    lines = text.splitlines()
+    start = lines.index("# TYPE image_sage_admission_rejected_total counter")
+    assert lines[start + 1 : start + 4] == [
+        'image_sage_admission_rejected_total{backend="a"} 1',
+        'image_sage_admission_rejected_total{backend="b"} 2',
+        'image_sage_admission_rejected_total{backend="c"} 3',
+    ]
+    assert text.endswith("\n")
+
+
+def test_failing_collector_is_skipped():
+    registry = MetricsRegistry()
+
+    def broken():
+        raise RuntimeError("collector failed")
+
+    registry.set_collector("broken", broken)
+    registry.set_collector("ok", lambda: [("image_sage_cache_bytes", "gauge", "Result cache memory tier size", [({}, 10)])])
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP image_sage_cache_bytes Result cache memory tier size",
+        "# TYPE image_sage_cache_bytes gauge",
+        "image_sage_cache_bytes 10",
+    ]
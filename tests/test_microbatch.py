@@ -0,0 +1,131 @@
+import asyncio
+import base64
+import io
+import json
+from typing import Callable, Dict, List
+
+import httpx
+import pytest
+from PIL import Image
+
+from image_sage_mcp.microbatch import BatchingOpenRouterBackend, MicroBatcher
+from image_sage_mcp.models import ImageData
+from image_sage_mcp.processor import OpenRouterBackend
+
+COLORS = {"red": (255, 0, 0), "green": (0, 255, 0), "blue": (0, 0, 255)}
+
+
+def image(label: str) -> ImageData:
+    out = io.BytesIO()
+    Image.new("RGB", (16, 16), COLORS[label]).save(out, format="PNG")
+    data = out.getvalue()
+    return ImageData(data, "image/png", "PNG", len(data), 16, 16)
+
+
+def entry(label: str) -> Dict[str, object]:
+    return {"contains_person": False, "objects_detected": [label], "scene_type": "graphic", "description": label, "ocr_text": "", "confidence": 0.9}
+
+
+class FakeOpenRouter:
+    # Answers chat completions for the test images; `multi` decides what a multi-image call returns
+    def __init__(self, multi: Callable[[List[str]], str], fail: str = "") -> None:
+        self.multi = multi
+        self.fail = fail
+        self.calls: List[List[str]] = []
+        self.labels = {base64.b64encode(image(label).bytes_data).decode(): label for label in COLORS}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(await request.aread())
+        parts = payload["messages"][1]["content"]
+        labels = [self.labels[p["image_url"]["url"].split(",", 1)[1]] for p in parts if p["type"] == "image_url"]
+        self.calls.append(labels)
+        if len(labels) == 1:
+            if labels[0] == self.fail:
+                return httpx.Response(500, json={"error": "boom"})
+            content = json.dumps(entry(labels[0]))
+        else:
+            content = self.multi(labels)
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+def analyze_all(server: FakeOpenRouter, labels: List[str], max_images: int = 4, window: float = 0.05) -> list:
+    async def run() -> list:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server), base_url="https://openrouter.test") as client:
+            inner = OpenRouterBackend(api_key="k", model="m", client=client)
+            backend = BatchingOpenRouterBackend(inner, max_images=max_images, window_seconds=window, max_bytes=1 << 20)
+            return await asyncio.gather(*(backend.analyze(image(label), {"include_ocr": False}) for label in labels), return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_completion_and_fan_out_in_order():
+    server = FakeOpenRouter(lambda labels: json.dumps({"results": [entry(label) for label in labels]}))
+    results = analyze_all(server, ["red", "green", "blue"])
+    assert server.calls == [["red", "green", "blue"]]
+    assert [r.description for r in results] == ["red", "green", "blue"]
+    assert all("partial_output" not in r.metadata.extra for r in results)
+
+
+def test_misaligned_answer_falls_back_to_one_request_per_image():
+    # Two entries for three images: nobody can tell which image went missing
+    server = FakeOpenRouter(lambda labels: json.dumps({"results": [entry(label) for label in labels[:2]]}))
+    results = analyze_all(server, ["red", "green", "blue"])
+    assert server.calls[0] == ["red", "green", "blue"]
+    assert sorted(server.calls[1:]) == [["blue"], ["green"], ["red"]]
+    assert [r.description for r in results] == ["red", "green", "blue"]
+
+
+def test_truncated_multi_answer_marks_every_entry_partial():
+    def truncated(labels: List[str]) -> str:
+        return json.dumps({"results": [entry(label) for label in labels]})[:-40]
+
+    server = FakeOpenRouter(truncated)
+    results = analyze_all(server, ["red", "green", "blue"])
+    assert len(server.calls) == 1
+    # The cut lands in the last entry's description, which is closed up where it stopped
+    assert [r.description for r in results] == ["red", "green", "blu"]
+    assert all("partial_output" in r.metadata.extra for r in results)
+
+
+def test_one_failing_image_fails_only_its_caller():
+    server = FakeOpenRouter(lambda labels: "not json at all", fail="green")
+    red, green, blue = analyze_all(server, ["red", "green", "blue"])
+    assert isinstance(green, httpx.HTTPStatusError)
+    assert (red.description, blue.description) == ("red", "blue")
+
+
+def test_a_lone_request_is_sent_when_the_window_closes():
+    server = FakeOpenRouter(lambda labels: pytest.fail("no multi-image call expected"))
+    (result,) = analyze_all(server, ["blue"], max_images=8, window=0.02)
+    assert server.calls == [["blue"]] and result.description == "blue"
+
+
+def test_batcher_flushes_on_size_cost_and_timer():
+    async def run() -> None:
+        batches: List[List[int]] = []
+
+        async def handler(_key, items):
+            batches.append(list(items))
+            return [item * 10 for item in items]
+
+        batcher: MicroBatcher[int, int] = MicroBatcher(handler, max_items=3, window_seconds=0.02, max_cost=100)
+        assert await asyncio.gather(*(batcher.submit("k", i, cost=10) for i in range(4))) == [0, 10, 20, 30]
+        assert batches == [[0, 1, 2], [3]]
+        batches.clear()
+        # 60 + 60 is over budget, so the second item starts a new batch
+        assert await asyncio.gather(batcher.submit("k", 1, cost=60), batcher.submit("k", 2, cost=60)) == [10, 20]
+        assert batches == [[1], [2]]
+
+    asyncio.run(run())
+
+
+def test_batcher_maps_short_handler_output_to_errors():
+    async def run() -> None:
+        async def handler(_key, items):
+            return [1]
+
+        batcher: MicroBatcher[int, int] = MicroBatcher(handler, max_items=2, window_seconds=1.0)
+        results = await asyncio.gather(batcher.submit("k", 1), batcher.submit("k", 2), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
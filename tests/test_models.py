@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import io
+import mmap
+
+import pytest
+from PIL import Image
+
+from image_sage_mcp.cache import image_digest
+from image_sage_mcp.fetcher import ImageFetcher
+from image_sage_mcp.models import LazyImageData
+
+
+def write_png(path, size=(64, 48)) -> int:
+    Image.new("RGB", size, "#336699").save(path, format="PNG")
+    return path.stat().st_size
+
+
+def lazy(path, size: int) -> LazyImageData:
+    return LazyImageData(path=str(path), mime_type="image/png", format="PNG", file_size_bytes=size, width=64, height=48)
+
+
+def test_fetch_from_file_loads_nothing(tmp_path):
+    path = tmp_path / "a.png"
+    write_png(path)
+    image = asyncio.run(ImageFetcher(timeout_seconds=5, max_size_mb=1).fetch_from_file(str(path)))
+    assert isinstance(image, LazyImageData)
+    assert not image.loaded
+    assert image.bytes_data == b""
+    assert (image.width, image.height) == (64, 48)
+
+
+def test_mapping_is_bounded_to_the_checked_size(tmp_path):
+    path = tmp_path / "a.png"
+    size = write_png(path)
+    image = lazy(path, size)
+    with open(path, "ab") as f:
+        f.write(b"\0" * 4096)
+    assert len(image.buffer) == size
+    assert image.read_bytes() == path.read_bytes()[:size]
+
+
+def test_shrunk_file_fails_instead_of_mapping(tmp_path):
+    path = tmp_path / "a.png"
+    size = write_png(path)
+    image = lazy(path, size + 100)
+    with pytest.raises(ValueError):
+        image.buffer
+
+
+def test_last_release_unmaps(tmp_path):
+    path = tmp_path / "a.png"
+    image = lazy(path, write_png(path))
+    image.retain()
+    image.retain()
+    mapping = image.buffer
+    assert isinstance(mapping, mmap.mmap)
+    image.release()
+    assert not mapping.closed
+    image.release()
+    assert mapping.closed and not image.loaded
+    # A later consumer maps the file again
+    assert image_digest(image) == hashlib.sha256(path.read_bytes()).hexdigest()
+    image.release()
+    assert not image.loaded
+
+
+def test_open_image_reads_the_file(tmp_path):
+    path = tmp_path / "a.png"
+    image = lazy(path, write_png(path))
+    with image.open_image() as opened:
+        assert opened.size == (64, 48)
+    assert Image.open(io.BytesIO(image.read_bytes())).size == (64, 48)
@@ -0,0 +1,56 @@
+import asyncio
+import base64
+import json
+import mmap
+import os
+
+import pytest
+
+from image_sage_mcp import payload as payload_module
+from image_sage_mcp.payload import StreamingJSONBody, data_uri_placeholder
+
+
+def request(images, prompt: str, uri) -> dict:
+    content = [{"type": "text", "text": prompt}]
+    content += [{"type": "image_url", "image_url": {"url": uri(i)}} for i in range(len(images))]
+    return {"model": "openai/gpt-4o-mini", "messages": [{"role": "user", "content": content}]}
+
+
+def streamed(body: StreamingJSONBody) -> bytes:
+    async def collect() -> bytes:
+        return b"".join([chunk async for chunk in body])
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("sizes", [[1000], [7, 0, 4096, 1]])
+@pytest.mark.parametrize("chunk", [3, 6, payload_module.B64_CHUNK_BYTES])
+def test_streamed_body_matches_json_dumps(monkeypatch, sizes, chunk):
+    # Small chunks put boundaries in the middle of every image
+    monkeypatch.setattr(payload_module, "B64_CHUNK_BYTES", chunk)
+    images = [os.urandom(size) for size in sizes]
+    prompt = "Décris l'image — 日本語のテキストも読む"
+    body = StreamingJSONBody(request(images, prompt, lambda i: data_uri_placeholder("image/png", i)), images)
+    expected = json.dumps(
+        request(images, prompt, lambda i: "data:image/png;base64," + base64.b64encode(images[i]).decode("ascii")),
+        separators=(",", ":"),
+    ).encode("ascii")
+    data = streamed(body)
+    assert data == expected
+    assert body.content_length == len(data)
+    assert json.loads(data)["messages"][0]["content"][0]["text"] == prompt
+
+
+def test_memory_mapped_images_stream_without_copies(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(os.urandom(payload_module.B64_CHUNK_BYTES + 5))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        body = StreamingJSONBody(request([mapped], "x", lambda i: data_uri_placeholder("image/jpeg", i)), [mapped])
+        data = json.loads(streamed(body))
+    url = data["messages"][0]["content"][1]["image_url"]["url"]
+    assert base64.b64decode(url.split(",", 1)[1]) == path.read_bytes()
+
+
+def test_missing_placeholder_is_rejected():
+    with pytest.raises(ValueError):
+        StreamingJSONBody({"messages": []}, [b"abc"])
@@ -0,0 +1,61 @@
+import random
+
+from image_sage_mcp.models import AnalysisResult, ImageMetadata
+from image_sage_mcp.phash import BKTree, PerceptualHashes, PerceptualIndex, hamming
+
+
+def result(description: str) -> AnalysisResult:
+    return AnalysisResult(False, [], "photo", description, "", 0.9, ImageMetadata(10, 10, "image/png", 100, "PNG"), 5, "api")
+
+
+def flip(value: int, *bits: int) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_bk_tree_search_matches_brute_force():
+    rng = random.Random(7)
+    base = rng.getrandbits(64)
+    values = [flip(base, *rng.sample(range(64), rng.randint(0, 12))) for _ in range(300)]
+    tree = BKTree()
+    for item_id, value in enumerate(values):
+        tree.add(value, item_id)
+    for query in values[:20]:
+        for radius in (0, 3, 8):
+            expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= radius)
+            assert sorted(tree.search(query, radius)) == expected
+
+
+def test_bk_tree_keeps_every_id_for_an_exact_hash():
+    tree = BKTree()
+    tree.add(0xFF, 1)
+    tree.add(0xFF, 2)
+    assert sorted(tree.search(0xFF, 0)) == [(0, 1), (0, 2)]
+    assert tree.size == 2
+    assert BKTree().search(0xFF, 64) == []
+
+
+def test_index_matches_near_copies_within_scope_only():
+    index = PerceptualIndex(max_distance=4)
+    hashes = PerceptualHashes(ahash=0xF0F0, dhash=0x0F0F, phash=0xABCDEF)
+    index.add(hashes, "scope-a", "digest-1", result("a cat"))
+    near = PerceptualHashes(ahash=0xF0F0, dhash=flip(0x0F0F, 1), phash=flip(0xABCDEF, 2, 9))
+    match = index.lookup(near, "scope-a")
+    assert match is not None and match.distance == 2 and match.source_digest == "digest-1"
+    assert match.result.description == "a cat"
+    assert index.lookup(near, "scope-b") is None
+    # The pHash alone isn't enough; a far dHash and aHash reject the match
+    unconfirmed = PerceptualHashes(ahash=~0xF0F0 & (2**64 - 1), dhash=~0x0F0F & (2**64 - 1), phash=0xABCDEF)
+    assert index.lookup(unconfirmed, "scope-a") is None
+
+
+def test_eviction_compacts_the_trees():
+    index = PerceptualIndex(max_entries=4)
+    for i in range(40):
+        value = 1 << (i % 64)
+        index.add(PerceptualHashes(value, value, value), "scope", f"digest-{i}", result(str(i)))
+    assert len(index) == 4
+    assert sum(tree.size for tree in index._trees.values()) <= 2 * len(index)
+    assert index.lookup(PerceptualHashes(1 << 39, 1 << 39, 1 << 39), "scope").result.description == "39"
+    assert index.lookup(PerceptualHashes(1, 1, 1), "other") is None
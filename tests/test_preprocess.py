@@ -0,0 +1,39 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from image_sage_mcp.models import ImageData
+from image_sage_mcp.preprocess import UploadProfile, prepare_image
+
+
+def screenshot(width: int, height: int, fmt: str = "PNG") -> ImageData:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(10, height - 10, 14):
+        draw.text((10, y), "Settings  Save  Cancel  0123456789", fill="black")
+    out = io.BytesIO()
+    image.save(out, format=fmt)
+    data = out.getvalue()
+    return ImageData(data, f"image/{fmt.lower()}", fmt, len(data), width, height)
+
+
+def test_in_bounds_png_is_sent_unchanged():
+    image = screenshot(800, 600)
+    prepared = prepare_image(image, UploadProfile(), "medium")
+    assert not prepared.reencoded
+    assert prepared.mime_type == "image/png"
+    assert bytes(prepared.data) == image.bytes_data
+
+
+def test_oversized_png_is_downscaled_losslessly():
+    image = screenshot(2400, 1200)
+    prepared = prepare_image(image, UploadProfile(), "medium")
+    assert prepared.reencoded
+    assert prepared.mime_type == "image/webp"
+    assert (prepared.width, prepared.height) == (1024, 512)
+
+
+def test_oversized_jpeg_uses_the_configured_format():
+    image = screenshot(2400, 1200, "JPEG")
+    prepared = prepare_image(image, UploadProfile(), "medium")
+    assert prepared.reencoded and prepared.mime_type == "image/jpeg"
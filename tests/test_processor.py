@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from image_sage_mcp.health import CircuitSettings
+from image_sage_mcp.huggingface import HuggingFaceBackend, ModelRunner
+from image_sage_mcp.models import AnalysisResult, ImageData, ImageMetadata
+from image_sage_mcp.processor import VisionBackend, VisionProcessor
+
+
+def test_hf_routes_keep_separate_circuits():
+    runner = ModelRunner("image-to-text", "tiny-captioner")
+    cheap = HuggingFaceBackend(runner, cheap_only=True)
+    fallback = HuggingFaceBackend(runner, fallback_only=True)
+    processor = VisionProcessor([cheap, fallback], circuit=CircuitSettings())
+    assert processor.backend_health(cheap) is not processor.backend_health(fallback)
+    assert set(processor.health) == {"hf:tiny-captioner:cheap", "hf:tiny-captioner:fallback"}
+    # The fallback answers regardless of the cheap route's circuit
+    assert processor.backend_health(fallback).settings is None
+
+
+class TimedBackend(VisionBackend):
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False, fallback_only: bool = False) -> None:
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.fallback_only = fallback_only
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        self.started_at = time.perf_counter()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        metadata = ImageMetadata(image.width or 0, image.height or 0, image.mime_type, image.file_size_bytes, image.format)
+        return AnalysisResult(False, [], "photo", self.name, "", 0.9, metadata, 0, self.name)
+
+
+IMAGE = ImageData(b"\x89PNG", "image/png", "PNG", 4, 1, 1)
+
+
+def analyze(backends, strategy: str, hedge_delay: float = 0.1) -> AnalysisResult:
+    processor = VisionProcessor(backends, strategy=strategy, hedge_default_delay=hedge_delay)
+
+    async def run() -> AnalysisResult:
+        start = time.perf_counter()
+        result = await processor.analyze_image(IMAGE)
+        for backend in backends:
+            if backend.started_at is not None:
+                backend.started_at -= start
+        # Let cancelled losers observe their cancellation
+        await asyncio.sleep(0.01)
+        return result
+
+    return asyncio.run(run())
+
+
+def test_hedge_fires_after_the_delay_and_cancels_the_loser():
+    slow, fast = TimedBackend("slow", delay=1.0), TimedBackend("fast", delay=0.01)
+    result = analyze([slow, fast], "hedged", hedge_delay=0.1)
+    assert result.backend_used == "fast"
+    assert 0.08 <= fast.started_at < 0.3
+    assert slow.cancelled
+
+
+def test_hedge_is_not_started_when_the_first_backend_is_quick():
+    quick, spare = TimedBackend("quick", delay=0.01), TimedBackend("spare")
+    assert analyze([quick, spare], "hedged", hedge_delay=0.2).backend_used == "quick"
+    assert spare.started_at is None
+
+
+def test_failure_starts_the_hedge_without_waiting_out_the_delay():
+    broken, backup = TimedBackend("broken", fail=True), TimedBackend("backup")
+    assert analyze([broken, backup], "hedged", hedge_delay=5.0).backend_used == "backup"
+    assert backup.started_at < 0.5
+
+
+def test_race_starts_everything_and_cancels_the_losers():
+    slow, fast = TimedBackend("slow", delay=1.0), TimedBackend("fast", delay=0.01)
+    assert analyze([slow, fast], "race").backend_used == "fast"
+    assert slow.started_at < 0.05 and slow.cancelled
+
+
+def test_fallback_is_used_only_when_every_primary_fails():
+    last_resort = TimedBackend("last_resort", fallback_only=True)
+    assert analyze([TimedBackend("a", fail=True), TimedBackend("b"), last_resort], "race").backend_used == "b"
+    assert last_resort.started_at is None
+    result = analyze([TimedBackend("a", fail=True), TimedBackend("b", fail=True), last_resort], "hedged")
+    assert result.backend_used == "last_resort"
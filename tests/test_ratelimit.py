@@ -0,0 +1,84 @@
+import asyncio
+import types
+
+import pytest
+
+from image_sage_mcp import ratelimit as ratelimit_module
+from image_sage_mcp.ratelimit import AdmissionController, OverloadedError, TokenBucket, estimate_image_tokens
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    bucket = TokenBucket(rate_per_second=2.0, capacity=4)
+    assert bucket.wait_time(4) == 0.0
+    bucket.take(4)
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    now[0] += 1.0
+    assert bucket.wait_time(2) == 0.0
+    now[0] += 60.0
+    bucket.take(0)
+    assert bucket.tokens == 4
+
+
+def test_oversized_requests_wait_for_a_full_bucket_instead_of_forever(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    bucket = TokenBucket(rate_per_second=1.0, capacity=10)
+    assert bucket.wait_time(50) == 0.0
+    bucket.take(50)
+    assert bucket.tokens == 0
+    assert bucket.wait_time(50) == pytest.approx(10)
+
+
+def test_concurrency_cap_rejects_after_the_queue_timeout():
+    async def run() -> None:
+        admission = AdmissionController("api", max_concurrency=1, max_wait_seconds=0.05)
+        async with admission.admit():
+            assert admission.inflight == 1
+            with pytest.raises(OverloadedError) as info:
+                async with admission.admit():
+                    pass
+        assert info.value.reason == "too many concurrent requests"
+        async with admission.admit():
+            pass
+        assert admission.snapshot() == {"inflight": 0, "waiting": 0, "admitted": 2, "rejected": 1, "max_concurrency": 1}
+
+    asyncio.run(run())
+
+
+def test_exhausted_request_budget_fails_fast_with_retry_after():
+    async def run() -> None:
+        # 60 rpm gives a burst of ten requests, then one per second
+        admission = AdmissionController("api", requests_per_minute=60, max_wait_seconds=0.1)
+        for _ in range(10):
+            async with admission.admit():
+                pass
+        with pytest.raises(OverloadedError) as info:
+            async with admission.admit():
+                pass
+        assert info.value.reason == "rate limit budget exhausted"
+        assert 0.5 < info.value.retry_after <= 1.0
+
+    asyncio.run(run())
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def run() -> None:
+        admission = AdmissionController("api", max_concurrency=1, max_wait_seconds=1.0)
+        order = []
+
+        async def call(label: str) -> None:
+            async with admission.admit():
+                order.append(label)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call(label) for label in "abcd"))
+        assert order == list("abcd")
+
+    asyncio.run(run())
+
+
+def test_image_token_estimate_counts_512px_tiles():
+    assert estimate_image_tokens(512, 512, 0, 0) == 255
+    assert estimate_image_tokens(1024, 600, 0, 0) == 85 + 170 * 4
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from image_sage_mcp.singleflight import SingleFlight, normalize_url
+
+
+def test_concurrent_callers_share_one_call():
+    async def run() -> None:
+        flights: SingleFlight[int] = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch() -> int:
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return 42
+
+        waiters = [asyncio.ensure_future(flights.do("k", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert len(flights) == 1
+        release.set()
+        assert await asyncio.gather(*waiters) == [42, 42, 42]
+        assert calls == 1 and flights.stats() == {"inflight": 0, "started": 1, "coalesced": 2}
+
+        # Finished flights are forgotten; the next call starts a new one
+        release.set()
+        assert await flights.do("k", fetch) == 42
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_waiter():
+    async def run() -> None:
+        flights: SingleFlight[int] = SingleFlight()
+
+        async def broken() -> int:
+            await asyncio.sleep(0)
+            raise ValueError("bad image")
+
+        results = await asyncio.gather(flights.do("k", broken), flights.do("k", broken), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flights) == 0
+
+    asyncio.run(run())
+
+
+def test_flight_survives_one_cancelled_waiter_and_stops_when_all_leave():
+    async def run() -> None:
+        flights: SingleFlight[str] = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow() -> str:
+            started.set()
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("k", slow))
+        second = asyncio.ensure_future(flights.do("k", slow))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set()
+        release.set()
+        assert await second == "done"
+
+        release.clear()
+        started.clear()
+        only = asyncio.ensure_future(flights.do("k", slow))
+        await started.wait()
+        only.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await only
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert len(flights) == 0
+
+    asyncio.run(run())
+
+
+def test_normalize_url_ignores_case_default_ports_and_fragments():
+    assert normalize_url("HTTPS://Example.COM:443/a.png#top") == "https://example.com/a.png"
+    assert normalize_url("http://example.com:8080") == "http://example.com:8080/"
@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from image_sage_mcp.context import AppContext
+from image_sage_mcp.models import AnalysisResult, ImageMetadata, ServerConfig
+from image_sage_mcp.search import run_search
+from image_sage_mcp.store import AnalysisStore, SearchQuery, StoreRecord, fts_expression
+
+
+def analysis(description: str, objects, scene: str = "photo", ocr: str = "", person: bool = False) -> AnalysisResult:
+    metadata = ImageMetadata(640, 480, "image/jpeg", 1000, "JPEG")
+    return AnalysisResult(person, list(objects), scene, description, ocr, 0.9, metadata, 10, "openrouter")
+
+
+def record(digest: str, source: str, result: AnalysisResult, at: float = 1.0) -> StoreRecord:
+    return StoreRecord(digest, source, "m", {"detail_level": "medium"}, result, analyzed_at=at)
+
+
+def seeded(store: AnalysisStore) -> None:
+    store.record(record("d1", "https://cdn.test/pets/cat.jpg", analysis("A ginger cat asleep on a sofa", ["Cat", "sofa"]), 1.0))
+    store.record(record("d2", "https://cdn.test/pets/dog.jpg", analysis("A dog running on the beach", ["dog"], person=True), 2.0))
+    store.record(record("d3", "/srv/shots/login.png", analysis("Login form", ["button"], "screenshot", ocr="Sign in with password"), 3.0))
+
+
+def run(coro_fn):
+    return asyncio.run(coro_fn())
+
+
+def test_records_round_trip_through_every_filter(tmp_path):
+    async def go() -> None:
+        store = AnalysisStore(str(tmp_path / "store.db"))
+        seeded(store)
+
+        async def find(**fields) -> list:
+            return [r["content_hash"] for r in await store.search(SearchQuery(**fields))]
+
+        assert await find(text="cat sofa") == ["d1"]
+        assert await find(text="passw*") == ["d3"]
+        assert await find(objects=["cat"]) == ["d1"]
+        assert await find(objects=["dog", "cat"]) == []
+        assert await find(scene_type="SCREENSHOT") == ["d3"]
+        assert await find(contains_person=True) == ["d2"]
+        assert await find(source="https://cdn.test/pets/") == ["d2", "d1"]
+        assert await find(digest="d3") == ["d3"]
+        (hit,) = await store.search(SearchQuery(text="beach"))
+        assert hit["objects_detected"] == ["dog"] and "[beach]" in hit["match"]
+        await store.aclose()
+
+    run(go)
+
+
+def test_upsert_replaces_objects_and_text(tmp_path):
+    path = str(tmp_path / "store.db")
+
+    async def go() -> None:
+        store = AnalysisStore(path)
+        store.record(record("d1", "/a.png", analysis("A red kite", ["kite", "sky"])))
+        await store.flush()
+        store.record(record("d1", "/a.png", analysis("A blue balloon", ["balloon"]), 2.0))
+        assert [r["content_hash"] for r in await store.search(SearchQuery(objects=["kite"]))] == []
+        (hit,) = await store.search(SearchQuery(objects=["balloon"]))
+        assert hit["objects_detected"] == ["balloon"]
+        assert await store.search(SearchQuery(text="kite")) == []
+        assert await store.count() == 1
+        await store.aclose()
+
+    run(go)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT object FROM objects").fetchall() == [("balloon",)]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("cat", '"cat"'),
+        ("cat*", '"cat"*'),
+        ('cat" OR "dog', '"cat" "OR" "dog"'),
+        ("NEAR(cat dog) description:x", '"NEAR" "cat" "dog" "description" "x"'),
+        ("-cat ^dog", '"-cat" "dog"'),
+        ("(*) \" :", ""),
+    ],
+)
+def test_fts_expression_quotes_every_term(text, expected):
+    assert fts_expression(text) == expected
+
+
+def test_hostile_queries_are_searched_literally(tmp_path):
+    async def go() -> None:
+        store = AnalysisStore(str(tmp_path / "store.db"))
+        seeded(store)
+        for text in ('cat" OR "dog', "NEAR(cat sofa)", "description:cat", "cat AND"):
+            results = await store.search(SearchQuery(text=text))
+            assert all(r["content_hash"] in {"d1", "d2"} for r in results)
+        await store.aclose()
+
+    run(go)
+
+
+def test_aclose_flushes_pending_records(tmp_path):
+    path = str(tmp_path / "store.db")
+
+    async def go() -> None:
+        store = AnalysisStore(path, batch_size=100, flush_seconds=60)
+        seeded(store)
+        assert store.stats()["pending"] == 3
+        await store.aclose()
+        assert store.stats() == {"pending": 0, "written": 3, "dropped": 0, "failed": 0}
+
+    run(go)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0] == 3
+
+
+def test_search_tool_reports_results_and_bad_queries(tmp_path):
+    async def go() -> None:
+        context = AppContext(ServerConfig(vision_backends=[], api_keys={}, store_path=str(tmp_path / "store.db")))
+        try:
+            seeded(context.store)
+            response = await run_search(context, {"query": "cat", "objects": "cat, sofa", "limit": 5})
+            assert response["count"] == 1 and response["results"][0]["source"] == "https://cdn.test/pets/cat.jpg"
+            assert (await run_search(context, {"query": "***"}))["error"]["code"] == "INVALID_REQUEST"
+        finally:
+            await context.aclose()
+        disabled = AppContext(ServerConfig(vision_backends=[], api_keys={}))
+        assert (await run_search(disabled, {"query": "cat"}))["error"]["code"] == "STORE_DISABLED"
+        await disabled.aclose()
+
+    run(go)
@@ -0,0 +1,52 @@
+from image_sage_mcp.streaming import IncrementalJSONParser, parse_json_object
+
+
+def test_members_are_reported_as_soon_as_they_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('Sure: {"description": "a c') == []
+    assert parser.feed('at", "objects_detected": ["cat"') == ["description"]
+    assert parser.feed('], "confidence": 0.9}') == ["objects_detected", "confidence"]
+    assert parser.done
+    parsed = parser.result()
+    assert parsed.fields == {"description": "a cat", "objects_detected": ["cat"], "confidence": 0.9}
+    assert not parsed.partial and parsed.repaired == []
+
+
+def test_strict_json_is_not_marked_partial():
+    parsed = parse_json_object('{"description": "x", "contains_person": false}')
+    assert parsed.fields == {"description": "x", "contains_person": False} and not parsed.partial
+
+
+def test_truncated_string_and_list_are_closed_and_listed_as_repaired():
+    parsed = parse_json_object('{"description": "a red car", "objects_detected": ["car", "ro')
+    assert parsed.partial
+    assert parsed.fields == {"description": "a red car", "objects_detected": ["car", "ro"]}
+    assert parsed.repaired == ["objects_detected"]
+    parsed = parse_json_object('{"confidence": 0.8, "ocr_text": "Line one\\nLi')
+    assert parsed.fields == {"confidence": 0.8, "ocr_text": "Line one\nLi"}
+    assert parsed.repaired == ["ocr_text"]
+
+
+def test_truncated_numbers_and_booleans_are_dropped():
+    parsed = parse_json_object('{"description": "x", "confidence": 0.8')
+    assert parsed.fields == {"description": "x"} and parsed.partial and parsed.repaired == []
+    parsed = parse_json_object('{"description": "x", "contains_person": tr')
+    assert parsed.fields == {"description": "x"} and parsed.partial
+
+
+def test_cut_off_escape_is_trimmed():
+    parsed = parse_json_object('{"description": "caf\\u00')
+    assert parsed.fields == {"description": "caf"}
+
+
+def test_malformed_member_costs_only_itself():
+    parsed = parse_json_object('{"description": "ok", "confidence": 0.9.1, "scene_type": "photo"}')
+    assert parsed.fields == {"description": "ok", "scene_type": "photo"}
+    assert parsed.partial and parsed.repaired == []
+
+
+def test_unrepaired_result_skips_the_pending_member():
+    parser = IncrementalJSONParser()
+    parser.feed('{"description": "done", "ocr_text": "half')
+    parsed = parser.result(repair=False)
+    assert parsed.fields == {"description": "done"} and not parsed.partial
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import time
+from typing import Any, Dict, Optional
+
+import pytest
+from PIL import Image, ImageDraw
+
+from image_sage_mcp.models import AnalysisResult, ImageData, ImageMetadata
+from image_sage_mcp.processor import StubBackend, VisionBackend, VisionProcessor
+from image_sage_mcp.ratelimit import OverloadedError
+from image_sage_mcp.tiling import TileSettings, analyze_tiled, plan_grid, should_tile
+
+
+def large_image(width: int = 3000, height: int = 1200) -> ImageData:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, 40):
+        draw.line((x, 0, x, height), fill="black", width=2)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    data = out.getvalue()
+    return ImageData(data, "image/png", "PNG", len(data), width, height)
+
+
+def result(text: str, backend: str = "fake") -> AnalysisResult:
+    return AnalysisResult(
+        contains_person=False,
+        objects_detected=[text],
+        scene_type="document",
+        description=text,
+        ocr_text=text,
+        confidence=0.8,
+        metadata=ImageMetadata(width=0, height=0, mime_type="image/png", file_size_bytes=0, format="PNG"),
+        processing_time_ms=0,
+        backend_used=backend,
+    )
+
+
+class TileBackend(VisionBackend):
+    # Full image is the overview; tiles are told apart by their width
+    name = "fake"
+
+    def __init__(self, tile_behaviour: str = "ok", delay: float = 0.0, overview_overloaded: bool = False) -> None:
+        self.tile_behaviour = tile_behaviour
+        self.delay = delay
+        self.overview_overloaded = overview_overloaded
+        self.calls = 0
+
+    async def analyze(self, image: ImageData, options: Optional[Dict[str, Any]] = None) -> Optional[AnalysisResult]:
+        self.calls += 1
+        if image.width == 3000:
+            if self.overview_overloaded:
+                raise OverloadedError("fake", "queue_timeout")
+            return result("overview")
+        await asyncio.sleep(self.delay)
+        if self.tile_behaviour == "overloaded":
+            raise OverloadedError("fake", "queue_timeout", retry_after=1.5)
+        if self.tile_behaviour == "empty":
+            return None
+        return result(f"tile {self.calls}")
+
+
+def settings(**overrides: Any) -> TileSettings:
+    return TileSettings(**{"tile_px": 1024, "overlap": 0.1, "max_tiles": 16, "min_px": 2048, "concurrency": 4, "timeout_seconds": 1.0, **overrides})
+
+
+def run(backend: VisionBackend, tile_settings: TileSettings, fallback: bool = False) -> AnalysisResult:
+    backends = [backend, StubBackend()] if fallback else [backend]
+    return asyncio.run(analyze_tiled(VisionProcessor(backends), large_image(), {"detail_level": "high"}, tile_settings))
+
+
+def test_only_large_high_detail_images_are_tiled():
+    image = large_image()
+    assert should_tile(image, {"detail_level": "high"}, settings())
+    assert not should_tile(image, {"detail_level": "medium"}, settings())
+    assert not should_tile(image, {"detail_level": "high"}, None)
+
+
+def test_grid_stays_within_max_tiles():
+    grid = plan_grid(10000, 10000, settings(max_tiles=9))
+    assert len(grid) * len(grid[0]) <= 9
+    assert grid[-1][-1][2:] == (10000, 10000)
+
+
+def test_all_tiles_analyzed_is_complete():
+    merged = run(TileBackend(), settings())
+    tiling = merged.metadata.extra["tiling"]
+    assert tiling["complete"] and "missing" not in tiling
+    assert tiling["analyzed"] == tiling["grid"][0] * tiling["grid"][1]
+    assert merged.description == "overview"
+
+
+def test_slow_tiles_time_out_individually():
+    merged = run(TileBackend(delay=0.5), settings(timeout_seconds=0.2, concurrency=1))
+    tiling = merged.metadata.extra["tiling"]
+    assert not tiling["complete"]
+    assert tiling["timed_out"] == len(tiling["missing"]) > 0
+    assert {item["reason"] for item in tiling["missing"]} == {"timed_out"}
+
+
+def test_request_deadline_bounds_queued_tiles():
+    start = time.perf_counter()
+    merged = run(TileBackend(delay=0.3), settings(timeout_seconds=1.0, concurrency=1, deadline_seconds=0.5))
+    assert time.perf_counter() - start < 1.0
+    tiling = merged.metadata.extra["tiling"]
+    assert tiling["analyzed"] >= 1
+    assert tiling["timed_out"] == len(tiling["missing"]) > 0
+    assert tiling["analyzed"] + tiling["timed_out"] == tiling["grid"][0] * tiling["grid"][1]
+    assert merged.description == "overview"
+
+
+def test_fallback_tiles_are_reported():
+    merged = run(TileBackend(tile_behaviour="empty"), settings(), fallback=True)
+    tiling = merged.metadata.extra["tiling"]
+    assert tiling["fallback"] == len(tiling["missing"]) > 0
+    assert not tiling["complete"]
+
+
+def test_overloaded_tiles_are_reported_with_retry_hint():
+    merged = run(TileBackend(tile_behaviour="overloaded"), settings(), fallback=True)
+    tiling = merged.metadata.extra["tiling"]
+    assert tiling["overloaded"] == len(tiling["missing"]) > 0
+    assert tiling["retry_after_s"] == 1.5
+    assert merged.description == "overview"
+
+
+def test_everything_overloaded_raises_overloaded():
+    with pytest.raises(OverloadedError):
+        run(TileBackend(tile_behaviour="overloaded", overview_overloaded=True), settings(), fallback=True)
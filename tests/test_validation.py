@@ -0,0 +1,96 @@
+import asyncio
+import socket
+
+import pytest
+
+from image_sage_mcp.validation import DNSResolver, URLValidator, is_private_address
+
+
+@pytest.mark.parametrize(
+    "address",
+    [
+        "127.0.0.1",
+        "10.1.2.3",
+        "100.64.0.1",
+        "169.254.169.254",
+        "172.31.255.255",
+        "192.168.1.1",
+        "0.0.0.0",
+        "255.255.255.255",
+        "::1",
+        "::",
+        "fd00::1",
+        "fe80::1",
+        "::ffff:127.0.0.1",
+        "2002:a9fe:a9fe::",
+        "2001:0:4136:e378:8000:63bf:3fff:fdd2",
+        "64:ff9b::a9fe:a9fe",
+        "not-an-ip",
+    ],
+)
+def test_private_and_tunnelled_addresses_are_blocked(address):
+    assert is_private_address(address)
+
+
+@pytest.mark.parametrize("address", ["93.184.216.34", "1.1.1.1", "2606:4700:4700::1111", "::ffff:8.8.8.8", "64:ff9b::808:808"])
+def test_public_addresses_are_allowed(address):
+    assert not is_private_address(address)
+
+
+def fake_getaddrinfo(answers, calls):
+    async def getaddrinfo(host, port, type=0):
+        calls.append(host)
+        return [(socket.AF_INET6 if ":" in a else socket.AF_INET, type, 6, "", (a, 0)) for a in answers[host]]
+
+    return getaddrinfo
+
+
+def test_resolver_rejects_a_host_with_any_private_address():
+    async def run() -> None:
+        calls = []
+        asyncio.get_running_loop().getaddrinfo = fake_getaddrinfo(
+            {"public.test": ["93.184.216.34", "93.184.216.34"], "rebind.test": ["93.184.216.34", "10.0.0.5"]}, calls
+        )
+        resolver = DNSResolver(ttl_seconds=60)
+        assert await resolver.resolve_safe("public.test") == ["93.184.216.34"]
+        assert await resolver.resolve_safe("PUBLIC.test") == ["93.184.216.34"]
+        assert calls == ["public.test"]
+        assert await resolver.resolve_safe("rebind.test") is None
+        assert resolver.cached("rebind.test") is None
+
+    asyncio.run(run())
+
+
+def test_resolver_checks_literals_without_dns():
+    async def run() -> None:
+        resolver = DNSResolver()
+        assert await resolver.resolve_safe("[::1]") is None
+        assert await resolver.resolve_safe("8.8.8.8") == ["8.8.8.8"]
+        assert await DNSResolver(allow_private=True).resolve_safe("127.0.0.1") == ["127.0.0.1"]
+
+    asyncio.run(run())
+
+
+def test_resolver_cache_is_bounded():
+    async def run() -> None:
+        calls = []
+        asyncio.get_running_loop().getaddrinfo = fake_getaddrinfo({f"h{i}.test": ["1.1.1.1"] for i in range(3)}, calls)
+        resolver = DNSResolver(max_entries=2)
+        for i in range(3):
+            await resolver.resolve_safe(f"h{i}.test")
+        assert resolver.cached("h0.test") is None
+        assert resolver.cached("h2.test") == ["1.1.1.1"]
+
+    asyncio.run(run())
+
+
+def test_validator_returns_the_addresses_to_pin():
+    async def run() -> None:
+        asyncio.get_running_loop().getaddrinfo = fake_getaddrinfo({"img.test": ["93.184.216.34"]}, [])
+        validator = URLValidator()
+        result = await validator.validate_url_async("https://img.test/a.png")
+        assert result.ok and result.addresses == ["93.184.216.34"]
+        assert not (await validator.validate_url_async("http://169.254.169.254/latest")).ok
+        assert not (await validator.validate_url_async("ftp://img.test/a.png")).ok
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import time
+from multiprocessing import shared_memory
+from typing import Tuple
+
+import pytest
+from PIL import Image, ImageDraw
+
+from image_sage_mcp import workers
+from image_sage_mcp.local import extract_features
+from image_sage_mcp.models import ImageData
+from image_sage_mcp.phash import compute_hashes
+from image_sage_mcp.tiling import TileSettings, split_tiles
+from image_sage_mcp.workers import ImageWorkerPool
+
+
+def image_data() -> ImageData:
+    image = Image.new("RGB", (640, 480), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 300, 260), fill="#3366cc")
+    draw.ellipse((320, 180, 600, 440), fill="#cc3333")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    data = out.getvalue()
+    return ImageData(data, "image/png", "PNG", len(data), image.width, image.height)
+
+
+# Run in the spawned worker, so they live at module level
+def describe_buffer(image: ImageData) -> Tuple[str, int, Tuple[int, int]]:
+    with image.open_image() as decoded:
+        size = decoded.size
+    return type(image.buffer).__name__, len(image.buffer), size
+
+
+def sleep_then_size(image: ImageData, seconds: float) -> int:
+    time.sleep(seconds)
+    return len(image.buffer)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ImageWorkerPool(mode="process", max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_process_mode_matches_inline_results(pool):
+    image = image_data()
+    tile_settings = TileSettings(tile_px=256, max_tiles=9)
+
+    async def run_all():
+        return (
+            await pool.run_image(compute_hashes, image),
+            await pool.run_image(extract_features, image),
+            await pool.run_image(split_tiles, image, tile_settings),
+        )
+
+    hashes, features, tiles = asyncio.run(run_all())
+    assert hashes == compute_hashes(image)
+    assert features == extract_features(image)
+    expected = split_tiles(image, tile_settings)
+    assert [(t.row, t.col, t.box, t.image and t.image.bytes_data) for t in tiles] == [(t.row, t.col, t.box, t.image and t.image.bytes_data) for t in expected]
+    assert any(t.image is not None for t in tiles)
+
+
+def test_worker_reads_shared_memory_without_copying(pool):
+    image = image_data()
+    kind, size, dimensions = asyncio.run(pool.run_image(describe_buffer, image))
+    assert kind == "memoryview"
+    assert size == image.file_size_bytes
+    assert dimensions == (640, 480)
+
+
+def test_block_outlives_a_cancelled_caller_until_the_worker_is_done(pool, monkeypatch):
+    image = image_data()
+    names = []
+    ship = workers._ship
+
+    def recording_ship(item):
+        ref, block = ship(item)
+        names.append(block.name)
+        return ref, block
+
+    monkeypatch.setattr(workers, "_ship", recording_ship)
+
+    async def cancel_midway():
+        task = asyncio.create_task(pool.run_image(sleep_then_size, image, 1.0))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The worker is still attached to the block, so it must not be unlinked yet
+        attached = shared_memory.SharedMemory(name=names[0])
+        attached.close()
+        await asyncio.sleep(2.0)
+
+    asyncio.run(cancel_midway())
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=names[0])
+    # The slot was given back and the pool still works
+    assert asyncio.run(pool.run_image(sleep_then_size, image, 0.0)) == image.file_size_bytes